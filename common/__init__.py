@@ -1,17 +1,38 @@
 from .config import (
+    CACHE_CONFIGS,
     CLUSTER_CONFIGS,
+    CRAWLER_CONFIGS,
     DATE_CONFIGS,
+    DEDUPE_CONFIGS,
+    JOB_CONFIGS,
     MODEL_CONFIG,
+    PIPELINE_CONFIGS,
+    PRICING_CONFIGS,
+    RATE_LIMIT_CONFIGS,
+    RETRY_CONFIGS,
     TEMPLATE_CONFIGS,
     THEME_CONFIGS,
 )
+from .async_gpt_helper import AsyncGPTHelper
 from .gpt_helper import GPTHelper
+from .llm_policy import LLMRequestError, load_json_answer
 
 __all__ = [
     "GPTHelper",
+    "AsyncGPTHelper",
+    "LLMRequestError",
+    "load_json_answer",
     "MODEL_CONFIG",
     "TEMPLATE_CONFIGS",
     "DATE_CONFIGS",
     "CLUSTER_CONFIGS",
     "THEME_CONFIGS",
+    "CACHE_CONFIGS",
+    "RATE_LIMIT_CONFIGS",
+    "JOB_CONFIGS",
+    "CRAWLER_CONFIGS",
+    "PIPELINE_CONFIGS",
+    "DEDUPE_CONFIGS",
+    "PRICING_CONFIGS",
+    "RETRY_CONFIGS",
 ]
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import os
+import weakref
+
+import numpy as np
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from .config import MODEL_CONFIG
+from .embedding_store import get_embedding_store, text_key
+from .gpt_helper import split_embedding_batches
+from .json_stream import JSONArrayItemParser
+from .llm_cache import build_cache_key, get_llm_cache
+from .llm_policy import LLMRequestError, get_llm_call_policy
+from .rate_limiter import estimate_tokens, get_llm_governor
+from .usage import track_llm_call
+from .utils.console import console
+from .utils.timing_logger import LOGGER
+
+load_dotenv()
+
+
+class AsyncGPTHelper:
+    """Asyncio counterpart of GPTHelper sharing its cache and rate limits"""
+
+    MODEL = MODEL_CONFIG["DEFAULT_MODEL"]
+    DEFAULT_TEMPERATURE = MODEL_CONFIG["DEFAULT_TEMPERATURE"]
+    EMBEDDING_MODEL = MODEL_CONFIG["EMBEDDING_MODEL"]
+    TOP_P = MODEL_CONFIG["TOP_P"]
+    EMBEDDING_BATCH_SIZE = MODEL_CONFIG["EMBEDDING_BATCH_SIZE"]
+    EMBEDDING_BATCH_MAX_TOKENS = MODEL_CONFIG["EMBEDDING_BATCH_MAX_TOKENS"]
+
+    def __init__(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.cache = get_llm_cache()
+        self.governor = get_llm_governor()
+        self.policy = get_llm_call_policy()
+        self.embedding_store = get_embedding_store()
+        # AsyncOpenAI pools connections per event loop, so keep one client per loop
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            # Retries are handled by the call policy, which also counts them
+            client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+            self._clients[loop] = client
+        return client
+
+    async def _complete(self, create, model, estimated_tokens, fallback=True, **kwargs):
+        """
+        Run a chat completion under the rate limits and the call policy.
+
+        Returns:
+            tuple: (completion, name of the model that answered)
+        """
+
+        async def attempt(attempt_model, timeout, is_retry):
+            async with self.governor.limit_async(estimated_tokens):
+                with track_llm_call(attempt_model) as call:
+                    call.retries = int(is_retry)
+                    completion = await create(
+                        model=attempt_model, timeout=timeout, **kwargs
+                    )
+                    call.usage = completion.usage
+            self.governor.record_usage(estimated_tokens, completion.usage)
+            return completion, attempt_model
+
+        return await self.policy.call_async(attempt, model, fallback=fallback)
+
+    async def parse_response_format(
+        self,
+        system_prompt,
+        user_prompt,
+        model=MODEL,
+        temperature=DEFAULT_TEMPERATURE,
+        response_format=None,
+        top_p=TOP_P,
+        fallback=True,
+    ):
+        """
+        Uncached GPT request with response format.
+
+        Returns:
+            tuple: (content, name of the model that answered)
+
+        Raises:
+            Exception: The last error once the call policy gives up
+        """
+        completion, answered_by = await self._complete(
+            self.client.beta.chat.completions.parse,
+            model,
+            estimate_tokens(system_prompt, user_prompt),
+            fallback=fallback,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=temperature,
+            response_format=response_format,
+            top_p=top_p,
+        )
+        return completion.choices[0].message.content, answered_by
+
+    async def ask_gpt_with_response_format(
+        self,
+        system_prompt,
+        user_prompt,
+        model=MODEL,
+        temperature=DEFAULT_TEMPERATURE,
+        response_format=None,
+        top_p=TOP_P,
+    ):
+        """GPT request with response format, returns content"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = build_cache_key(
+                system_prompt, user_prompt, model, temperature, top_p, response_format
+            )
+            cached_content = self.cache.get(cache_key)
+            if cached_content is not None:
+                return cached_content
+
+        try:
+            response_content, answered_by = await self.parse_response_format(
+                system_prompt,
+                user_prompt,
+                model=model,
+                temperature=temperature,
+                response_format=response_format,
+                top_p=top_p,
+            )
+            # Fallback answers are not stored under the primary model's key
+            if (
+                cache_key is not None
+                and response_content is not None
+                and answered_by == model
+            ):
+                self.cache.set(cache_key, response_content, system_prompt, model)
+            return response_content
+        except Exception as e:
+            console.print(f"Error from GPT: {e}")
+            LOGGER.error(f"Error from GPT: {e}")
+            return None
+
+    async def stream_response_format_items(
+        self,
+        system_prompt,
+        user_prompt,
+        array_key,
+        model=MODEL,
+        temperature=DEFAULT_TEMPERATURE,
+        response_format=None,
+        top_p=TOP_P,
+    ):
+        """
+        Structured GPT request that yields each element of the response's
+        array_key list as soon as the model has generated it.
+
+        Answers are cached like ask_gpt_with_response_format ones. A stream
+        that fails is retried without streaming under the call policy, and the
+        items already yielded are skipped in the retried answer. The stream is
+        read by a separate task, so the governor slot is released as soon as
+        the response is complete, however slowly the items are consumed.
+
+        Raises:
+            LLMRequestError: The retry failed too, so the answer would be
+                incomplete
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = build_cache_key(
+                system_prompt, user_prompt, model, temperature, top_p, response_format
+            )
+            cached_content = self.cache.get(cache_key)
+            if cached_content is not None:
+                for item in json.loads(cached_content).get(array_key, []):
+                    yield item
+                return
+
+        estimated_tokens = estimate_tokens(system_prompt, user_prompt)
+        parser = JSONArrayItemParser(array_key)
+        items = asyncio.Queue()
+        finished = object()
+
+        async def read_stream():
+            async with self.governor.limit_async(estimated_tokens):
+                with track_llm_call(model) as call:
+                    async with self.client.beta.chat.completions.stream(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt},
+                        ],
+                        temperature=temperature,
+                        response_format=response_format,
+                        top_p=top_p,
+                        stream_options={"include_usage": True},
+                        timeout=self.policy.timeout(),
+                    ) as stream:
+                        async for event in stream:
+                            if event.type != "content.delta":
+                                continue
+                            for item in parser.feed(event.delta):
+                                items.put_nowait(item)
+                        completion = await stream.get_final_completion()
+                    call.usage = completion.usage
+            self.governor.record_usage(estimated_tokens, completion.usage)
+            return completion
+
+        reader = asyncio.create_task(read_stream())
+        reader.add_done_callback(lambda _: items.put_nowait(finished))
+        yielded = 0
+        try:
+            while (item := await items.get()) is not finished:
+                yielded += 1
+                yield item
+            completion = reader.result()
+        except Exception as e:
+            LOGGER.error(f"Error from GPT stream after {yielded} items: {e}")
+            response_content = await self.ask_gpt_with_response_format(
+                system_prompt, user_prompt, model, temperature, response_format, top_p
+            )
+            if response_content is None:
+                raise LLMRequestError(
+                    f"Streamed request failed after {yielded} items"
+                ) from e
+            for item in json.loads(response_content).get(array_key, [])[yielded:]:
+                yield item
+            return
+        finally:
+            # Stops the request if the consumer gave up early
+            reader.cancel()
+
+        response_content = completion.choices[0].message.content
+        if cache_key is not None and response_content is not None:
+            self.cache.set(cache_key, response_content, system_prompt, model)
+
+    async def _embed(self, texts, model, estimated_tokens):
+        """Embedding request under the rate limits; retried, never another model"""
+
+        async def attempt(attempt_model, timeout, is_retry):
+            async with self.governor.limit_async(estimated_tokens):
+                with track_llm_call(attempt_model) as call:
+                    call.retries = int(is_retry)
+                    response = await self.client.embeddings.create(
+                        model=attempt_model, input=texts, timeout=timeout
+                    )
+                    call.usage = response.usage
+            return response
+
+        return await self.policy.call_async(attempt, model, fallback=False)
+
+    async def get_embeddings(self, query, model=EMBEDDING_MODEL):
+        return (await self.get_embeddings_batch([query], model))[0].tolist()
+
+    async def get_embeddings_batch(self, texts, model=EMBEDDING_MODEL):
+        """
+        Asyncio variant of GPTHelper.get_embeddings_batch, reading and filling
+        the same embedding store.
+
+        Returns:
+            numpy.ndarray: float32 matrix with one row per text, in input order
+        """
+        # The embeddings endpoint rejects empty strings
+        texts = [text if text and text.strip() else " " for text in texts]
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [text_key(text) for text in texts]
+        vectors = {}
+        if self.embedding_store is not None:
+            vectors = self.embedding_store.lookup(model, list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing[key] = text
+
+        if missing:
+            missing_keys = list(missing)
+            batches = split_embedding_batches(
+                [missing[key] for key in missing_keys],
+                self.EMBEDDING_BATCH_SIZE,
+                self.EMBEDDING_BATCH_MAX_TOKENS,
+            )
+            responses = await asyncio.gather(
+                *(
+                    self._embed(batch, model, batch_tokens)
+                    for batch, batch_tokens in batches
+                )
+            )
+            # Results carry their input index; do not rely on response order
+            embedded = np.asarray(
+                [
+                    item.embedding
+                    for response in responses
+                    for item in sorted(response.data, key=lambda item: item.index)
+                ],
+                dtype=np.float32,
+            )
+            vectors.update(zip(missing_keys, embedded))
+            if self.embedding_store is not None:
+                self.embedding_store.append(model, missing_keys, embedded)
+
+        LOGGER.info(
+            f"Embeddings: {len(texts)} requested, {len(missing)} sent to the API"
+        )
+        return np.stack([vectors[key] for key in keys]).astype(np.float32)
@@ -1,3 +1,5 @@
+import os
+
 from prompts.prompt_loader import load_prompt_from_file
 
 MODEL_CONFIG = {
@@ -5,20 +7,142 @@ MODEL_CONFIG = {
     "DEFAULT_TEMPERATURE": 0.7,
     "FALLBACK_MODEL": "gpt-4o-mini",
     "EMBEDDING_MODEL": "text-embedding-3-large",
+    "SPACY_MODEL": "en_core_web_trf",
+    "EMBEDDING_BATCH_SIZE": 2048,
+    "EMBEDDING_BATCH_MAX_TOKENS": 250000,
     "MAX_INPUT_TOKENS": 128000,
     "MAX_OUTPUT_TOKENS": 16400,
     "TOKEN_SAFETY_MARGIN": 10000,
     "TOP_P": 0.1,
 }
 
+# Used for the cost estimates in usage.json and /metrics; prefixes match
+# dated model snapshots, the longest prefix wins
+PRICING_CONFIGS = {
+    "USD_PER_MILLION_TOKENS": {
+        "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+        "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+        "text-embedding-3-large": {"input": 0.13},
+        "text-embedding-3-small": {"input": 0.02},
+    },
+}
+
 TEMPLATE_CONFIGS = {"TEMPLATE_PATH": "templates/FactSheetD3.html"}
 
-CLUSTER_CONFIGS = {"MAX_CLUSTER_SIZE": 11}
+CLUSTER_CONFIGS = {
+    "MAX_CLUSTER_SIZE": 11,
+    # Parallel GMM fits in the k sweep, -1 uses every core
+    "GMM_N_JOBS": -1,
+    # Smaller fact sets fit in-process, as starting workers costs more than the fits
+    "GMM_PARALLEL_MIN_SIZE": 64,
+    # Fact sets at least this large use a cheaper covariance, selected by BIC
+    "GMM_LARGE_SET_SIZE": 2000,
+    "GMM_LARGE_SET_COVARIANCE": "diag",
+    # Fact sets smaller than this are reduced with PCA instead of UMAP
+    "UMAP_MIN_SIZE": 64,
+    # None lets UMAP use every core, at the cost of run-to-run reproducibility
+    "UMAP_RANDOM_STATE": 42,
+    # Used for every story when present; fit it on the stored embeddings with
+    # python -m stages.FactOrganization.dimension_reduction
+    "UMAP_REFERENCE_PATH": ".cache/umap_reference.joblib",
+}
 
 DATE_CONFIGS = {"DATE_FORMAT": "%Y-%m-%d"}
 
 THEME_CONFIGS = {"COLORS": ["#22d3ee", "#2dd4bf", "#f87171", "#facc15"]}
 
+CACHE_CONFIGS = {
+    "LLM_CACHE_ENABLED": True,
+    "LLM_CACHE_PATH": ".cache/llm_cache.sqlite3",
+    "LLM_CACHE_MAX_SIZE_MB": 512,
+    "LLM_CACHE_TTL_SECONDS": 7 * 24 * 60 * 60,
+    "PROMPTS_DIR": "prompts",
+    "EMBEDDING_STORE_ENABLED": True,
+    "EMBEDDING_STORE_DIR": ".cache/embeddings",
+    "PAGE_CACHE_ENABLED": True,
+    "PAGE_CACHE_PATH": ".cache/page_cache.sqlite3",
+    "PAGE_CACHE_DEFAULT_FRESHNESS_SECONDS": 24 * 60 * 60,
+    # Matched against the host and its parent domains
+    "PAGE_CACHE_DOMAIN_FRESHNESS_SECONDS": {
+        "pewresearch.org": 7 * 24 * 60 * 60,
+    },
+}
+
+RATE_LIMIT_CONFIGS = {
+    "MAX_CONCURRENT_REQUESTS": 16,
+    "REQUESTS_PER_MINUTE": 5000,
+    "TOKENS_PER_MINUTE": 800000,
+}
+
+PIPELINE_CONFIGS = {
+    # One budget shared by page fetches and articles in extraction
+    "MAX_ACTIVE_TASKS": 32,
+    # Crawled articles waiting for extraction before crawling pauses
+    "ARTICLE_QUEUE_SIZE": 16,
+    # Small fact extraction, validation and refining requests from different
+    # articles are packed into one request up to these limits
+    "PACKED_REQUESTS_ENABLED": True,
+    "PACKED_REQUEST_MAX_TOKENS": 4000,
+    "PACKED_REQUEST_MAX_ITEMS": 8,
+    # How long a partly filled pack waits for more items
+    "PACKED_REQUEST_FLUSH_SECONDS": 0.2,
+    # Process-wide worker threads shared by every run, see common/scheduler.py
+    "IO_WORKERS": 32,
+    "CPU_WORKERS": os.cpu_count() or 4,
+}
+
+RETRY_CONFIGS = {
+    "MAX_ATTEMPTS": 6,
+    "BACKOFF_INITIAL_SECONDS": 1,
+    "BACKOFF_MAX_SECONDS": 60,
+    # Later attempts use MODEL_CONFIG["FALLBACK_MODEL"]
+    "FALLBACK_AFTER_ATTEMPTS": 3,
+    "TIMEOUT_SECONDS": 120,
+    # Stages whose prompts or outputs are much larger than the rest
+    "STAGE_TIMEOUT_SECONDS": {
+        "merging": 300,
+        "story_organization": 300,
+        "analysis": 300,
+    },
+    # A request still running after this long is raced against a duplicate
+    "HEDGE_AFTER_SECONDS": 60,
+}
+
+JOB_CONFIGS = {
+    "JOB_DB_PATH": ".cache/jobs.sqlite3",
+    "MAX_WORKERS": 2,
+    "POLL_INTERVAL_SECONDS": 1.0,
+    "EVENT_POLL_INTERVAL_SECONDS": 0.5,
+    # Identical requests within this window share the earlier run's result
+    "RESULT_REUSE_SECONDS": 10 * 60,
+}
+
+CRAWLER_CONFIGS = {
+    "USER_AGENT": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    ),
+    "TIMEOUT_SECONDS": 20,
+    "MAX_CONNECTIONS": 20,
+    "MAX_CONNECTIONS_PER_HOST": 4,
+    "MAX_PAGE_BYTES": 5 * 1024 * 1024,
+    "MAX_CONCURRENT_QUERIES": 10,
+    "HTTP2": True,
+    # Drop navigation, headers, footers and sidebars before collecting text
+    "REMOVE_BOILERPLATE": False,
+}
+
+DEDUPE_CONFIGS = {
+    # Drop articles whose paragraphs nearly match an article already stored
+    "NEAR_DUPLICATE_ENABLED": True,
+    "SHINGLE_SIZE": 5,
+    "MINHASH_PERMUTATIONS": 128,
+    # 16 bands of 8 rows: pairs near the threshold are almost always compared
+    "LSH_BANDS": 16,
+    # Estimated Jaccard similarity of word shingles
+    "SIMILARITY_THRESHOLD": 0.8,
+}
+
 PROMPTS = {
     "GENERATE_SEARCH_QUERIES": load_prompt_from_file(
         "prompts/1_generate_search_queries.txt"
@@ -65,4 +189,5 @@ PROMPTS = {
     "IDENTIFY_ENTITIES_IN__MERGED_FACTS": load_prompt_from_file(
         "prompts/identify_entities_in_merged_facts.txt"
     ),
+    "PACKED_REQUESTS": load_prompt_from_file("prompts/packed_requests.txt"),
 }
@@ -0,0 +1,217 @@
+import fcntl
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+from .config import CACHE_CONFIGS
+from .utils.timing_logger import LOGGER
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Append-only embedding store shared across stories and processes.
+
+    Vectors live in one raw float32 file per model that is read through a
+    memory map; a small SQLite index maps (model, sha256(text)) to a row.
+    Appends are serialized with a thread lock plus an fcntl lock on the
+    model's data file, so concurrent writers never interleave rows.
+    """
+
+    def __init__(self, directory=CACHE_CONFIGS["EMBEDDING_STORE_DIR"]):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+        # Workers forked by gunicorn --preload must not share this connection
+        os.register_at_fork(after_in_child=self._reconnect)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (model, key)
+            );
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+        self.indexes = {}  # model: {key: row}
+        self.matrices = {}  # model: np.memmap
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite3"),
+            check_same_thread=False,
+            timeout=30,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _reconnect(self):
+        # The parent's connection is kept, not closed: closing it in the child
+        # could interfere with the parent's locks on the database
+        self.parent_conn = self.conn
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def _data_path(self, model):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        return os.path.join(self.directory, f"{safe_name}.f32")
+
+    def _dim(self, model):
+        row = self.conn.execute(
+            "SELECT dim FROM models WHERE model = ?", (model,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _load_index(self, model):
+        index = self.indexes.get(model)
+        if index is None:
+            index = dict(
+                self.conn.execute(
+                    "SELECT key, row FROM embeddings WHERE model = ?", (model,)
+                )
+            )
+            self.indexes[model] = index
+        return index
+
+    def _sync_keys(self, model, keys):
+        """Pull index entries for keys that other writers may have added"""
+        index = self._load_index(model)
+        missing = [key for key in keys if key not in index]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            index.update(
+                self.conn.execute(
+                    f"SELECT key, row FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    (model, *chunk),
+                )
+            )
+        return index
+
+    def _matrix(self, model, min_rows):
+        """Return a memory map covering at least min_rows rows"""
+        matrix = self.matrices.get(model)
+        if matrix is not None and matrix.shape[0] >= min_rows:
+            return matrix
+
+        dim = self._dim(model)
+        rows = os.path.getsize(self._data_path(model)) // (dim * 4)
+        matrix = np.memmap(
+            self._data_path(model), dtype=np.float32, mode="r", shape=(rows, dim)
+        )
+        self.matrices[model] = matrix
+        return matrix
+
+    @contextmanager
+    def _file_lock(self, model):
+        with open(self._data_path(model) + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def lookup(self, model, keys):
+        """Return {key: vector} for the keys that are already stored"""
+        with self.lock:
+            index = self._sync_keys(model, keys)
+
+            rows = {key: index[key] for key in keys if key in index}
+            if not rows:
+                return {}
+
+            matrix = self._matrix(model, max(rows.values()) + 1)
+            return {key: np.array(matrix[row]) for key, row in rows.items()}
+
+    def vectors(self, model):
+        """Return every stored vector of the model, in the order it was added"""
+        with self.lock:
+            rows = [
+                row
+                for (row,) in self.conn.execute(
+                    "SELECT row FROM embeddings WHERE model = ? ORDER BY row",
+                    (model,),
+                )
+            ]
+            if not rows:
+                return np.empty((0, 0), dtype=np.float32)
+            return np.array(self._matrix(model, rows[-1] + 1)[rows])
+
+    def append(self, model, keys, vectors):
+        """Store vectors for keys that are not stored yet"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+
+        with self.lock, self._file_lock(model):
+            index = self._sync_keys(model, keys)
+            new_rows = [
+                (key, vector)
+                for key, vector in dict(zip(keys, vectors)).items()
+                if key not in index
+            ]
+            if not new_rows:
+                return
+
+            dim = self._dim(model)
+            if dim is None:
+                dim = vectors.shape[1]
+                self.conn.execute(
+                    "INSERT INTO models (model, dim) VALUES (?, ?)", (model, dim)
+                )
+
+            data_path = self._data_path(model)
+            size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+            start_row = size // (dim * 4)
+            if size != start_row * dim * 4:
+                # A writer crashed mid-row; drop the partial row so the rows
+                # appended now start where the index expects them
+                LOGGER.warning(f"Truncating partial row at the end of {data_path}")
+                os.truncate(data_path, start_row * dim * 4)
+            with open(data_path, "ab") as data_file:
+                data_file.write(
+                    np.stack([vector for _, vector in new_rows]).tobytes()
+                )
+                data_file.flush()
+                os.fsync(data_file.fileno())
+
+            entries = [
+                (model, key, start_row + offset)
+                for offset, (key, _) in enumerate(new_rows)
+            ]
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, key, row) VALUES (?, ?, ?)",
+                entries,
+            )
+            self.conn.commit()
+            index.update({key: row for _, key, row in entries})
+
+
+@lru_cache(maxsize=None)
+def get_embedding_store():
+    """Return the process-wide embedding store, or None when it is disabled"""
+    if not CACHE_CONFIGS["EMBEDDING_STORE_ENABLED"]:
+        return None
+    try:
+        return EmbeddingStore()
+    except (OSError, sqlite3.Error) as e:
+        LOGGER.error(f"Embedding store unavailable: {e}")
+        return None
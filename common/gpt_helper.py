@@ -1,15 +1,45 @@
 import os
 
+import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
 
 from .config import MODEL_CONFIG
+from .embedding_store import get_embedding_store, text_key
+from .llm_cache import build_cache_key, get_llm_cache
+from .llm_policy import check_abandoned, get_llm_call_policy
+from .rate_limiter import estimate_tokens, get_llm_governor
+from .usage import track_llm_call
 from .utils.console import console
 from .utils.timing_logger import LOGGER
 
 load_dotenv()
 
 
+def split_embedding_batches(texts, max_size, max_tokens):
+    """
+    Group texts into embedding requests of at most max_size texts and about
+    max_tokens tokens each.
+
+    Returns:
+        list[tuple[list[str], int]]: (texts, estimated tokens) per request
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for text in texts:
+        text_tokens = estimate_tokens(text)
+        if batch and (
+            len(batch) >= max_size or batch_tokens + text_tokens > max_tokens
+        ):
+            batches.append((batch, batch_tokens))
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += text_tokens
+    if batch:
+        batches.append((batch, batch_tokens))
+    return batches
+
+
 class GPTHelper:
     """Helper class for GPT API interactions"""
 
@@ -17,11 +47,56 @@ class GPTHelper:
     DEFAULT_TEMPERATURE = MODEL_CONFIG["DEFAULT_TEMPERATURE"]
     EMBEDDING_MODEL = MODEL_CONFIG["EMBEDDING_MODEL"]
     TOP_P = MODEL_CONFIG["TOP_P"]
+    EMBEDDING_BATCH_SIZE = MODEL_CONFIG["EMBEDDING_BATCH_SIZE"]
+    EMBEDDING_BATCH_MAX_TOKENS = MODEL_CONFIG["EMBEDDING_BATCH_MAX_TOKENS"]
 
     def __init__(self):
         """Initialize OpenAI client with API key"""
         # print(os.getenv("OPENAI_API_KEY"))
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Retries are handled by the call policy, which also counts them
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.cache = get_llm_cache()
+        self.governor = get_llm_governor()
+        self.policy = get_llm_call_policy()
+        self.embedding_store = get_embedding_store()
+
+    def _complete(self, create, model, estimated_tokens, **kwargs):
+        """
+        Run a chat completion under the rate limits and the call policy.
+
+        Returns:
+            tuple: (completion, name of the model that answered)
+        """
+
+        def attempt(attempt_model, timeout, is_retry):
+            with self.governor.limit(estimated_tokens):
+                # A hedged copy that lost while queued for the governor stops here
+                check_abandoned()
+                with track_llm_call(attempt_model) as call:
+                    call.retries = int(is_retry)
+                    completion = create(model=attempt_model, timeout=timeout, **kwargs)
+                    call.usage = completion.usage
+            self.governor.record_usage(estimated_tokens, completion.usage)
+            return completion, attempt_model
+
+        return self.policy.call(attempt, model)
+
+    def _embed(self, texts, model, estimated_tokens):
+        """Embedding request under the rate limits; retried, never another model"""
+
+        def attempt(attempt_model, timeout, is_retry):
+            with self.governor.limit(estimated_tokens):
+                # A hedged copy that lost while queued for the governor stops here
+                check_abandoned()
+                with track_llm_call(attempt_model) as call:
+                    call.retries = int(is_retry)
+                    response = self.client.embeddings.create(
+                        model=attempt_model, input=texts, timeout=timeout
+                    )
+                    call.usage = response.usage
+            return response
+
+        return self.policy.call(attempt, model, fallback=False)
 
     def ask_gpt(
         self,
@@ -31,9 +106,12 @@ class GPTHelper:
         temperature=DEFAULT_TEMPERATURE,
     ):
         """Basic GPT request without response format"""
+        estimated_tokens = estimate_tokens(system_prompt, user_prompt)
         try:
-            completion = self.client.chat.completions.create(
-                model=model,
+            completion, _ = self._complete(
+                self.client.chat.completions.create,
+                model,
+                estimated_tokens,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
@@ -55,9 +133,21 @@ class GPTHelper:
         top_p=TOP_P,
     ):
         """GPT request with response format, returns content"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = build_cache_key(
+                system_prompt, user_prompt, model, temperature, top_p, response_format
+            )
+            cached_content = self.cache.get(cache_key)
+            if cached_content is not None:
+                return cached_content
+
+        estimated_tokens = estimate_tokens(system_prompt, user_prompt)
         try:
-            completion = self.client.beta.chat.completions.parse(
-                model=model,
+            completion, answered_by = self._complete(
+                self.client.beta.chat.completions.parse,
+                model,
+                estimated_tokens,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
@@ -67,6 +157,13 @@ class GPTHelper:
                 top_p=top_p,
             )
             response_content = completion.choices[0].message.content
+            # Fallback answers are not stored under the primary model's key
+            if (
+                cache_key is not None
+                and response_content is not None
+                and answered_by == model
+            ):
+                self.cache.set(cache_key, response_content, system_prompt, model)
             return response_content
         except Exception as e:
             console.print(f"Error from GPT: {e}")
@@ -82,9 +179,12 @@ class GPTHelper:
         response_format=None,
     ):
         """GPT request with response format, returns parsed response"""
+        estimated_tokens = estimate_tokens(system_prompt, user_prompt)
         try:
-            completion = self.client.beta.chat.completions.parse(
-                model=model,
+            completion, _ = self._complete(
+                self.client.beta.chat.completions.parse,
+                model,
+                estimated_tokens,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
@@ -98,10 +198,67 @@ class GPTHelper:
             return None
 
     def get_embeddings(self, query, model=EMBEDDING_MODEL):
-        query_embedding_response = self.client.embeddings.create(
-            model=model,
-            input=query,
-        )
+        if self.embedding_store is not None:
+            return self.get_embeddings_batch([query], model)[0].tolist()
+
+        query_embedding_response = self._embed(query, model, estimate_tokens(query))
         query_embedding = query_embedding_response.data[0].embedding
 
         return query_embedding
+
+    def get_embeddings_batch(self, texts, model=EMBEDDING_MODEL):
+        """
+        Embed many texts with as few requests as the API limits allow.
+
+        Texts already in the embedding store are served locally and only the
+        remaining unique texts are sent to the API.
+
+        Args:
+            texts (list[str]): Texts to embed
+            model (str): Embedding model name
+
+        Returns:
+            numpy.ndarray: float32 matrix with one row per text, in input order
+        """
+        # The embeddings endpoint rejects empty strings
+        texts = [text if text and text.strip() else " " for text in texts]
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [text_key(text) for text in texts]
+        vectors = {}
+        if self.embedding_store is not None:
+            vectors = self.embedding_store.lookup(model, list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing[key] = text
+
+        if missing:
+            missing_keys = list(missing)
+            embedded = self._request_embeddings(
+                [missing[key] for key in missing_keys], model
+            )
+            vectors.update(zip(missing_keys, embedded))
+            if self.embedding_store is not None:
+                self.embedding_store.append(model, missing_keys, embedded)
+
+        LOGGER.info(
+            f"Embeddings: {len(texts)} requested, {len(missing)} sent to the API"
+        )
+        return np.stack([vectors[key] for key in keys]).astype(np.float32)
+
+    def _request_embeddings(self, texts, model):
+        batches = split_embedding_batches(
+            texts, self.EMBEDDING_BATCH_SIZE, self.EMBEDDING_BATCH_MAX_TOKENS
+        )
+
+        rows = []
+        for batch, batch_tokens in batches:
+            response = self._embed(batch, model, batch_tokens)
+            # Results carry their input index; do not rely on response order
+            for item in sorted(response.data, key=lambda item: item.index):
+                rows.append(item.embedding)
+
+        return np.asarray(rows, dtype=np.float32)
@@ -0,0 +1,364 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .config import JOB_CONFIGS
+from .utils.timing_logger import LOGGER
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+
+def is_process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as boot_file:
+            return boot_file.read().strip()
+    except OSError:
+        return ""
+
+
+def get_process_start_time(pid):
+    """Start time of a process in clock ticks since boot, or "" if unknown"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            stat = stat_file.read()
+    except OSError:
+        return ""
+    # The command name may contain spaces; the fields resume after its ")"
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def get_instance_id(pid=None):
+    """
+    Identify a process across PID reuse: a restarted container often gives
+    the new process the PID of the old one, but never its boot and start time
+    """
+    pid = pid or os.getpid()
+    return f"{read_boot_id()}:{pid}:{get_process_start_time(pid)}"
+
+
+def is_instance_alive(instance_id, pid):
+    """Whether the process that claimed a job is still running"""
+    if not instance_id:
+        # Claimed before instance ids were stored; a job claimed under our own
+        # PID can only come from an earlier process that had the same PID
+        return pid != os.getpid() and is_process_alive(pid)
+    if instance_id == get_instance_id():
+        return True
+    boot_id, pid, start_time = instance_id.rsplit(":", 2)
+    pid = int(pid)
+    if boot_id != read_boot_id() or pid == os.getpid() or not is_process_alive(pid):
+        return False
+    return not start_time or get_process_start_time(pid) == start_time
+
+
+class JobQueue:
+    """
+    SQLite backed job queue drained by a bounded pool of worker threads.
+
+    Jobs and their progress events are stored on disk, so they can be polled
+    from any process and survive a restart: jobs left running by a process
+    that no longer exists are put back in the queue by recover().
+
+    Args:
+        handler (callable): Called as handler(params, emit) for every job, where
+            emit(message) records a progress event; returns the job result
+        path (str): SQLite database path
+        max_workers (int): Number of jobs run at the same time by this process
+    """
+
+    def __init__(
+        self,
+        handler,
+        path=JOB_CONFIGS["JOB_DB_PATH"],
+        max_workers=JOB_CONFIGS["MAX_WORKERS"],
+        poll_interval=JOB_CONFIGS["POLL_INTERVAL_SECONDS"],
+    ):
+        self.handler = handler
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.stopping = threading.Event()
+        self.workers = []
+
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = self._connect()
+        # Workers forked by gunicorn --preload must not share this connection
+        os.register_at_fork(after_in_child=self._reconnect)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                dedupe_key TEXT,
+                worker_pid INTEGER,
+                worker_instance TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE TABLE IF NOT EXISTS job_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, seq);
+            """
+        )
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "dedupe_key" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN dedupe_key TEXT")
+        if "worker_instance" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN worker_instance TEXT")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status)"
+        )
+
+    def _connect(self):
+        # Autocommit mode; claim() manages its own transaction
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _reconnect(self):
+        # The parent's connection is kept, not closed: closing it in the child
+        # could interfere with the parent's locks on the database
+        self.parent_conn = self.conn
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def _find_duplicate(self, dedupe_key, reuse_window):
+        row = self.conn.execute(
+            "SELECT id FROM jobs WHERE dedupe_key = ? AND ("
+            "status IN (?, ?) OR (status = ? AND finished_at >= ?)"
+            ") ORDER BY created_at DESC LIMIT 1",
+            (dedupe_key, QUEUED, RUNNING, SUCCEEDED, time.time() - reuse_window),
+        ).fetchone()
+        return row["id"] if row else None
+
+    def find_duplicate(self, dedupe_key, reuse_window=0):
+        """
+        Return the id of an in-flight job with the same key, or of one that
+        succeeded within the last reuse_window seconds
+        """
+        with self.lock:
+            return self._find_duplicate(dedupe_key, reuse_window)
+
+    def enqueue(self, params, dedupe_key=None, reuse_window=0):
+        """
+        Store a new job, unless find_duplicate() matches dedupe_key.
+
+        Returns:
+            tuple: (job_id, created); created is False when an existing job
+                was returned instead
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            # One write transaction, so concurrent duplicates cannot both insert
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing_id = None
+                if dedupe_key is not None:
+                    existing_id = self._find_duplicate(dedupe_key, reuse_window)
+                if existing_id is None:
+                    self.conn.execute(
+                        "INSERT INTO jobs (id, status, params, dedupe_key, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (job_id, QUEUED, json.dumps(params), dedupe_key, time.time()),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        if existing_id is not None:
+            return existing_id, False
+
+        self.add_event(job_id, "Queued")
+        with self.wakeup:
+            self.wakeup.notify()
+        return job_id, True
+
+    def get(self, job_id, include_result=True):
+        """Return the job as a dict, or None if it does not exist"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            "id": row["id"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if include_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+    def add_event(self, job_id, message):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO job_events (job_id, message, created_at) VALUES (?, ?, ?)",
+                (job_id, message, time.time()),
+            )
+
+    def get_events(self, job_id, after_seq=0):
+        """Return [(seq, message)] recorded for the job after after_seq"""
+        with self.lock:
+            return [
+                (row["seq"], row["message"])
+                for row in self.conn.execute(
+                    "SELECT seq, message FROM job_events "
+                    "WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job_id, after_seq),
+                )
+            ]
+
+    def recover(self):
+        """Requeue jobs whose worker process died before finishing them"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, worker_pid, worker_instance FROM jobs WHERE status = ?",
+                (RUNNING,),
+            ).fetchall()
+            orphaned = [
+                row["id"]
+                for row in rows
+                if not is_instance_alive(row["worker_instance"], row["worker_pid"])
+            ]
+            for job_id in orphaned:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, worker_pid = NULL, "
+                    "worker_instance = NULL WHERE id = ?",
+                    (QUEUED, job_id),
+                )
+        for job_id in orphaned:
+            self.add_event(job_id, "Requeued after restart")
+        if orphaned:
+            LOGGER.info(f"Recovered {len(orphaned)} interrupted jobs")
+        return orphaned
+
+    def claim(self):
+        """Atomically move the oldest queued job to running and return it"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = ?, worker_pid = ?, "
+                        "worker_instance = ?, started_at = ? WHERE id = ?",
+                        (
+                            RUNNING,
+                            os.getpid(),
+                            get_instance_id(),
+                            time.time(),
+                            row["id"],
+                        ),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"], include_result=False) if row else None
+
+    def finish(self, job_id, result=None, error=None):
+        status = FAILED if error else SUCCEEDED
+        # Record the event first so a finished job never has events still to come
+        self.add_event(job_id, "Failed" if error else "Finished")
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def run_job(self, job):
+        job_id = job["id"]
+        try:
+            result = self.handler(
+                job["params"], lambda message: self.add_event(job_id, message)
+            )
+            if result is None:
+                self.finish(job_id, error="Job returned no result")
+            else:
+                self.finish(job_id, result=result)
+        except Exception as e:
+            LOGGER.error(f"Job {job_id} failed: {e}")
+            self.finish(job_id, error=str(e))
+
+    def worker_loop(self):
+        while not self.stopping.is_set():
+            try:
+                job = self.claim()
+            except sqlite3.Error as e:
+                LOGGER.error(f"Job queue unavailable: {e}")
+                job = None
+
+            if job is None:
+                # Also poll, so jobs queued by other processes are picked up
+                with self.wakeup:
+                    self.wakeup.wait(self.poll_interval)
+                continue
+            self.run_job(job)
+
+    def start(self):
+        """Requeue interrupted jobs and start the worker threads"""
+        self.recover()
+        self.stopping.clear()
+        for index in range(self.max_workers):
+            worker = threading.Thread(
+                target=self.worker_loop, name=f"job-worker-{index}", daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """Stop taking new jobs; running jobs are recovered on the next start"""
+        self.stopping.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+        self.workers = []
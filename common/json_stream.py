@@ -0,0 +1,85 @@
+import json
+
+
+class JSONArrayItemParser:
+    """
+    Incremental parser for a streamed JSON object.
+
+    Text is fed as it arrives; every object or array element of the list
+    stored under array_key in the top-level object is returned as soon as its
+    closing bracket is seen, while the rest of the document is still being
+    generated. Scalar elements are ignored.
+    """
+
+    def __init__(self, array_key):
+        self.array_key = array_key
+        self.buffer = []
+        self.position = 0
+        # Open containers, "{" or "["
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        # Last string seen directly inside the top-level object, and whether
+        # the next value belongs to it
+        self.top_level_key = None
+        self.in_target_array = False
+        self.item_start = None
+
+    def feed(self, text):
+        """Add a chunk of the document and return the elements it completed"""
+        items = []
+        start = self.position
+        self.buffer.append(text)
+        for offset, char in enumerate(text):
+            index = start + offset
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1 and self.string_start is not None:
+                        self.top_level_key = self._slice(self.string_start, index + 1)
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = index if len(self.stack) == 1 else None
+            elif char in "{[":
+                if (
+                    char == "["
+                    and len(self.stack) == 1
+                    and self.top_level_key is not None
+                    and json.loads(self.top_level_key) == self.array_key
+                ):
+                    self.in_target_array = True
+                elif self.in_target_array and len(self.stack) == 2:
+                    self.item_start = index
+                self.stack.append(char)
+            elif char in "}]":
+                self.stack.pop()
+                depth = len(self.stack)
+                if self.in_target_array and depth == 2 and self.item_start is not None:
+                    items.append(json.loads(self._slice(self.item_start, index + 1)))
+                    self.item_start = None
+                elif self.in_target_array and depth == 1:
+                    self.in_target_array = False
+                if depth == 1:
+                    self.top_level_key = None
+            elif char == "," and len(self.stack) == 1:
+                self.top_level_key = None
+
+        self.position += len(text)
+        return items
+
+    def _slice(self, start, end):
+        # Join lazily: most chunks are a few characters long
+        if len(self.buffer) > 1:
+            self.buffer = ["".join(self.buffer)]
+        return self.buffer[0][start:end]
+
+    @property
+    def text(self):
+        return "".join(self.buffer)
@@ -0,0 +1,208 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from .config import CACHE_CONFIGS
+from .utils.timing_logger import LOGGER
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def describe_response_format(response_format):
+    """Return a stable description of a response format for cache keys"""
+    if response_format is None:
+        return None
+    if hasattr(response_format, "model_json_schema"):
+        return {
+            "name": response_format.__name__,
+            "schema": response_format.model_json_schema(),
+        }
+    return repr(response_format)
+
+
+def build_cache_key(system_prompt, user_prompt, model, temperature, top_p, response_format):
+    payload = json.dumps(
+        {
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "model": model,
+            "temperature": temperature,
+            "top_p": top_p,
+            "response_format": describe_response_format(response_format),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hash_text(payload)
+
+
+class LLMCache:
+    """SQLite backed, content-addressed cache for LLM responses"""
+
+    def __init__(
+        self,
+        path=CACHE_CONFIGS["LLM_CACHE_PATH"],
+        max_size_mb=CACHE_CONFIGS["LLM_CACHE_MAX_SIZE_MB"],
+        ttl_seconds=CACHE_CONFIGS["LLM_CACHE_TTL_SECONDS"],
+        prompts_dir=CACHE_CONFIGS["PROMPTS_DIR"],
+    ):
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = self._connect()
+        # Workers forked by gunicorn --preload must not share this connection
+        os.register_at_fork(after_in_child=self._reconnect)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt_hash TEXT NOT NULL,
+                model TEXT,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_accessed
+                ON responses (accessed_at);
+            CREATE INDEX IF NOT EXISTS idx_responses_prompt
+                ON responses (prompt_hash);
+            CREATE TABLE IF NOT EXISTS prompt_files (
+                path TEXT PRIMARY KEY,
+                sha TEXT NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+        if prompts_dir:
+            self.sync_prompt_files(prompts_dir)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reconnect(self):
+        # The parent's connection is kept, not closed: closing it in the child
+        # could interfere with the parent's locks on the database
+        self.parent_conn = self.conn
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def get(self, key):
+        """Return the cached content for key, or None on a miss or expiry"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            content, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+
+            self.conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            return content
+
+    def set(self, key, content, system_prompt, model=None):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (key, prompt_hash, model, content, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, hash_text(system_prompt), model, content, size, now, now),
+            )
+            self.conn.commit()
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its size budget"""
+        (total_size,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+
+        target = self.max_size_bytes * 0.9
+        rows = self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total_size <= target:
+                break
+            stale_keys.append((key,))
+            total_size -= size
+
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self.conn.commit()
+        LOGGER.info(f"LLM cache evicted {len(stale_keys)} entries")
+
+    def sync_prompt_files(self, prompts_dir):
+        """
+        Invalidate cached responses for prompt files that changed on disk.
+
+        Stage prompts are loaded verbatim from the files under prompts_dir, so the
+        hash of a file's previous content identifies every entry that used it.
+        """
+        with self.lock:
+            stored = dict(self.conn.execute("SELECT path, sha FROM prompt_files"))
+            for file_path in glob.glob(os.path.join(prompts_dir, "*.txt")):
+                with open(file_path, "r", encoding="utf-8") as file:
+                    sha = hash_text(file.read())
+
+                old_sha = stored.get(file_path)
+                if old_sha == sha:
+                    continue
+                if old_sha is not None:
+                    deleted = self.conn.execute(
+                        "DELETE FROM responses WHERE prompt_hash = ?", (old_sha,)
+                    ).rowcount
+                    LOGGER.info(
+                        f"LLM cache invalidated {deleted} entries for {file_path}"
+                    )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO prompt_files (path, sha) VALUES (?, ?)",
+                    (file_path, sha),
+                )
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache():
+    """Return the process-wide LLM cache, or None when caching is disabled"""
+    if not CACHE_CONFIGS["LLM_CACHE_ENABLED"]:
+        return None
+    try:
+        return LLMCache()
+    except sqlite3.Error as e:
+        LOGGER.error(f"LLM cache unavailable: {e}")
+        return None
@@ -0,0 +1,305 @@
+import asyncio
+import contextvars
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import lru_cache
+
+import openai
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from .config import MODEL_CONFIG, RETRY_CONFIGS
+from .scheduler import get_work_scheduler
+from .usage import current_stage
+from .utils.timing_logger import LOGGER
+
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+)
+
+
+class LLMRequestError(RuntimeError):
+    """An LLM request failed after every attempt, so there is no answer to use"""
+
+
+def load_json_answer(content, task):
+    """
+    Decode a GPT helper's JSON answer; the helpers return None once every
+    attempt has failed
+
+    Raises:
+        LLMRequestError: There was no answer
+    """
+    if content is None:
+        raise LLMRequestError(f"{task} failed: the LLM request gave no answer")
+    return json.loads(content)
+
+
+class AttemptAbandoned(Exception):
+    """A hedged copy lost the race before sending its request"""
+
+
+# Set in each copy of a hedged request; the losing copy's event is set
+abandoned_attempt = contextvars.ContextVar("abandoned_attempt", default=None)
+
+
+def check_abandoned():
+    """Raise in a hedged copy that has already lost, so it sends nothing"""
+    abandoned = abandoned_attempt.get()
+    if abandoned is not None and abandoned.is_set():
+        raise AttemptAbandoned()
+
+
+def run_hedged_copy(abandoned, request, *args):
+    abandoned_attempt.set(abandoned)
+    check_abandoned()
+    return request(*args)
+
+
+def is_context_overflow(error):
+    """The prompt or the structured output did not fit the model"""
+    if isinstance(error, openai.LengthFinishReasonError):
+        return True
+    return (
+        isinstance(error, openai.BadRequestError)
+        and getattr(error, "code", None) == "context_length_exceeded"
+    )
+
+
+def is_transient(error):
+    if isinstance(error, openai.RateLimitError):
+        # An exhausted quota does not recover by waiting
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409, 429)
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def get_retry_after(error):
+    """Seconds the provider asked us to wait, if it said so"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class LLMCallPolicy:
+    """
+    Retries, timeouts, hedging and model fallback for LLM requests.
+
+    Transient failures (429, 5xx, timeouts, dropped connections) are retried
+    with jittered exponential backoff, or after Retry-After when the provider
+    sends it. After FALLBACK_AFTER_ATTEMPTS failed attempts, or as soon as a
+    request overflows the model's context, the remaining attempts use the
+    fallback model. Each attempt gets the current stage's timeout, and an
+    attempt still running after HEDGE_AFTER_SECONDS is raced against a
+    duplicate; the first answer wins.
+    """
+
+    def __init__(
+        self,
+        max_attempts=RETRY_CONFIGS["MAX_ATTEMPTS"],
+        backoff_initial=RETRY_CONFIGS["BACKOFF_INITIAL_SECONDS"],
+        backoff_max=RETRY_CONFIGS["BACKOFF_MAX_SECONDS"],
+        fallback_model=MODEL_CONFIG["FALLBACK_MODEL"],
+        fallback_after_attempts=RETRY_CONFIGS["FALLBACK_AFTER_ATTEMPTS"],
+        hedge_after=RETRY_CONFIGS["HEDGE_AFTER_SECONDS"],
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_max = backoff_max
+        self.backoff = wait_random_exponential(
+            multiplier=backoff_initial, max=backoff_max
+        )
+        self.fallback_model = fallback_model
+        self.fallback_after_attempts = fallback_after_attempts
+        self.hedge_after = hedge_after
+
+    def timeout(self):
+        return RETRY_CONFIGS["STAGE_TIMEOUT_SECONDS"].get(
+            current_stage.get(), RETRY_CONFIGS["TIMEOUT_SECONDS"]
+        )
+
+    def _wait(self, retry_state):
+        retry_after = get_retry_after(retry_state.outcome.exception())
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return self.backoff(retry_state)
+
+    def _retrying_kwargs(self, state):
+        def should_retry(error):
+            # Overflows are only retried when a fallback model can take over
+            return is_transient(error) or (
+                is_context_overflow(error) and state["fallback"]
+            )
+
+        return {
+            "stop": stop_after_attempt(self.max_attempts),
+            "wait": self._wait,
+            "retry": retry_if_exception(should_retry),
+            "reraise": True,
+        }
+
+    def _model_for(self, model, attempt_number, state):
+        if state["fallback"] and (
+            state["overflowed"] or attempt_number > self.fallback_after_attempts
+        ):
+            if model != self.fallback_model and not state["fell_back"]:
+                LOGGER.warning(
+                    f"Falling back from {model} to {self.fallback_model} "
+                    f"on attempt {attempt_number}"
+                )
+            state["fell_back"] = True
+            return self.fallback_model
+        return model
+
+    def _note_failure(self, error, model, attempt_number, state):
+        if is_context_overflow(error):
+            state["overflowed"] = True
+        LOGGER.warning(
+            f"LLM attempt {attempt_number} with {model} failed: "
+            f"{type(error).__name__}: {error}"
+        )
+
+    def call(self, request, model, fallback=True):
+        """
+        Run request(model, timeout, is_retry) until it succeeds.
+
+        Pass fallback=False when no other model may answer, e.g. embeddings;
+        context overflows are then raised without retrying.
+
+        Returns:
+            The request's result
+
+        Raises:
+            Exception: The last error once attempts are exhausted, or the first
+                error that is not worth retrying
+        """
+        state = {
+            "fallback": fallback and self.fallback_model is not None,
+            "overflowed": False,
+            "fell_back": False,
+        }
+        for attempt in Retrying(**self._retrying_kwargs(state)):
+            with attempt:
+                number = attempt.retry_state.attempt_number
+                attempt_model = self._model_for(model, number, state)
+                try:
+                    return self._hedged(request, attempt_model, number > 1)
+                except Exception as e:
+                    self._note_failure(e, attempt_model, number, state)
+                    raise
+
+    async def call_async(self, request, model, fallback=True):
+        """Asyncio variant of call; request is a coroutine function"""
+        state = {
+            "fallback": fallback and self.fallback_model is not None,
+            "overflowed": False,
+            "fell_back": False,
+        }
+        async for attempt in AsyncRetrying(**self._retrying_kwargs(state)):
+            with attempt:
+                number = attempt.retry_state.attempt_number
+                attempt_model = self._model_for(model, number, state)
+                try:
+                    return await self._hedged_async(
+                        request, attempt_model, number > 1
+                    )
+                except Exception as e:
+                    self._note_failure(e, attempt_model, number, state)
+                    raise
+
+    def _hedged(self, request, model, is_retry):
+        """
+        Race the request against a copy on the scheduler's io pool.
+
+        The copy that loses is cancelled if it has not started, and gives up
+        before sending if it is still waiting for the governor. A copy whose
+        request is already in flight cannot be interrupted; it finishes in the
+        background and its answer is dropped.
+        """
+        timeout = self.timeout()
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return request(model, timeout, is_retry)
+
+        scheduler = get_work_scheduler()
+        copies = {}
+
+        def start(copy_is_retry):
+            abandoned = threading.Event()
+            future = scheduler.submit(
+                run_hedged_copy, abandoned, request, model, timeout, copy_is_retry
+            )
+            copies[future] = abandoned
+
+        try:
+            start(is_retry)
+            # An io worker runs the request itself if no other worker is free
+            done, _ = scheduler.wait(copies, timeout=self.hedge_after)
+            if not done:
+                LOGGER.info(f"Hedging {model} request after {self.hedge_after}s")
+                start(True)
+
+            # The first copy has started, so waiting without helping cannot
+            # deadlock, and keeps this thread out of the slower copy
+            pending = set(copies)
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                succeeded = [
+                    future
+                    for future in done
+                    if not future.cancelled() and future.exception() is None
+                ]
+                if succeeded or not pending:
+                    return (succeeded or list(done))[0].result()
+        finally:
+            # Never wait for the slower copy
+            for future, abandoned in copies.items():
+                abandoned.set()
+                future.cancel()
+
+    async def _hedged_async(self, request, model, is_retry):
+        timeout = self.timeout()
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return await request(model, timeout, is_retry)
+
+        tasks = {asyncio.ensure_future(request(model, timeout, is_retry))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                LOGGER.info(f"Hedging {model} request after {self.hedge_after}s")
+                tasks.add(asyncio.ensure_future(request(model, timeout, True)))
+
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded or not pending:
+                    return (succeeded or list(done))[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+@lru_cache(maxsize=None)
+def get_llm_call_policy():
+    """Return the policy shared by every GPT helper in the process"""
+    return LLMCallPolicy()
@@ -0,0 +1,88 @@
+import bisect
+import threading
+from functools import lru_cache
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+# Counter name -> (Prometheus metric name, help text)
+COUNTER_METRICS = {
+    "requests": ("llm_requests_total", "LLM API calls"),
+    "errors": ("llm_errors_total", "LLM API calls that failed"),
+    "retries": ("llm_retries_total", "Retried LLM API attempts"),
+    "prompt_tokens": ("llm_prompt_tokens_total", "Prompt tokens sent"),
+    "cached_tokens": (
+        "llm_cached_prompt_tokens_total",
+        "Prompt tokens served from the provider's prompt cache",
+    ),
+    "completion_tokens": ("llm_completion_tokens_total", "Completion tokens received"),
+    "cost_usd": ("llm_cost_usd_total", "Estimated spend in USD"),
+}
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """
+    Process-wide LLM counters and latency histograms, labelled by stage and
+    model, rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS):
+        self.lock = threading.Lock()
+        self.latency_buckets = latency_buckets
+        # (stage, model) -> counter name -> value
+        self.counters = {}
+        # (stage, model) -> [bucket counts..., +Inf count], sum
+        self.latencies = {}
+
+    def observe(self, stage, model, values):
+        key = (stage, model)
+        with self.lock:
+            counters = self.counters.setdefault(key, dict.fromkeys(COUNTER_METRICS, 0))
+            for name in COUNTER_METRICS:
+                counters[name] += values.get(name, 0)
+
+            buckets, total = self.latencies.get(
+                key, ([0] * (len(self.latency_buckets) + 1), 0.0)
+            )
+            latency = values.get("latency_seconds", 0)
+            buckets[bisect.bisect_left(self.latency_buckets, latency)] += 1
+            self.latencies[key] = (buckets, total + latency)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format"""
+        with self.lock:
+            counters = {key: dict(value) for key, value in self.counters.items()}
+            latencies = {
+                key: (list(buckets), total)
+                for key, (buckets, total) in self.latencies.items()
+            }
+
+        lines = []
+        for name, (metric, help_text) in COUNTER_METRICS.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (stage, model), values in sorted(counters.items()):
+                labels = f'stage="{escape_label(stage)}",model="{escape_label(model)}"'
+                lines.append(f"{metric}{{{labels}}} {values[name]}")
+
+        metric = "llm_request_latency_seconds"
+        lines.append(f"# HELP {metric} LLM API call latency")
+        lines.append(f"# TYPE {metric} histogram")
+        for (stage, model), (buckets, total) in sorted(latencies.items()):
+            labels = f'stage="{escape_label(stage)}",model="{escape_label(model)}"'
+            cumulative = 0
+            for bound, count in zip(self.latency_buckets + ("+Inf",), buckets):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {total}")
+            lines.append(f"{metric}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def get_metrics_registry():
+    """Return the metrics registry shared by the whole process"""
+    return MetricsRegistry()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import time
+
+from .scheduler import get_work_scheduler
+from .usage import UsageTracker, current_stage, current_usage
+from .utils import write_to_json
+from .utils.timing_logger import LOGGER
+
+MANIFEST_FILE = "pipeline_manifest.json"
+USAGE_FILE = "usage.json"
+
+
+def hash_value(value):
+    """Stable content hash of a JSON-serialisable value"""
+    serialized = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Args:
+        name (str): Unique stage name, used as the manifest key
+        func (callable): Called with the declared inputs as keyword arguments and
+            returns a dict with one entry per declared output
+        inputs (list[str]): Names of parameters or earlier outputs the stage reads
+        outputs (dict): Output name -> JSON checkpoint file name
+        label (str): Human readable description used in status messages
+    """
+
+    def __init__(self, name, func, inputs, outputs, label=None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.label = label or name
+
+
+class PipelineRunner:
+    """
+    Run stages in order, checkpointing every output as JSON.
+
+    A stage is skipped when the manifest records a completed run with the same
+    input hash and all of its checkpoint files still exist; its outputs are then
+    loaded from disk. Otherwise outputs are passed to later stages in memory.
+    Re-running with the same checkpoint directory therefore resumes from the
+    first stage that never finished or whose inputs changed.
+
+    Token usage, latency and estimated cost of the LLM calls made by this run
+    are recorded per stage in the manifest and in usage.json.
+    """
+
+    def __init__(self, stages, checkpoint_dir, status=None):
+        self.stages = stages
+        self.checkpoint_dir = checkpoint_dir
+        self.status = status or LOGGER.info
+        self.manifest_path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.manifest, file, indent=4)
+        os.replace(temp_path, self.manifest_path)
+
+    def _input_hash(self, stage, hashes):
+        return hash_value(
+            {"stage": stage.name, "inputs": {key: hashes[key] for key in stage.inputs}}
+        )
+
+    def _is_complete(self, stage, input_hash):
+        entry = self.manifest.get(stage.name)
+        if not entry or entry.get("input_hash") != input_hash:
+            return False
+        return all(
+            os.path.exists(os.path.join(self.checkpoint_dir, file_name))
+            for file_name in stage.outputs.values()
+        )
+
+    def _load_outputs(self, stage):
+        outputs = {}
+        for key, file_name in stage.outputs.items():
+            with open(os.path.join(self.checkpoint_dir, file_name), "r") as file:
+                outputs[key] = json.load(file)
+        return outputs
+
+    def run(self, params):
+        """
+        Run the pipeline.
+
+        Args:
+            params (dict): Named parameters available to every stage
+
+        Returns:
+            dict: Parameters plus every stage output
+        """
+        context = dict(params)
+        hashes = {key: hash_value(value) for key, value in params.items()}
+        usage = UsageTracker()
+        usage_token = current_usage.set(usage)
+        try:
+            self._run_stages(context, hashes, usage)
+        finally:
+            current_usage.reset(usage_token)
+            write_to_json(usage.to_dict(), self.checkpoint_dir, USAGE_FILE)
+        return context
+
+    def _run_stages(self, context, hashes, usage):
+        for stage in self.stages:
+            input_hash = self._input_hash(stage, hashes)
+
+            if self._is_complete(stage, input_hash):
+                self.status(f"Skipped {stage.label} (checkpoint found)")
+                context.update(self._load_outputs(stage))
+                hashes.update(self.manifest[stage.name]["output_hashes"])
+                continue
+
+            self.status(f"Started {stage.label}")
+            start_time = time.time()
+            stage_token = current_stage.set(stage.name)
+            try:
+                outputs = stage.func(**{key: context[key] for key in stage.inputs})
+            finally:
+                current_stage.reset(stage_token)
+
+            output_hashes = {}
+            for key, file_name in stage.outputs.items():
+                write_to_json(outputs[key], self.checkpoint_dir, file_name)
+                output_hashes[key] = hash_value(outputs[key])
+
+            context.update(outputs)
+            hashes.update(output_hashes)
+            self.manifest[stage.name] = {
+                "input_hash": input_hash,
+                "output_hashes": output_hashes,
+                "elapsed_seconds": round(time.time() - start_time, 3),
+                "usage": usage.stage_totals(stage.name),
+            }
+            self._save_manifest()
+            write_to_json(usage.to_dict(), self.checkpoint_dir, USAGE_FILE)
+            self._log_usage(stage, usage.stage_totals(stage.name))
+            self._log_scheduler(stage)
+            self.status(f"Finished {stage.label}")
+
+    def _log_scheduler(self, stage):
+        pools = ", ".join(
+            f"{name} {values['active']} active on {values['workers']}/"
+            f"{values['max_workers']} workers, {values['queued']} queued "
+            f"(peak {values['peak_queued']})"
+            for name, values in get_work_scheduler().stats().items()
+        )
+        LOGGER.info(f"{stage.name}: scheduler {pools}")
+
+    def _log_usage(self, stage, totals):
+        if not totals.get("prompt_tokens"):
+            return
+        LOGGER.info(
+            f"{stage.name}: {totals['requests']} requests, "
+            f"{totals['prompt_tokens']} prompt tokens "
+            f"({totals['cached_tokens'] / totals['prompt_tokens']:.0%} cached), "
+            f"{totals['completion_tokens']} completion tokens, "
+            f"{totals['latency_seconds']}s in API calls, ${totals['cost_usd']:.4f}"
+        )
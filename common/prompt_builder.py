@@ -0,0 +1,32 @@
+import json
+
+
+def to_prompt_json(value):
+    """Canonical JSON for prompts: sorted keys and compact separators"""
+    return json.dumps(
+        value,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+
+
+def to_prompt_text(payload):
+    """Strings go into prompts as they are, everything else as canonical JSON"""
+    return payload if isinstance(payload, str) else to_prompt_json(payload)
+
+
+def build_user_prompt(*sections):
+    """
+    Join (delimiter, payload) sections into a user prompt.
+
+    Prompt prefixes are cached by the provider, so callers list sections from
+    the most to the least shared: a search query used by every request of a
+    run, or an article sent with each of its facts, goes before content that
+    is unique to the request.
+    """
+    return "\n\n".join(
+        f"{delimiter}\n{to_prompt_text(payload)}\n{delimiter}"
+        for delimiter, payload in sections
+    )
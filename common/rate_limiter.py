@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+
+from .config import RATE_LIMIT_CONFIGS
+
+
+def estimate_tokens(*texts):
+    """Cheap prompt size estimate used to reserve tokens before a request"""
+    return sum(len(text or "") for text in texts) // 4 + 1
+
+
+class SharedSemaphore:
+    """
+    Counting semaphore shared by threads and by coroutines on any event loop.
+
+    asyncio.Semaphore is bound to a single loop and threading.Semaphore blocks
+    the loop, so neither can govern sync and async callers at the same time.
+    Waiters are served in FIFO order regardless of how they wait.
+    """
+
+    def __init__(self, value):
+        self._value = value
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            event = threading.Event()
+            self._waiters.append((None, event))
+        # The permit is handed over directly by release()
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+                    raise
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop is None:
+                    waiter.set()
+                    return
+                if loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(self._grant, waiter)
+                return
+            self._value += 1
+
+    def _grant(self, future):
+        if future.done():
+            # The waiter was cancelled before the permit arrived, pass it on
+            self.release()
+        else:
+            future.set_result(True)
+
+
+class TokenBucket:
+    """Token bucket that lets callers go into debt and wait it off"""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second
+        )
+        self.updated_at = now
+
+    def reserve(self, amount):
+        """Take amount tokens and return how long the caller must wait"""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.refill_per_second
+
+    def adjust(self, delta):
+        """Correct a previous reservation once the real usage is known"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class LLMGovernor:
+    """Process-wide limit on concurrent LLM requests, requests/min and tokens/min"""
+
+    def __init__(
+        self,
+        max_concurrency=RATE_LIMIT_CONFIGS["MAX_CONCURRENT_REQUESTS"],
+        requests_per_minute=RATE_LIMIT_CONFIGS["REQUESTS_PER_MINUTE"],
+        tokens_per_minute=RATE_LIMIT_CONFIGS["TOKENS_PER_MINUTE"],
+    ):
+        self.semaphore = SharedSemaphore(max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def _reserve(self, estimated_tokens):
+        return max(
+            self.request_bucket.reserve(1),
+            self.token_bucket.reserve(estimated_tokens),
+        )
+
+    @contextmanager
+    def limit(self, estimated_tokens):
+        delay = self._reserve(estimated_tokens)
+        if delay:
+            time.sleep(delay)
+        self.semaphore.acquire()
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    @asynccontextmanager
+    async def limit_async(self, estimated_tokens):
+        delay = self._reserve(estimated_tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        await self.semaphore.acquire_async()
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    def record_usage(self, estimated_tokens, usage):
+        """Settle the token reservation against the usage the API reported"""
+        if usage is None or not getattr(usage, "total_tokens", None):
+            return
+        self.token_bucket.adjust(usage.total_tokens - estimated_tokens)
+
+
+@lru_cache(maxsize=None)
+def get_llm_governor():
+    """Return the limiter shared by every GPT helper in the process"""
+    return LLMGovernor()
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import weakref
+
+from .config import PIPELINE_CONFIGS, PROMPTS
+from .llm_cache import build_cache_key
+from .llm_policy import is_context_overflow
+from .utils.timing_logger import LOGGER
+from .utils.tokens import count_tokens
+
+
+class PendingPack:
+    def __init__(self):
+        self.items = []
+        self.tokens = 0
+
+
+class RequestPacker:
+    """
+    Packs small structured requests that share a system prompt into one.
+
+    Callers await submit() with the user prompt of one work item. Items from
+    any caller on the same event loop are collected for a short while, up to
+    a token and item budget, and sent as one request whose response lists a
+    result per item id; each caller gets back the JSON text of its own
+    result, as an unpacked request would return it. Items are cached under
+    their unpacked request's key, so only cache misses are packed. A pack
+    with one item, and any item missing from a packed response, is sent on
+    its own.
+    """
+
+    def __init__(
+        self,
+        gpt_helper,
+        system_prompt,
+        response_format,
+        packed_response_format,
+        temperature=None,
+        max_tokens=PIPELINE_CONFIGS["PACKED_REQUEST_MAX_TOKENS"],
+        max_items=PIPELINE_CONFIGS["PACKED_REQUEST_MAX_ITEMS"],
+        flush_seconds=PIPELINE_CONFIGS["PACKED_REQUEST_FLUSH_SECONDS"],
+        enabled=PIPELINE_CONFIGS["PACKED_REQUESTS_ENABLED"],
+    ):
+        self.gpt_helper = gpt_helper
+        self.system_prompt = system_prompt
+        self.packed_system_prompt = system_prompt + PROMPTS["PACKED_REQUESTS"]
+        self.response_format = response_format
+        self.packed_response_format = packed_response_format
+        self.options = {} if temperature is None else {"temperature": temperature}
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.flush_seconds = flush_seconds
+        self.enabled = enabled
+        # Packs are bound to the loop of their callers, one pending pack per loop
+        self._pending = weakref.WeakKeyDictionary()
+        self._tasks = set()
+
+    async def submit(self, user_prompt):
+        """Return the JSON result for one work item, or None on failure"""
+        if not self.enabled:
+            return await self._send_single(user_prompt)
+
+        loop = asyncio.get_running_loop()
+        tokens = count_tokens(user_prompt)
+        pack = self._pending.get(loop)
+        if pack is not None and (
+            pack.tokens + tokens > self.max_tokens
+            or len(pack.items) >= self.max_items
+        ):
+            self._flush(loop, pack)
+            pack = None
+        if pack is None:
+            pack = PendingPack()
+            self._pending[loop] = pack
+            loop.call_later(self.flush_seconds, self._flush, loop, pack)
+
+        future = loop.create_future()
+        pack.items.append((user_prompt, future))
+        pack.tokens += tokens
+        return await future
+
+    def _flush(self, loop, pack):
+        if self._pending.get(loop) is not pack:
+            return
+        del self._pending[loop]
+        task = loop.create_task(self._send(pack.items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _cache_key(self, user_prompt):
+        """Key of an item's unpacked request, so packed answers are reused"""
+        return build_cache_key(
+            self.system_prompt,
+            user_prompt,
+            self.gpt_helper.MODEL,
+            self.options.get("temperature", self.gpt_helper.DEFAULT_TEMPERATURE),
+            self.gpt_helper.TOP_P,
+            self.response_format,
+        )
+
+    def _cached_results(self, items):
+        """Return {item index: cached result JSON} for the items already answered"""
+        cache = self.gpt_helper.cache
+        if cache is None:
+            return {}
+        results = {}
+        for index, (prompt, _) in enumerate(items):
+            content = cache.get(self._cache_key(prompt))
+            if content is not None:
+                results[index] = content
+        return results
+
+    async def _send_single(self, user_prompt):
+        return await self.gpt_helper.ask_gpt_with_response_format(
+            self.system_prompt,
+            user_prompt,
+            response_format=self.response_format,
+            **self.options,
+        )
+
+    async def _send_packed(self, items, indexes):
+        """
+        Return {item index: result JSON} for the items answered in one request.
+
+        A pack whose answer does not fit the model is split in two rather than
+        sent to the fallback model; single items are left to _send_single.
+        """
+        if len(indexes) < 2:
+            return {}
+        user_prompt = "\n".join(
+            f'<item id="{index}">\n{items[index][0]}\n</item>' for index in indexes
+        )
+        try:
+            response, _ = await self.gpt_helper.parse_response_format(
+                self.packed_system_prompt,
+                user_prompt,
+                response_format=self.packed_response_format,
+                fallback=False,
+                **self.options,
+            )
+        except Exception as e:
+            if not is_context_overflow(e):
+                LOGGER.error(f"Packed request failed: {e}")
+                return {}
+            LOGGER.info(
+                f"Packed response of {len(indexes)} items overflowed, splitting it"
+            )
+            middle = len(indexes) // 2
+            halves = await asyncio.gather(
+                self._send_packed(items, indexes[:middle]),
+                self._send_packed(items, indexes[middle:]),
+            )
+            return {**halves[0], **halves[1]}
+
+        try:
+            entries = json.loads(response)["items"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            LOGGER.error(f"Unreadable packed response: {e}")
+            return {}
+        results = {
+            int(entry["item_id"]): json.dumps(entry["result"])
+            for entry in entries
+            if str(entry.get("item_id")).isdigit()
+            and int(entry["item_id"]) in indexes
+        }
+        cache = self.gpt_helper.cache
+        if cache is not None:
+            for index, content in results.items():
+                cache.set(
+                    self._cache_key(items[index][0]),
+                    content,
+                    self.system_prompt,
+                    self.gpt_helper.MODEL,
+                )
+        return results
+
+    async def _send(self, items):
+        try:
+            results = self._cached_results(items)
+            pending = [index for index in range(len(items)) if index not in results]
+            if len(pending) > 1:
+                packed_results = await self._send_packed(items, pending)
+                missing = len(pending) - len(packed_results)
+                if missing:
+                    LOGGER.info(
+                        f"{missing} of {len(pending)} packed items unanswered, "
+                        "sending them on their own"
+                    )
+                results.update(packed_results)
+            unanswered = [index for index in range(len(items)) if index not in results]
+            single_results = await asyncio.gather(
+                *(self._send_single(items[index][0]) for index in unanswered)
+            )
+            results.update(zip(unanswered, single_results))
+            for index, (_, future) in enumerate(items):
+                if not future.done():
+                    future.set_result(results[index])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,251 @@
+import collections
+import contextvars
+import threading
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    FIRST_EXCEPTION,
+    Future,
+)
+from concurrent.futures import wait as wait_futures
+from functools import lru_cache
+
+from .config import PIPELINE_CONFIGS
+
+# Pool whose worker is running the current thread, if any, and its task
+_worker = threading.local()
+
+
+class Task:
+    __slots__ = ("future", "context", "fn", "args", "kwargs", "parent")
+
+    def __init__(self, future, context, fn, args, kwargs, parent):
+        self.future = future
+        self.context = context
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        # Task that submitted this one from a worker of the same pool, if any
+        self.parent = parent
+
+    def descends_from(self, ancestor):
+        task = self.parent
+        while task is not None:
+            if task is ancestor:
+                return True
+            task = task.parent
+        return False
+
+
+class WorkPool:
+    """
+    Fixed number of worker threads draining one task queue.
+
+    A worker that waits for tasks of its own pool while no worker is idle runs
+    queued tasks that the waiting task submitted, directly or further down,
+    in the meantime. Nested
+    fan-out therefore never parks a thread or deadlocks however many levels
+    deep it goes, while another run's tasks never jump ahead inside it. Tasks
+    run in a copy of the submitter's context.
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self.condition = threading.Condition()
+        self.tasks = collections.deque()
+        self.workers = []
+        self.idle = 0
+        self.active = 0
+        self.completed = 0
+        self.peak_queued = 0
+
+    def _current_task(self):
+        if getattr(_worker, "pool", None) is not self:
+            return None
+        return _worker.task
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        task = Task(
+            future, contextvars.copy_context(), fn, args, kwargs, self._current_task()
+        )
+        with self.condition:
+            self.tasks.append(task)
+            self.peak_queued = max(self.peak_queued, len(self.tasks))
+            if not self.idle and len(self.workers) < self.max_workers:
+                # Threads are started on demand, up to max_workers
+                worker = threading.Thread(
+                    target=self._work,
+                    name=f"{self.name}-worker-{len(self.workers)}",
+                    daemon=True,
+                )
+                self.workers.append(worker)
+                worker.start()
+            # Wakes idle workers and workers waiting for their own tasks
+            self.condition.notify_all()
+        return future
+
+    def _work(self):
+        _worker.pool = self
+        _worker.task = None
+        while True:
+            with self.condition:
+                while not self.tasks:
+                    self.idle += 1
+                    self.condition.wait()
+                    self.idle -= 1
+                task = self.tasks.popleft()
+            self._run(task)
+
+    def _run(self, task):
+        if not task.future.set_running_or_notify_cancel():
+            # Cancelled while queued; waiters still need to see it is done
+            with self.condition:
+                self.condition.notify_all()
+            return
+        parent, _worker.task = _worker.task, task
+        with self.condition:
+            self.active += 1
+        try:
+            result = task.context.run(task.fn, *task.args, **task.kwargs)
+        except BaseException as e:
+            task.future.set_exception(e)
+        else:
+            task.future.set_result(result)
+        finally:
+            _worker.task = parent
+            with self.condition:
+                self.active -= 1
+                self.completed += 1
+                self.condition.notify_all()
+
+    def _pop_descendant(self, ancestor):
+        """Remove and return the oldest queued task submitted under ancestor"""
+        for index, task in enumerate(self.tasks):
+            if task.descends_from(ancestor):
+                del self.tasks[index]
+                return task
+        return None
+
+    def wait(self, futures, timeout=None, return_when=ALL_COMPLETED):
+        """
+        Block like concurrent.futures.wait for futures of this pool.
+
+        Returns:
+            tuple: (done, not_done) sets of futures
+        """
+        current = self._current_task()
+        if current is None:
+            return wait_futures(futures, timeout, return_when)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        futures = set(futures)
+        while True:
+            with self.condition:
+                done = {future for future in futures if future.done()}
+                if (
+                    len(done) == len(futures)
+                    or (done and return_when == FIRST_COMPLETED)
+                    or (
+                        return_when == FIRST_EXCEPTION
+                        and any(
+                            not future.cancelled() and future.exception()
+                            for future in done
+                        )
+                    )
+                ):
+                    return done, futures - done
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return done, futures - done
+                # Idle workers pick queued tasks up sooner than a helper could
+                task = None if self.idle else self._pop_descendant(current)
+                if task is None:
+                    self.condition.wait(remaining)
+                    continue
+            self._run(task)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "workers": len(self.workers),
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": len(self.tasks),
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+            }
+
+
+class WorkScheduler:
+    """
+    Process-wide bounded pools shared by every pipeline run: "io" for LLM
+    and other network calls, "cpu" for local models and number crunching.
+
+    Stages fan out through map instead of creating their own executors, so
+    concurrent stories and nested fan-out share one bounded set of threads.
+    """
+
+    def __init__(
+        self,
+        io_workers=PIPELINE_CONFIGS["IO_WORKERS"],
+        cpu_workers=PIPELINE_CONFIGS["CPU_WORKERS"],
+    ):
+        self.pools = {
+            "io": WorkPool("io", io_workers),
+            "cpu": WorkPool("cpu", cpu_workers),
+        }
+
+    def submit(self, fn, /, *args, kind="io", **kwargs):
+        return self.pools[kind].submit(fn, *args, **kwargs)
+
+    def wait(self, futures, kind="io", timeout=None, return_when=ALL_COMPLETED):
+        return self.pools[kind].wait(futures, timeout, return_when)
+
+    def map(self, fn, *iterables, kind="io"):
+        """
+        Run fn over the zipped iterables and return the results in order.
+
+        Raises:
+            Exception: The first failed call's error, once all calls are done
+        """
+        pool = self.pools[kind]
+        futures = [pool.submit(fn, *args) for args in zip(*iterables)]
+        pool.wait(futures)
+        return [future.result() for future in futures]
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def render(self):
+        """Return queue depth and worker gauges in the Prometheus text format"""
+        gauges = {
+            "queued": ("scheduler_queue_depth", "Tasks waiting for a worker"),
+            "peak_queued": ("scheduler_queue_depth_peak", "Deepest queue so far"),
+            "active": ("scheduler_active_tasks", "Tasks started and not finished"),
+            "workers": ("scheduler_workers", "Worker threads started"),
+            "max_workers": ("scheduler_max_workers", "Worker thread limit"),
+        }
+        stats = self.stats()
+        lines = []
+        for name, (metric, help_text) in gauges.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for pool, values in stats.items():
+                lines.append(f'{metric}{{pool="{pool}"}} {values[name]}')
+        metric = "scheduler_completed_tasks_total"
+        lines.append(f"# HELP {metric} Tasks finished")
+        lines.append(f"# TYPE {metric} counter")
+        for pool, values in stats.items():
+            lines.append(f'{metric}{{pool="{pool}"}} {values["completed"]}')
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def get_work_scheduler():
+    """Return the scheduler shared by the whole process"""
+    return WorkScheduler()
@@ -0,0 +1,153 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .config import PRICING_CONFIGS
+from .metrics import get_metrics_registry
+
+# Set by PipelineRunner while a stage runs
+current_stage = ContextVar("current_stage", default=None)
+current_usage = ContextVar("current_usage", default=None)
+
+UNSTAGED = "unstaged"
+COUNTERS = (
+    "requests",
+    "errors",
+    "retries",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "latency_seconds",
+    "cost_usd",
+)
+
+
+def get_model_prices(model):
+    """USD per million tokens for the longest configured prefix of model"""
+    prices = PRICING_CONFIGS["USD_PER_MILLION_TOKENS"]
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else {}
+
+
+def get_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    prices = get_model_prices(model)
+    input_price = prices.get("input", 0)
+    cached_price = prices.get("cached_input", input_price)
+    return (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * prices.get("output", 0)
+    ) / 1_000_000
+
+
+class UsageTracker:
+    """Provider token usage, latency and cost of one pipeline run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (stage, model) -> counters
+        self.totals = {}
+
+    def record(self, stage, model, values):
+        with self.lock:
+            totals = self.totals.setdefault(
+                (stage, model), dict.fromkeys(COUNTERS, 0)
+            )
+            for name, value in values.items():
+                totals[name] += value
+
+    def _sum(self, keys):
+        summed = dict.fromkeys(COUNTERS, 0)
+        for key in keys:
+            for name, value in self.totals[key].items():
+                summed[name] += value
+        summed["latency_seconds"] = round(summed["latency_seconds"], 3)
+        summed["cost_usd"] = round(summed["cost_usd"], 6)
+        return summed
+
+    def stage_totals(self, stage):
+        with self.lock:
+            return self._sum([key for key in self.totals if key[0] == stage])
+
+    def to_dict(self):
+        """Totals for the run, per stage, per model and per stage and model"""
+        with self.lock:
+            keys = list(self.totals)
+            stages = sorted({stage for stage, _ in keys})
+            models = sorted({model for _, model in keys})
+            return {
+                "total": self._sum(keys),
+                "stages": {
+                    stage: {
+                        **self._sum([key for key in keys if key[0] == stage]),
+                        "models": {
+                            model: self._sum([(stage, model)])
+                            for model in models
+                            if (stage, model) in self.totals
+                        },
+                    }
+                    for stage in stages
+                },
+                "models": {
+                    model: self._sum([key for key in keys if key[1] == model])
+                    for model in models
+                },
+            }
+
+
+class LLMCall:
+    """What a helper learns about one API call while making it"""
+
+    def __init__(self, model):
+        self.model = model
+        self.usage = None
+        self.retries = 0
+
+
+def record_llm_call(model, usage, latency_seconds, retries=0, error=False):
+    """Add one API call to the current run and to the process-wide metrics"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    values = {
+        "requests": 1,
+        "errors": int(error),
+        "retries": retries,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_seconds": latency_seconds,
+        "cost_usd": get_cost(model, prompt_tokens, cached_tokens, completion_tokens),
+    }
+    stage = current_stage.get() or UNSTAGED
+
+    tracker = current_usage.get()
+    if tracker is not None:
+        tracker.record(stage, model, values)
+    get_metrics_registry().observe(stage, model, values)
+
+
+@contextmanager
+def track_llm_call(model):
+    """
+    Time an API call and record it on exit; set usage and retries on the
+    yielded LLMCall. Failed calls are recorded as errors and re-raised.
+    """
+    call = LLMCall(model)
+    start_time = time.perf_counter()
+    error = False
+    try:
+        yield call
+    except Exception:
+        error = True
+        raise
+    finally:
+        record_llm_call(
+            call.model,
+            call.usage,
+            time.perf_counter() - start_time,
+            call.retries,
+            error,
+        )
@@ -1,17 +1,18 @@
 from .console import console, print_error, print_info, print_success
 from .logging_utils import setup_logging
 from .timing_logger import LOGGER, log_execution_time
+from .tokens import count_tokens, count_tokens_batch, pack_by_tokens
 from .utils import (
+    allocate_id,
     check_is_date,
     chunk_array,
     convert_date,
+    cosine_similarities,
     format_date,
-    load_id,
     merge_arrays,
     read_file,
     read_text_files,
     safe_convert_to_list,
-    save_id,
     write_to_json,
 )
 
@@ -29,9 +30,12 @@ __all__ = [
     "merge_arrays",
     "chunk_array",
     "safe_convert_to_list",
-    "load_id",
-    "save_id",
+    "allocate_id",
     "convert_date",
     "check_is_date",
     "format_date",
+    "cosine_similarities",
+    "count_tokens",
+    "count_tokens_batch",
+    "pack_by_tokens",
 ]
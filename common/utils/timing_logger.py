@@ -1,3 +1,4 @@
+import inspect
 import logging
 import time
 
@@ -7,6 +8,18 @@ LOGGER = logging.getLogger("project_logger")  # Use the global logger
 def log_execution_time(func):
     """Decorator to log function execution time."""
 
+    if inspect.iscoroutinefunction(func):
+
+        async def async_wrapper(*args, **kwargs):
+            start_time = time.time()
+            result = await func(*args, **kwargs)  # Execute the coroutine
+            elapsed_time = time.time() - start_time
+
+            LOGGER.info(f"{func.__name__},SUCCESS,{elapsed_time:.4f} sec")
+            return result
+
+        return async_wrapper
+
     def wrapper(*args, **kwargs):
         start_time = time.time()
         result = func(*args, **kwargs)  # Execute the function
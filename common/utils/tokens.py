@@ -0,0 +1,65 @@
+from functools import lru_cache
+
+import tiktoken
+from common.config import MODEL_CONFIG
+
+# Used for models tiktoken does not know yet; gpt-4o and later use o200k
+DEFAULT_ENCODING = "o200k_base"
+BATCH_THREADS = 8
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=None):
+    """Return the tiktoken encoding for a model, loaded once per process"""
+    try:
+        return tiktoken.encoding_for_model(model or MODEL_CONFIG["DEFAULT_MODEL"])
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text, model=None):
+    # Special token markers in scraped pages are counted as plain text
+    return len(get_encoding(model).encode_ordinary(text or ""))
+
+
+@lru_cache(maxsize=64)
+def count_prompt_tokens(prompt, model=None):
+    """count_tokens for static prompts, remembered across calls"""
+    return count_tokens(prompt, model)
+
+
+def count_tokens_batch(texts, model=None, num_threads=BATCH_THREADS):
+    """Token count of each text, encoded across threads by tiktoken"""
+    encoded = get_encoding(model).encode_ordinary_batch(
+        [text or "" for text in texts], num_threads=num_threads
+    )
+    return [len(tokens) for tokens in encoded]
+
+
+def pack_by_tokens(items, token_counts, max_tokens, separator_tokens=1):
+    """
+    Greedily pack items, in order, into groups of at most max_tokens.
+
+    Args:
+        items (list): Items to pack
+        token_counts (list[int]): Token count of each item
+        max_tokens (int): Budget per group
+        separator_tokens (int): Tokens added between two items of a group
+
+    Returns:
+        list[list]: Groups of items; an item larger than the budget gets a
+            group of its own
+    """
+    groups = []
+    group, group_tokens = [], 0
+    for item, tokens in zip(items, token_counts):
+        needed = tokens + (separator_tokens if group else 0)
+        if group and group_tokens + needed > max_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+            needed = tokens
+        group.append(item)
+        group_tokens += needed
+    if group:
+        groups.append(group)
+    return groups
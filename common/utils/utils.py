@@ -1,7 +1,9 @@
 import ast
+import fcntl
 import json
 import os
 
+import numpy as np
 from common.config import DATE_CONFIGS
 from dateutil import parser
 
@@ -71,6 +73,8 @@ def chunk_array(lst, chunk_size):
 
 
 def safe_convert_to_list(s):
+    if isinstance(s, list):
+        return s
     try:
         arr = ast.literal_eval(s)
         if isinstance(arr, list):  # Ensure it's actually a list
@@ -82,19 +86,44 @@ def safe_convert_to_list(s):
         return None  # Return None or an empty list []
 
 
-def load_id():
-    """Load the stored ID from the file, or return a default ID if not found."""
-    if os.path.exists(FILE_PATH):
-        with open(FILE_PATH, "r") as file:
-            data = json.load(file)
-            return data.get("id", 0)
-    return 0  # Default ID if file does not exist
-
-
-def save_id(new_id):
-    """Save the updated ID to the file."""
-    with open(FILE_PATH, "w") as file:
-        json.dump({"id": new_id}, file)
+def cosine_similarities(query_vector, matrix):
+    """Cosine similarity of one vector against every row of a matrix"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    if matrix.size == 0:
+        return np.empty(0, dtype=np.float32)
+
+    row_norms = np.linalg.norm(matrix, axis=1)
+    query_norm = np.linalg.norm(query_vector)
+    denominators = np.maximum(row_norms * query_norm, np.finfo(np.float32).eps)
+    return (matrix @ query_vector) / denominators
+
+
+def allocate_id():
+    """
+    Reserve the next run id and return it.
+
+    The counter file is updated under an exclusive fcntl lock on a sidecar
+    lock file and replaced atomically, so concurrent threads and worker
+    processes always get distinct ids and a crash never leaves it half written.
+    """
+    with open(f"{FILE_PATH}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            current_id = 0  # Default ID if file does not exist
+            if os.path.exists(FILE_PATH):
+                with open(FILE_PATH, "r") as file:
+                    current_id = json.load(file).get("id", 0)
+
+            temp_path = f"{FILE_PATH}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump({"id": current_id + 1}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, FILE_PATH)
+            return current_id
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def convert_date(date_str):
@@ -1,3 +1,4 @@
-from .search_processor import get_google_search_results
+from .article_store import ArticleStore
+from .search_processor import get_google_search_results_async
 
-__all__ = ["get_google_search_results"]
+__all__ = ["get_google_search_results_async", "ArticleStore"]
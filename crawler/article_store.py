@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from common.config import DEDUPE_CONFIGS
+from common.utils.timing_logger import LOGGER
+
+from .near_duplicates import MinHashLSHIndex
+from .urls import canonicalize_url
+
+# Article ids are query_index * MAX_RESULTS_PER_QUERY + result_index, so they
+# follow the search rank whatever order the pages are crawled in
+MAX_RESULTS_PER_QUERY = 100
+
+# Column name -> True when the value is stored as JSON
+COLUMNS = {
+    "title": False,
+    "link": False,
+    "canonical_url": False,
+    "date": False,
+    "meta_description": False,
+    "headings": True,
+    "image_urls": True,
+    "page_content": True,
+    "favicon": False,
+    "source": False,
+    "domain": False,
+    "displayed_link": False,
+    "snippet_highlighted_words": True,
+}
+
+
+def content_hash(paragraphs):
+    return hashlib.sha256(
+        json.dumps(paragraphs, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class ArticleStore:
+    """
+    Typed store for the articles collected by one story run.
+
+    Articles are deduplicated on insert by canonical URL, by a hash of their
+    paragraphs and, when enabled, by MinHash similarity of their paragraphs,
+    and get their article id from their search rank on insert, so they can
+    be processed as soon as they are crawled and still get the same id on
+    every run. Ids have gaps where results were empty or duplicates. Of
+    near-duplicates, the best ranked search result is kept: a better ranked
+    copy arriving later replaces the stored row under its own id, so results
+    already computed for the replaced id must be dropped (see ids()).
+    Paragraphs and other list fields stay real lists.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        column_definitions = ",\n".join(f"{column} TEXT" for column in COLUMNS)
+        self.conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS articles (
+                url_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL UNIQUE,
+                query_index INTEGER NOT NULL,
+                result_index INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                {column_definitions}
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_articles_id ON articles (id);
+            """
+        )
+        existing = {
+            row["name"] for row in self.conn.execute("PRAGMA table_info(articles)")
+        }
+        for column in COLUMNS:
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE articles ADD COLUMN {column} TEXT")
+        self.conn.commit()
+
+        self.near_duplicates = None
+        if DEDUPE_CONFIGS["NEAR_DUPLICATE_ENABLED"]:
+            self.near_duplicates = MinHashLSHIndex()
+            # Keyed by article id
+            for row in self.conn.execute("SELECT id, page_content FROM articles"):
+                signature = self.near_duplicates.signature(
+                    json.loads(row["page_content"])
+                )
+                if signature is not None:
+                    self.near_duplicates.add(row["id"], signature)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, article, query_index, result_index):
+        """
+        Insert an article unless a duplicate is already stored.
+
+        Args:
+            article (dict): Values keyed by COLUMNS
+            query_index (int): Position of the search query that found it
+            result_index (int): Position within that query's results
+
+        Returns:
+            int: The new article id, or None if the article was empty or a
+                duplicate
+        """
+        if not article.get("page_content"):
+            return None
+        if result_index >= MAX_RESULTS_PER_QUERY:
+            raise ValueError(
+                f"result_index {result_index} is beyond {MAX_RESULTS_PER_QUERY}"
+            )
+
+        url_key = canonicalize_url(article.get("canonical_url") or article["link"])
+        digest = content_hash(article["page_content"])
+        signature = (
+            self.near_duplicates.signature(article["page_content"])
+            if self.near_duplicates
+            else None
+        )
+        values = [
+            json.dumps(article.get(column)) if is_json else article.get(column)
+            for column, is_json in COLUMNS.items()
+        ]
+
+        with self.lock:
+            duplicate = self.conn.execute(
+                "SELECT 1 FROM articles WHERE url_key = ? OR content_hash = ?",
+                (url_key, digest),
+            ).fetchone()
+            if duplicate is not None:
+                return None
+
+            match = None
+            if signature is not None:
+                match = self.near_duplicates.query(signature)
+            if match is not None and not self._replace_if_better_ranked(
+                match, article, query_index, result_index
+            ):
+                return None
+
+            article_id = query_index * MAX_RESULTS_PER_QUERY + result_index
+            if signature is not None:
+                self.near_duplicates.add(article_id, signature)
+            placeholders = ", ".join("?" * (len(COLUMNS) + 5))
+            self.conn.execute(
+                f"INSERT INTO articles (url_key, content_hash, query_index, "
+                f"result_index, id, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+                (url_key, digest, query_index, result_index, article_id, *values),
+            )
+            self.conn.commit()
+        return article_id
+
+    def _replace_if_better_ranked(self, match, article, query_index, result_index):
+        """
+        Delete the stored near-duplicate if the new article is better ranked.
+
+        Returns:
+            bool: True if the new article should be inserted in its place
+        """
+        article_id, similarity = match
+        stored = self.conn.execute(
+            "SELECT link, query_index, result_index FROM articles WHERE id = ?",
+            (article_id,),
+        ).fetchone()
+        if (query_index, result_index) >= (
+            stored["query_index"],
+            stored["result_index"],
+        ):
+            LOGGER.info(
+                f"Dropped {article['link']} as a near-duplicate of "
+                f"{stored['link']} (similarity {similarity:.2f})"
+            )
+            return False
+
+        LOGGER.info(
+            f"Replaced {stored['link']} with its better ranked near-duplicate "
+            f"{article['link']} (similarity {similarity:.2f})"
+        )
+        self.conn.execute("DELETE FROM articles WHERE id = ?", (article_id,))
+        self.near_duplicates.remove(article_id)
+        return True
+
+    def ids(self):
+        """Ids of the articles currently stored"""
+        with self.lock:
+            return {row["id"] for row in self.conn.execute("SELECT id FROM articles")}
+
+    def columns(self, names):
+        """
+        Return {name: {article id: value}} in article id order, decoding only
+        the requested columns
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, {', '.join(names)} FROM articles "
+                "ORDER BY id"
+            ).fetchall()
+        return {
+            name: {
+                row["id"]: json.loads(row[name]) if COLUMNS[name] else row[name]
+                for row in rows
+            }
+            for name in names
+        }
+
+    def column(self, name):
+        return self.columns([name])[name]
+
+    def summary(self):
+        """Small JSON description of the store for pipeline checkpoints"""
+        with self.lock:
+            hashes = [
+                row["content_hash"]
+                for row in self.conn.execute(
+                    "SELECT content_hash FROM articles ORDER BY id"
+                )
+            ]
+        return {
+            "path": self.path,
+            "count": len(hashes),
+            "digest": hashlib.sha256("".join(hashes).encode("utf-8")).hexdigest(),
+        }
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM articles")
+            self.conn.commit()
+            if self.near_duplicates:
+                self.near_duplicates.clear()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,135 @@
+import re
+from urllib.parse import urljoin
+
+from lxml import etree
+from lxml import html as lxml_html
+
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Never part of the readable page
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+# Containers that are never treated as boilerplate, whatever their class says
+CONTENT_TAGS = {"html", "body", "main", "article"}
+
+# Page furniture dropped when boilerplate removal is on
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "form"}
+BOILERPLATE_PATTERN = re.compile(
+    r"(^|[\s_-])(nav|navbar|menu|breadcrumbs?|sidebar|footer|header|comments?|"
+    r"share|social|related|promo|advert|ads?|cookie|newsletter|subscribe)($|[\s_-])",
+    re.IGNORECASE,
+)
+
+PARSER = lxml_html.HTMLParser(encoding="utf-8", remove_comments=True)
+
+
+def clean_text(element):
+    return " ".join(element.text_content().split())
+
+
+def is_boilerplate(element):
+    if element.tag in CONTENT_TAGS:
+        return False
+    if element.tag in BOILERPLATE_TAGS:
+        return True
+    attributes = f"{element.get('class', '')} {element.get('id', '')}"
+    return bool(attributes.strip()) and bool(BOILERPLATE_PATTERN.search(attributes))
+
+
+def extract_page_data(page_html, base_url="", remove_boilerplate=False):
+    """
+    Extract page fields in a single walk over the lxml tree.
+
+    Args:
+        page_html (str): Raw HTML
+        base_url (str): URL the page was fetched from, used to resolve images
+            when the page has no <base href>
+        remove_boilerplate (bool): Skip navigation, headers, footers, sidebars
+            and similar page furniture
+
+    Returns:
+        dict: meta_description (str or None), canonical_url (absolute, or
+            None), headings (list of "hN: text" in document order), image_urls
+            (absolute) and paragraphs (list[str])
+    """
+    data = {
+        "meta_description": None,
+        "canonical_url": None,
+        "headings": [],
+        "image_urls": [],
+        "paragraphs": [],
+    }
+    if not page_html or not page_html.strip():
+        return data
+
+    try:
+        root = lxml_html.document_fromstring(page_html.encode("utf-8"), parser=PARSER)
+    except (etree.ParserError, ValueError):
+        return data
+
+    base_href = None
+    canonical_href = None
+    image_sources = []
+    # Whether each open element is skipped, and how many skipped ones are open
+    skip_stack = []
+    skip_depth = 0
+
+    for event, element in etree.iterwalk(root, events=("start", "end")):
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+
+        if event == "end":
+            if skip_stack.pop():
+                skip_depth -= 1
+            continue
+
+        skipped = tag in SKIPPED_TAGS or (
+            remove_boilerplate and is_boilerplate(element)
+        )
+        skip_stack.append(skipped)
+        if skipped:
+            skip_depth += 1
+            continue
+
+        # Metadata counts wherever it appears, even inside boilerplate
+        if tag == "meta":
+            if (
+                data["meta_description"] is None
+                and (element.get("name") or "").lower() == "description"
+                and element.get("content")
+            ):
+                data["meta_description"] = element.get("content")
+            continue
+        if tag == "base":
+            if base_href is None and element.get("href"):
+                base_href = element.get("href")
+            continue
+        if tag == "link":
+            if (
+                canonical_href is None
+                and "canonical" in (element.get("rel") or "").lower().split()
+                and element.get("href")
+            ):
+                canonical_href = element.get("href")
+            continue
+        if skip_depth:
+            continue
+
+        if tag == "p":
+            text = clean_text(element)
+            if text:
+                data["paragraphs"].append(text)
+        elif tag in HEADING_TAGS:
+            text = clean_text(element)
+            if text:
+                data["headings"].append(f"{tag}: {text}")
+        elif tag == "img" and element.get("src"):
+            image_sources.append(element.get("src"))
+
+    # Resolve the base once for every image
+    base = urljoin(base_url, base_href) if base_href else base_url
+    data["image_urls"] = [urljoin(base, src) for src in image_sources]
+    if canonical_href:
+        data["canonical_url"] = urljoin(base, canonical_href)
+    return data
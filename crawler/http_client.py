@@ -0,0 +1,120 @@
+import asyncio
+import importlib.util
+from urllib.parse import urlsplit
+
+import httpx
+from common.config import CRAWLER_CONFIGS
+from common.utils.timing_logger import LOGGER
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+
+class NonHTMLContentError(Exception):
+    """Raised when a page is not HTML; the body is never downloaded"""
+
+
+class FetchedPage:
+    def __init__(self, url, status_code, headers, text, truncated=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.truncated = truncated
+
+
+class AsyncCrawler:
+    """
+    Shared HTTP client for one crawl.
+
+    All fetches reuse one connection pool (HTTP/2 when h2 is installed), are
+    capped globally and per host, and stream the body so oversized pages are
+    cut off and non-HTML responses are dropped before their body is read.
+
+    Use as an async context manager, one instance per event loop.
+    """
+
+    def __init__(
+        self,
+        max_connections=CRAWLER_CONFIGS["MAX_CONNECTIONS"],
+        max_connections_per_host=CRAWLER_CONFIGS["MAX_CONNECTIONS_PER_HOST"],
+        max_page_bytes=CRAWLER_CONFIGS["MAX_PAGE_BYTES"],
+        timeout=CRAWLER_CONFIGS["TIMEOUT_SECONDS"],
+        global_limit=None,
+    ):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_page_bytes = max_page_bytes
+        # Callers may pass a semaphore shared with other work on the same loop
+        self.global_limit = global_limit or asyncio.Semaphore(max_connections)
+        self.host_limits = {}
+
+        http2 = CRAWLER_CONFIGS["HTTP2"] and importlib.util.find_spec("h2") is not None
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            headers={"User-Agent": CRAWLER_CONFIGS["USER_AGENT"]},
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc.lower()
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self.host_limits[host]
+
+    async def fetch(self, url, headers=None):
+        """
+        Fetch a page.
+
+        Returns:
+            FetchedPage: Response with the decoded body; bodies of non-200
+                responses are not read
+
+        Raises:
+            NonHTMLContentError: If a 200 response is not HTML
+            httpx.HTTPError: On network errors and timeouts
+        """
+        async with self._host_limit(url), self.global_limit:
+            async with self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code != 200:
+                    return FetchedPage(url, response.status_code, response.headers, "")
+
+                content_type = response.headers.get("content-type", "").lower()
+                if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+                    raise NonHTMLContentError(
+                        f"Unsupported content type: {content_type}"
+                    )
+
+                body = bytearray()
+                truncated = False
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) > self.max_page_bytes:
+                        del body[self.max_page_bytes :]
+                        truncated = True
+                        break
+
+                if truncated:
+                    LOGGER.info(f"Truncated {url} at {self.max_page_bytes} bytes")
+                text = bytes(body).decode(
+                    response.encoding or "utf-8", errors="replace"
+                )
+                return FetchedPage(
+                    str(response.url),
+                    response.status_code,
+                    response.headers,
+                    text,
+                    truncated,
+                )
@@ -0,0 +1,99 @@
+import re
+import zlib
+
+import numpy as np
+from common.config import DEDUPE_CONFIGS
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(paragraphs, size):
+    """Hashed word k-shingles of the whole text, case and punctuation ignored"""
+    words = WORD_PATTERN.findall(" ".join(paragraphs).lower())
+    # Short texts become a single shingle
+    size = min(size, len(words)) or 1
+    return {
+        zlib.crc32(" ".join(words[index : index + size]).encode("utf-8"))
+        for index in range(len(words) - size + 1)
+    }
+
+
+class MinHashLSHIndex:
+    """
+    MinHash signatures of article paragraphs, banded for locality sensitive
+    lookup.
+
+    Articles sharing a band with an indexed article are candidates; a
+    candidate counts as a near-duplicate when the estimated Jaccard
+    similarity of their shingle sets reaches the threshold.
+    """
+
+    def __init__(
+        self,
+        shingle_size=DEDUPE_CONFIGS["SHINGLE_SIZE"],
+        num_permutations=DEDUPE_CONFIGS["MINHASH_PERMUTATIONS"],
+        bands=DEDUPE_CONFIGS["LSH_BANDS"],
+        threshold=DEDUPE_CONFIGS["SIMILARITY_THRESHOLD"],
+        seed=1,
+    ):
+        if num_permutations % bands:
+            raise ValueError("MINHASH_PERMUTATIONS must be a multiple of LSH_BANDS")
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.threshold = threshold
+        generator = np.random.default_rng(seed)
+        self.a = generator.integers(1, 1 << 31, num_permutations, dtype=np.uint64)
+        self.b = generator.integers(0, 1 << 31, num_permutations, dtype=np.uint64)
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def signature(self, paragraphs):
+        hashes = np.fromiter(
+            shingles(paragraphs, self.shingle_size), dtype=np.uint64
+        )
+        if not hashes.size:
+            return None
+        # (a * x + b) stays below 2^63 as a, b < 2^31 and x < 2^32
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        return [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def query(self, signature):
+        """Return (key, similarity) of the closest indexed near-duplicate"""
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            bucket[band_key].remove(key)
+            if not bucket[band_key]:
+                del bucket[band_key]
+
+    def clear(self):
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = {}
@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from common.config import CACHE_CONFIGS
+from common.utils.timing_logger import LOGGER
+
+from .urls import normalize_url
+
+
+def get_freshness_seconds(url):
+    host = (urlsplit(url).hostname or "").lower()
+    domain_freshness = CACHE_CONFIGS["PAGE_CACHE_DOMAIN_FRESHNESS_SECONDS"]
+    labels = host.split(".")
+    for index in range(len(labels)):
+        domain = ".".join(labels[index:])
+        if domain in domain_freshness:
+            return domain_freshness[domain]
+    return CACHE_CONFIGS["PAGE_CACHE_DEFAULT_FRESHNESS_SECONDS"]
+
+
+class CachedPage:
+    def __init__(self, row):
+        self.url = row["url"]
+        self.source = row["source"]
+        self.status_code = row["status_code"]
+        self.headers = json.loads(row["headers"])
+        self.etag = row["etag"]
+        self.last_modified = row["last_modified"]
+        self.parsed = json.loads(row["parsed"])
+        self.parser_version = row["parser_version"]
+        self.validated_at = row["validated_at"]
+        self._body = row["body"]
+
+    @property
+    def body(self):
+        return zlib.decompress(self._body).decode("utf-8")
+
+    def is_fresh(self):
+        return time.time() - self.validated_at < get_freshness_seconds(self.url)
+
+    def conditional_headers(self):
+        """Request headers for revalidating this page"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    SQLite backed cache of crawled pages, keyed by normalized URL.
+
+    Stores the compressed raw body, response headers and validators, and the
+    parsed page data, for both direct fetches and Serper scrapes.
+    """
+
+    def __init__(self, path=CACHE_CONFIGS["PAGE_CACHE_PATH"]):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = self._connect()
+        # Workers forked by gunicorn --preload must not share this connection
+        os.register_at_fork(after_in_child=self._reconnect)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                source TEXT NOT NULL,
+                status_code INTEGER,
+                headers TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                parsed TEXT NOT NULL,
+                parser_version INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                validated_at REAL NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reconnect(self):
+        # The parent's connection is kept, not closed: closing it in the child
+        # could interfere with the parent's locks on the database
+        self.parent_conn = self.conn
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def get(self, url):
+        """Return the CachedPage for url, fresh or not, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM pages WHERE url_key = ?", (normalize_url(url),)
+            ).fetchone()
+        return CachedPage(row) if row else None
+
+    def set(
+        self,
+        url,
+        body,
+        parsed,
+        parser_version,
+        source="direct",
+        status_code=200,
+        headers=None,
+    ):
+        headers = dict(headers or {})
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO pages (
+                    url_key, url, source, status_code, headers, etag, last_modified,
+                    body, parsed, parser_version, fetched_at, validated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    normalize_url(url),
+                    url,
+                    source,
+                    status_code,
+                    json.dumps(headers),
+                    headers.get("etag"),
+                    headers.get("last-modified"),
+                    zlib.compress(body.encode("utf-8")),
+                    json.dumps(parsed),
+                    parser_version,
+                    now,
+                    now,
+                ),
+            )
+            self.conn.commit()
+
+    def mark_validated(self, url):
+        """Record that the origin confirmed the cached page is still current"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE pages SET validated_at = ? WHERE url_key = ?",
+                (time.time(), normalize_url(url)),
+            )
+            self.conn.commit()
+
+    def update_parsed(self, url, parsed, parser_version):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE pages SET parsed = ?, parser_version = ? WHERE url_key = ?",
+                (json.dumps(parsed), parser_version, normalize_url(url)),
+            )
+            self.conn.commit()
+
+
+@lru_cache(maxsize=None)
+def get_page_cache():
+    """Return the process-wide page cache, or None when it is disabled"""
+    if not CACHE_CONFIGS["PAGE_CACHE_ENABLED"]:
+        return None
+    try:
+        return PageCache()
+    except sqlite3.Error as e:
+        LOGGER.error(f"Page cache unavailable: {e}")
+        return None
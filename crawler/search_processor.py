@@ -1,110 +1,132 @@
-import csv
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
-import requests
-from bs4 import BeautifulSoup
+from common.config import CRAWLER_CONFIGS
+from common.scheduler import get_work_scheduler
 from common.utils.timing_logger import LOGGER, log_execution_time
 
+from .html_extractor import extract_page_data
+from .page_cache import get_page_cache
 from .searchAPI import get_search_results
 
 # from .serper import get_search_results
 from .serper import get_webpage
 
+# Bump when extract_specific_data changes, so cached pages are re-parsed
+PARSER_VERSION = 3
+
 
 @log_execution_time
-def get_google_search_results(
-    query, num_results=10, csv_filename="search_results.csv", country_code="sg"
+async def get_google_search_results_async(
+    query,
+    crawler,
+    store,
+    query_index=0,
+    num_results=10,
+    country_code="sg",
+    on_article=None,
 ):
+    """
+    Search, crawl every result through the shared crawler and store it.
+
+    Each result is stored as soon as its page is crawled; for new articles
+    on_article(article_id, article) is awaited right away, so callers can
+    start processing before the rest of the results arrive.
+    """
 
     ## serper settings for search results
     # response = get_search_results(query, num_results)
     # organic_results = response[0]["organic"]
 
     ## searchapi settings for search results
-    response = get_search_results(query, num_results, country_code=country_code)
+    response = await asyncio.to_thread(
+        get_search_results, query, num_results, country_code=country_code
+    )
     organic_results = response["organic_results"]
 
-    with open(csv_filename, mode="w", newline="", encoding="utf-8") as csv_file:
-        fieldnames = [
-            "Title",
-            "Link",
-            "Date",
-            "Meta_Description",
-            "Headings",
-            "Image_URLs",
-            "Page_Content",
-            # for searchapi
-            "Favicon",
-            "Source",
-            "Domain",
-            "Displayed_Link",
-            "Snippet_Highlighted_Words",
-        ]
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        writer.writeheader()
-
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            # Submit all tasks with their indices
-            futures = [
-                (idx, executor.submit(process_result, result))
-                for idx, result in enumerate(organic_results)
-            ]
-
-            # Collect and sort results by index to maintain original order
-            sorted_results = []
-            for idx, future in futures:
-                try:
-                    result_data = future.result()
-                    sorted_results.append((idx, result_data))
-                except Exception as e:
-                    LOGGER.error(f"Error processing result {idx}: {e}")
-
-            # Sort by original index and write to CSV
-            sorted_results.sort(key=lambda x: x[0])
-            for _, data in sorted_results:
-                writer.writerow(data)
-
-
-def process_result(result):
-    """Process individual search result and return data for CSV row"""
-    page_data = crawl_page(result["link"])
+    async def store_result(idx, result):
+        try:
+            data = await process_result_async(result, crawler)
+        except Exception as e:
+            LOGGER.error(f"Error processing result {idx}: {e}")
+            return
+        article_id = store.add(data, query_index, idx)
+        if article_id is not None and on_article is not None:
+            await on_article(article_id, data)
+
+    await asyncio.gather(
+        *(store_result(idx, result) for idx, result in enumerate(organic_results))
+    )
+
 
+async def process_result_async(result, crawler):
+    page_data = await crawl_page_async(result["link"], crawler)
+    return build_result_row(result, page_data)
+
+
+def build_result_row(result, page_data):
     return {
-        "Title": result["title"],
-        "Link": result["link"],
-        "Date": (
+        "title": result["title"],
+        "link": result["link"],
+        "date": (
             result.get("date")
             if result.get("date") and str(result.get("date")) != "NaN"
             else ""
         ),
-        "Meta_Description": result["snippet"],
-        "Headings": "; ".join(page_data["Headings"]),
-        "Image_URLs": "; ".join(page_data["Image_URLs"]),
-        "Page_Content": page_data["Page_Content"],
+        "meta_description": result["snippet"],
+        "canonical_url": page_data.get("Canonical_URL"),
+        "headings": page_data["Headings"],
+        "image_urls": page_data["Image_URLs"],
+        "page_content": page_data["Page_Content"],
         # for searchapi
-        "Favicon": result["favicon"],
-        "Source": result["source"],
-        "Domain": result["domain"],
-        "Displayed_Link": result["displayed_link"],
-        "Snippet_Highlighted_Words": result["snippet_highlighted_words"],
+        "favicon": result["favicon"],
+        "source": result["source"],
+        "domain": result["domain"],
+        "displayed_link": result["displayed_link"],
+        "snippet_highlighted_words": result["snippet_highlighted_words"],
     }
 
 
-def crawl_page(url):
-    """Crawl a webpage with enhanced error handling and retries"""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+async def crawl_page_async(url, crawler):
+    """
+    Crawl a webpage, serving and revalidating it through the page cache.
+
+    Fresh cache entries are returned without a request; stale ones are
+    revalidated with If-None-Match/If-Modified-Since, and are still served if
+    the site cannot be reached.
+    """
+    page_cache = get_page_cache()
+    cached = page_cache.get(url) if page_cache is not None else None
+    if cached is not None and cached.is_fresh():
+        return await get_cached_page_data(page_cache, cached)
 
     try:
-        response = requests.get(url, headers=headers, timeout=20)
-        if response.status_code == 200:
+        page = await crawler.fetch(
+            url, headers=cached.conditional_headers() if cached else None
+        )
+        if page.status_code == 304 and cached is not None:
+            page_cache.mark_validated(url)
+            return await get_cached_page_data(page_cache, cached)
+
+        if page.status_code == 200:
             print("success getting response")
-            return extract_specific_data(BeautifulSoup(response.text, "html.parser"))
+            page_data = await parse_page_async(page.text, page.url)
+            if page_cache is not None:
+                page_cache.set(
+                    url,
+                    page.text,
+                    page_data,
+                    PARSER_VERSION,
+                    status_code=page.status_code,
+                    headers=page.headers,
+                )
+            return page_data
+
+        if cached is not None:
+            return await get_cached_page_data(page_cache, cached)
 
         # Fallback to serper.dev if direct request fails
-        if website := get_webpage(url):
-            return {
+        if website := await asyncio.to_thread(get_webpage, url):
+            page_data = {
                 "Meta_Description": website["metadata"]["description"],
                 "Headings": [],
                 "Image_URLs": [],
@@ -112,62 +134,52 @@ def crawl_page(url):
                     website["text"].split("\n\n") if len(website["text"]) >= 200 else ""
                 ),
             }
+            if page_cache is not None:
+                page_cache.set(
+                    url, website["text"], page_data, PARSER_VERSION, source="serper"
+                )
+            return page_data
 
-        return error_response(f"HTTP Error {response.status_code}")
+        return error_response(f"HTTP Error {page.status_code}")
 
     except Exception as e:
+        if cached is not None:
+            return await get_cached_page_data(page_cache, cached)
         return error_response(str(e))
 
 
-def extract_specific_data(soup):
-    """Extract data from BeautifulSoup parsed content"""
-    return {
-        "Meta_Description": get_meta_description(soup),
-        "Headings": get_headings(soup),
-        "Image_URLs": get_image_urls(soup),
-        "Page_Content": (
-            get_page_content(soup)
-            if get_page_content(soup) and len(get_page_content(soup)) != 0
-            else ""
-        ),
-    }
-
+async def get_cached_page_data(page_cache, cached):
+    """Return cached page data, re-parsing stored HTML if the parser changed"""
+    if cached.parser_version == PARSER_VERSION or cached.source != "direct":
+        return cached.parsed
 
-def get_meta_description(soup):
-    meta = soup.find("meta", attrs={"name": "description"})
-    return meta["content"] if meta and meta.get("content") else "N/A"
+    page_data = await parse_page_async(cached.body, cached.url)
+    page_cache.update_parsed(cached.url, page_data, PARSER_VERSION)
+    return page_data
 
 
-def get_headings(soup):
-    return [
-        f"h{level}: {h.get_text(strip=True)}"
-        for level in range(1, 7)
-        for h in soup.find_all(f"h{level}")
-        if h.get_text(strip=True)
-    ]
+def parse_page(html, url=""):
+    return extract_specific_data(html, url)
 
 
-def get_image_urls(soup):
-    return [
-        resolve_relative_url(soup, img["src"]) for img in soup.find_all("img", src=True)
-    ]
+async def parse_page_async(html, url=""):
+    """Parse a page on the cpu pool, keeping lxml off the event loop"""
+    future = get_work_scheduler().submit(parse_page, html, url, kind="cpu")
+    return await asyncio.wrap_future(future)
 
 
-def get_page_content(soup):
-    return [
-        p.get_text(strip=True) for p in soup.find_all("p") if p.get_text(strip=True)
-    ]
-
-
-def resolve_relative_url(soup, url):
-    """Convert relative URLs to absolute"""
-    base = soup.find("base", href=True)
-    base_url = (
-        base["href"]
-        if base
-        else soup.original_url if hasattr(soup, "original_url") else ""
+def extract_specific_data(html, base_url=""):
+    """Extract the page fields in one pass over the lxml tree"""
+    page_data = extract_page_data(
+        html, base_url, remove_boilerplate=CRAWLER_CONFIGS["REMOVE_BOILERPLATE"]
     )
-    return requests.compat.urljoin(base_url, url)
+    return {
+        "Meta_Description": page_data["meta_description"] or "N/A",
+        "Canonical_URL": page_data["canonical_url"],
+        "Headings": page_data["headings"],
+        "Image_URLs": page_data["image_urls"],
+        "Page_Content": page_data["paragraphs"] or "",
+    }
 
 
 def error_response(error_msg):
@@ -0,0 +1,47 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Query parameters that only track the visit or pick a page variant
+IGNORED_QUERY_PARAMS = re.compile(
+    r"^(utm_.*|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|_ga|_gl|ref|ref_src|"
+    r"cmpid|igshid|amp|outputtype|output|print|view|share)$",
+    re.IGNORECASE,
+)
+
+# Path suffixes of AMP and print variants, e.g. /story/amp/ or /story/print
+VARIANT_PATH_SUFFIX = re.compile(r"/(amp|print|printable)/?$", re.IGNORECASE)
+
+
+def normalize_url(url):
+    """Lowercase scheme and host, drop default ports and fragments, sort the query"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def canonicalize_url(url):
+    """
+    Key shared by the variants of one article.
+
+    Builds on normalize_url and also ignores the scheme, a leading www., amp.
+    or m. host label, tracking and variant query parameters, AMP/print path
+    suffixes and trailing slashes.
+    """
+    parts = urlsplit(normalize_url(url))
+    host = re.sub(r"^(www|amp|m)\.", "", parts.netloc)
+    path = VARIANT_PATH_SUFFIX.sub("", parts.path).rstrip("/") or "/"
+    query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not IGNORED_QUERY_PARAMS.match(key)
+        ]
+    )
+    return urlunsplit(("", host, path, query, "")).lstrip("/")
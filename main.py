@@ -1,19 +1,59 @@
 VERSION = "v10"
 
+import asyncio
+import glob
 import hashlib
+import json
 import os
 import re
 import time
+from contextlib import asynccontextmanager
 from typing import Any, Optional
 
-from fastapi import FastAPI, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 
-from common.utils import load_id, save_id, setup_logging
-from stages.story_generator import generate_story
+from common import JOB_CONFIGS
+from common.job_queue import FINISHED_STATUSES, JobQueue
+from common.metrics import get_metrics_registry
+from common.scheduler import get_work_scheduler
+from common.utils import allocate_id, setup_logging
+from stages.story_generator import generate_story, status_listener
+from stages.warm_up import is_warm, warm_up
 
-app = FastAPI()
+
+def run_story_job(params, emit):
+    """Job queue handler: run one story and forward its stage updates to emit"""
+    start_time = time.time()
+    ensure_directory_exists(os.path.dirname(params["log_path"]))
+    logger = setup_logging(params["log_path"])
+    logger.info("Application started.")
+
+    token = status_listener.set(emit)
+    try:
+        return generate_story(**params["story"])
+    finally:
+        status_listener.reset(token)
+        total_time = time.time() - start_time
+        logger.info(f"Total time taken: {total_time} seconds")
+
+
+job_queue = JobQueue(run_story_job)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Loads and exercises the models in the background instead of in the first
+    # story; health checks are answered meanwhile
+    get_work_scheduler().submit(warm_up, kind="cpu")
+    # Picks up jobs that were queued or interrupted before a restart
+    job_queue.start()
+    yield
+    job_queue.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -41,7 +81,32 @@ def ensure_directory_exists(path: str):
     os.makedirs(path, exist_ok=True)
 
 
-@app.get("/stories")
+def get_request_key(query, web, page_count, country_code):
+    """Key shared by requests that would produce the same story"""
+    normalized = {
+        "query": " ".join(query.lower().split()),
+        "web": (web or "").strip().lower(),
+        "page_count": page_count,
+        "country_code": (country_code or "").strip().lower(),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def get_job_summary(job_id):
+    job = job_queue.get(job_id, include_result=False)
+    return {
+        "job_id": job_id,
+        "run_id": job["params"]["run_id"],
+        "status": job["status"],
+    }
+
+
+def find_run_directory(run_id: int) -> Optional[str]:
+    matches = sorted(glob.glob(os.path.join("results", f"{run_id}_*")))
+    return matches[0] if matches else None
+
+
+@app.get("/stories", status_code=202)
 def get_stories(
     request: Request,
     query: Optional[str] = Query(
@@ -56,54 +121,122 @@ def get_stories(
     country_code: Optional[str] = Query(
         "sg", description="Country code to search from"
     ),
+    run_id: Optional[int] = Query(
+        None, ge=0, description="Resume an earlier run from its last checkpoint"
+    ),
 ) -> Any:
-
-    start_time = time.time()
-    try:
-        print("web", web)
-        print("page_count", page_count)
-        # query = "Pros and cons of homeschooling statistics"
-        # query = "AI is a threat or not"
-        # query = "Best value phones in 2025"
-        query = query.strip()
-        file_name = re.sub(r"[^a-zA-Z0-9\s]", "", query)
-        # id = 72
-        id = load_id()
+    """Queue a story run and return its job id without waiting for it"""
+    print("web", web)
+    print("page_count", page_count)
+    # query = "Pros and cons of homeschooling statistics"
+    # query = "AI is a threat or not"
+    # query = "Best value phones in 2025"
+    query = query.strip()
+
+    file_name = re.sub(r"[^a-zA-Z0-9\s]", "", query)
+    # id = 72
+    if run_id is not None:
+        file_path = find_run_directory(run_id)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="Run not found")
+        # A resume joins one of the same run that is still queued or running,
+        # so two jobs never write to the same results folder
+        dedupe_key = f"resume:{run_id}"
+        reuse_window = 0
+        file_name = os.path.basename(file_path)
+        id = run_id
+    else:
+        # Anything else joins an identical recent job
+        dedupe_key = get_request_key(query, web, page_count, country_code)
+        reuse_window = JOB_CONFIGS["RESULT_REUSE_SECONDS"]
+        existing_job_id = job_queue.find_duplicate(dedupe_key, reuse_window)
+        if existing_job_id is not None:
+            return get_job_summary(existing_job_id)
+
+        id = allocate_id()
         file_name = f"{id}_{file_name}"
-        unique_id = generate_unique_id(file_name)
-        print("file_name", file_name)
         file_path = os.path.join("", f"results/{file_name}")
-        save_id(id + 1)
-        ensure_directory_exists(file_path)
-
-        # web = "pewresearch.org" "yougov.co.uk"
-        # page_count = 5
-        iterations = 1
-        search_result_file = f"{file_path}/google_search_results.csv"
-        output_path = f"{file_path}/story.html"
-        results_path = f"{file_path}/JsonOutputs"
-        log_path = f"{file_path}/logs_{unique_id}.log"
-
-        global LOGGER
-        LOGGER = setup_logging(log_path)
-        LOGGER.info("Application started.")
-
-        results = generate_story(
-            search_query=query,
-            web=web,
-            page_count=page_count,
-            iterations=iterations,
-            search_result_file=search_result_file,
-            output_path=output_path,
-            results_path=results_path,
-            country_code=country_code,
-        )
-        file_path = os.path.join("", output_path)
-
-        # Serve the HTML file
-        return results
-
-    finally:
-        save_id(id + 1)
-        total_time = time.time() - start_time
-        LOGGER.info(f"Total time taken: {total_time} seconds")
+    unique_id = generate_unique_id(file_name)
+    print("file_name", file_name)
+
+    # web = "pewresearch.org" "yougov.co.uk"
+    # page_count = 5
+    iterations = 1
+    job_id, _ = job_queue.enqueue(
+        {
+            "run_id": id,
+            "log_path": f"{file_path}/logs_{unique_id}.log",
+            "story": {
+                "search_query": query,
+                "web": web,
+                "page_count": page_count,
+                "iterations": iterations,
+                "article_store_path": f"{file_path}/articles.sqlite3",
+                "output_path": f"{file_path}/story.html",
+                "results_path": f"{file_path}/JsonOutputs",
+                "country_code": country_code,
+            },
+        },
+        dedupe_key=dedupe_key,
+        reuse_window=reuse_window,
+    )
+    return get_job_summary(job_id)
+
+
+@app.get("/stories/{job_id}")
+def get_story(job_id: str) -> Any:
+    """Return a story job's status, and its result once it has succeeded"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/stories/{job_id}/events")
+async def get_story_events(job_id: str, request: Request):
+    """Stream a story job's stage updates as server-sent events"""
+    # Job queue calls block on SQLite, so they run off the event loop
+    if await asyncio.to_thread(job_queue.get, job_id, False) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    last_event_id = request.headers.get("last-event-id", "")
+    after_seq = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def event_stream():
+        nonlocal after_seq
+        while True:
+            # Read the status first: finished jobs have no events still to come
+            job = await asyncio.to_thread(job_queue.get, job_id, False)
+            status = job["status"]
+            events = await asyncio.to_thread(job_queue.get_events, job_id, after_seq)
+            for seq, message in events:
+                after_seq = seq
+                data = json.dumps({"message": message})
+                yield f"id: {seq}\nevent: status\ndata: {data}\n\n"
+
+            if status in FINISHED_STATUSES:
+                yield f"event: done\ndata: {json.dumps({'status': status})}\n\n"
+                break
+            if await request.is_disconnected():
+                break
+            await asyncio.sleep(JOB_CONFIGS["EVENT_POLL_INTERVAL_SECONDS"])
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/health")
+def get_health():
+    """Liveness check; answers while the models are still warming up"""
+    return {"status": "ok", "version": VERSION, "models_warm": is_warm()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    LLM usage, latency and cost per stage and model, and worker pool load,
+    for Prometheus
+    """
+    return PlainTextResponse(
+        get_metrics_registry().render() + get_work_scheduler().render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
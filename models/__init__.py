@@ -27,6 +27,9 @@ from .models import (  # Enums; Base Models; Data Fact Models; Validation Models
     GroupedFacts,
     OrderedDataFactWithMetaData,
     Overview,
+    PackedDataFacts,
+    PackedDataFactVisData,
+    PackedValidationOutput,
     ParagraphWithScore,
     SearchQueryList,
     Story,
@@ -72,6 +75,10 @@ __all__ = [
     "ArticleDataFactVisDataMetaOrder",
     "ArticleVisRecommendation",
     "ArticleVisRecommendationFeedback",
+    # Packed Request Models
+    "PackedDataFacts",
+    "PackedValidationOutput",
+    "PackedDataFactVisData",
     # Story Models
     "DataStoryPiece",
     "Story",
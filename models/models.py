@@ -261,6 +261,51 @@ class ArticleDataFactVisData(BaseModel):
     )
 
 
+class PackedDataFactsItem(BaseModel):
+    """Data facts for one packed work item."""
+
+    item_id: str = Field(description="The id of the work item.")
+    result: ArticleDataFacts = Field(description="The result for this item.")
+
+
+class PackedDataFacts(BaseModel):
+    """Data facts for several packed work items, keyed by item id."""
+
+    items: List[PackedDataFactsItem] = Field(
+        description="One entry per work item in the request."
+    )
+
+
+class PackedValidationItem(BaseModel):
+    """Validation output for one packed work item."""
+
+    item_id: str = Field(description="The id of the work item.")
+    result: ValidationOutput = Field(description="The result for this item.")
+
+
+class PackedValidationOutput(BaseModel):
+    """Validation output for several packed work items, keyed by item id."""
+
+    items: List[PackedValidationItem] = Field(
+        description="One entry per work item in the request."
+    )
+
+
+class PackedDataFactVisDataItem(BaseModel):
+    """Refined data facts for one packed work item."""
+
+    item_id: str = Field(description="The id of the work item.")
+    result: ArticleDataFactVisData = Field(description="The result for this item.")
+
+
+class PackedDataFactVisData(BaseModel):
+    """Refined data facts for several packed work items, keyed by item id."""
+
+    items: List[PackedDataFactVisDataItem] = Field(
+        description="One entry per work item in the request."
+    )
+
+
 class ArticleDataFactVisDataMeta(BaseModel):
     """Data model for data facts extracted from an article."""
 
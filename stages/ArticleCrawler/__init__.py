@@ -1,3 +1,9 @@
-from .article_crawler import collect_search_results, generate_search_query
+from .article_crawler import (
+    collect_search_results_async,
+    generate_search_query,
+)
 
-__all__ = ["generate_search_query", "collect_search_results"]
+__all__ = [
+    "generate_search_query",
+    "collect_search_results_async",
+]
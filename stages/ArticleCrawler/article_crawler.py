@@ -1,13 +1,16 @@
-import glob
+import asyncio
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
 
-import pandas as pd
-from common.config import PROMPTS
+from common.config import CRAWLER_CONFIGS, PROMPTS
 from common.gpt_helper import GPTHelper
+from common.llm_policy import load_json_answer
+from common.prompt_builder import build_user_prompt
 from common.utils import console, write_to_json
 from common.utils.timing_logger import LOGGER, log_execution_time
-from crawler.search_processor import get_google_search_results
+from crawler.article_store import ArticleStore
+from crawler.http_client import AsyncCrawler
+from crawler.search_processor import get_google_search_results_async
 from models.models import SearchQueryList
 
 gpt_helper = GPTHelper()
@@ -18,101 +21,97 @@ def generate_search_query(search_query):
 
     system_prompt = PROMPTS["GENERATE_SEARCH_QUERIES"]
 
-    user_prompt = f"""
-    
-    ####
-    {search_query}
-    ####
-    
-    """
+    user_prompt = build_user_prompt(("####", search_query))
     console.print("[bold yellow]Generating search queries...[/bold yellow]")
     queries = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=SearchQueryList
     )
     console.print("[bold green]Generating search queries completed![/bold green]")
-    new_queries = json.loads(queries)
+    new_queries = load_json_answer(queries, "Generate search query")
     new_queries["search_queries"].append(search_query)
     return new_queries
 
 
-@log_execution_time
-def consolidate_unique_articles(directory, output_filename="unique_articles.csv"):
-
-    # Collect all the CSV files in the specified directory
-    csv_files = glob.glob(f"{directory}/google_search_results_*.csv")
-
-    all_data = []
-
-    # Load each CSV file and append its data to the list
-    for file in csv_files:
-        try:
-            data = pd.read_csv(file)
-            all_data.append(data)
-        except Exception as e:
-            print(f"Error reading {file}: {e}")
-
-    # Combine all the data into a single DataFrame
-    combined_data = pd.concat(all_data, ignore_index=True)
-
-    # Drop duplicates based on the 'Link' column
-    unique_data = combined_data.drop_duplicates(subset="Link", keep="first")
-
-    # Drop rows where 'Page_Content' is empty or NaN
-    unique_data = unique_data.dropna(subset=["Page_Content"])
-    # unique_data = unique_data[unique_data["Page_Content"].str.strip() != ""]
-    unique_data = unique_data[
-        (unique_data["Page_Content"].str.strip() != "")
-        & (unique_data["Page_Content"].str.strip() != "[]")
-    ]
-
-    unique_data["id"] = range(len(unique_data))
+async def crawl_search_queries(
+    search_queries,
+    web,
+    num_results,
+    store,
+    country_code,
+    on_article=None,
+    request_limit=None,
+):
+    """Run every search query against one shared crawler and connection pool"""
+    # Controlled parallelism
+    query_limit = asyncio.Semaphore(CRAWLER_CONFIGS["MAX_CONCURRENT_QUERIES"])
+
+    async def process_query(q, i, crawler):
+        async with query_limit:
+            try:
+                qr = f"site:{web} {q}"
+                await get_google_search_results_async(
+                    qr,
+                    crawler,
+                    store,
+                    query_index=i,
+                    num_results=num_results,
+                    country_code=country_code,
+                    on_article=on_article,
+                )
+                print(f"Completed query {i}: {q}")
+            except Exception as e:
+                LOGGER.error(f"Failed query {q}: {str(e)}")
+                print(f"Failed query {i}: {q}")
 
-    # Save the unique data to a new CSV file
-    unique_data.to_csv(output_filename, index=False)
-    console.print(f"Unique articles saved to {output_filename}")
+    async with AsyncCrawler(global_limit=request_limit) as crawler:
+        await asyncio.gather(
+            *(process_query(q, i, crawler) for i, q in enumerate(search_queries))
+        )
 
 
 @log_execution_time
-def collect_search_results(
+async def collect_search_results_async(
     query,
     web,
     num_results=1,
-    csv_filename="google_search_results.csv",
+    store_path="articles.sqlite3",
     country_code="sg",
+    on_article=None,
+    request_limit=None,
 ):
-    queries = generate_search_query(query)
-    directory = csv_filename.rsplit("/", 1)[0]
-    write_to_json(queries, directory, "queries.json")
+    """
+    Search for the query and its generated variants and crawl the results.
 
-    def process_query(q, i):
-        try:
-            new_file_path = f"{directory}/google_search_results_{i}.csv"
-            qr = f"site:{web} {q}"
-            get_google_search_results(
-                qr,
-                num_results=num_results,
-                csv_filename=new_file_path,
-                country_code=country_code,
-            )
-            return True
-        except Exception as e:
-            LOGGER.error(f"Failed query {q}: {str(e)}")
-            return False
+    Args:
+        on_article (callable): Awaited as on_article(article_id, article) for
+            every new article as soon as it is stored
+        request_limit (asyncio.Semaphore): Shared cap on in-flight page fetches
 
-    # Controlled parallelism
-    with ThreadPoolExecutor(max_workers=10) as executor:  # Limit concurrency
-        futures = {
-            executor.submit(process_query, q, i): (i, q)
-            for i, q in enumerate(queries["search_queries"])
-        }
-
-        # Monitor progress
-        for future in as_completed(futures):
-            i, q = futures[future]
-            if future.result():
-                print(f"Completed query {i}: {q}")
-            else:
-                print(f"Failed query {i}: {q}")
+    Returns:
+        tuple: (ArticleStore, queries)
+    """
+    queries = await asyncio.to_thread(generate_search_query, query)
+    directory = os.path.dirname(store_path) or "."
+    write_to_json(queries, directory, "queries.json")
+
+    store = ArticleStore(store_path)
+    try:
+        # A rerun replaces whatever an interrupted earlier crawl left behind
+        store.clear()
+        await crawl_search_queries(
+            queries["search_queries"],
+            web,
+            num_results,
+            store,
+            country_code,
+            on_article=on_article,
+            request_limit=request_limit,
+        )
+    except BaseException:
+        # The caller only gets the store, and closes it, when the crawl succeeds
+        store.close()
+        raise
+
+    console.print(f"Unique articles saved to {store_path}")
+    return store, queries
 
-    consolidate_unique_articles(directory, csv_filename)
-    return
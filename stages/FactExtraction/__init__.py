@@ -1,15 +1,15 @@
 from .fact_extraction import (
-    extract_and_filter_paragraphs,
-    get_data_facts,
-    get_data_values,
-    refine_data,
-    validate_data_extraction,
+    extract_and_filter_paragraphs_async,
+    get_data_facts_async,
+    refine_data_async,
+    stream_data_values_async,
+    validate_data_extraction_async,
 )
 
 __all__ = [
-    "extract_and_filter_paragraphs",
-    "get_data_facts",
-    "get_data_values",
-    "validate_data_extraction",
-    "refine_data",
+    "extract_and_filter_paragraphs_async",
+    "get_data_facts_async",
+    "validate_data_extraction_async",
+    "refine_data_async",
+    "stream_data_values_async",
 ]
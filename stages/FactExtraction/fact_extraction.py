@@ -1,21 +1,49 @@
-import concurrent.futures
+import asyncio
 import json
 from typing import List
 
-import tiktoken
 from common.config import MODEL_CONFIG, PROMPTS, THEME_CONFIGS
-from common.gpt_helper import GPTHelper
+from common.async_gpt_helper import AsyncGPTHelper
+from common.prompt_builder import build_user_prompt, to_prompt_text
+from common.request_packer import RequestPacker
 from common.utils import console
 from common.utils.timing_logger import LOGGER, log_execution_time
+from common.utils.tokens import (
+    count_prompt_tokens,
+    count_tokens,
+    count_tokens_batch,
+    pack_by_tokens,
+)
 from common.utils.utils import check_is_date, format_date, safe_convert_to_list
 from models.models import (
     Article_v2,
     ArticleDataFacts,
     ArticleDataFactVisData,
+    PackedDataFacts,
+    PackedDataFactVisData,
+    PackedValidationOutput,
     ValidationOutput,
 )
 
-gpt_helper = GPTHelper()
+async_gpt_helper = AsyncGPTHelper()
+
+# Requests from different articles share these packers in the async pipeline
+data_facts_packer = RequestPacker(
+    async_gpt_helper, PROMPTS["EXTRACT_FACTS"], ArticleDataFacts, PackedDataFacts
+)
+validation_packer = RequestPacker(
+    async_gpt_helper,
+    PROMPTS["VALIDATE_DATA_EXTRACTION"],
+    ValidationOutput,
+    PackedValidationOutput,
+    temperature=0.7,
+)
+refine_packer = RequestPacker(
+    async_gpt_helper,
+    PROMPTS["REFINE_DATA_EXTRACTION"],
+    ArticleDataFactVisData,
+    PackedDataFactVisData,
+)
 
 MAX_OUTPUT_TOKENS = MODEL_CONFIG["MAX_OUTPUT_TOKENS"]
 TOKEN_SAFETY_MARGIN = MODEL_CONFIG["TOKEN_SAFETY_MARGIN"]
@@ -23,28 +51,24 @@ MAX_POSSIBLE_OUTPUT_TOKENS = MAX_OUTPUT_TOKENS - TOKEN_SAFETY_MARGIN
 THEME_COLORS = THEME_CONFIGS["COLORS"]
 
 
-def count_tokens(text: str) -> int:
-    encoding = tiktoken.get_encoding("cl100k_base")  # Compatible with GPT-4o
-    return len(encoding.encode(text))
-
-
 def prepare_chunks(article_text):
-    try:
-        paragraphs = safe_convert_to_list(article_text)
-    except:
-        paragraphs = article_text.split("\n")
-
-    chunks: List[str] = []
-    current_chunk = ""
-    for paragraph in paragraphs:
-        if count_tokens(current_chunk + paragraph) < MAX_POSSIBLE_OUTPUT_TOKENS - 500:
-            current_chunk += paragraph + "\n"
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = paragraph + "\n"
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    return chunks
+    # The article store hands over real lists; older inputs are stringified lists
+    if isinstance(article_text, list):
+        paragraphs = article_text
+    else:
+        try:
+            paragraphs = safe_convert_to_list(article_text)
+        except:
+            paragraphs = article_text.split("\n")
+
+    # Each paragraph is tokenized once; chunks are joined with newlines
+    groups = pack_by_tokens(
+        paragraphs,
+        count_tokens_batch(paragraphs),
+        MAX_POSSIBLE_OUTPUT_TOKENS - 500,
+    )
+    chunks: List[str] = ["\n".join(group).strip() for group in groups]
+    return [chunk for chunk in chunks if chunk]
 
 
 def select_date(original_date, extracted_date):
@@ -55,139 +79,128 @@ def select_date(original_date, extracted_date):
     return "Unknown"
 
 
-@log_execution_time
-def extract_and_filter_paragraphs(id, title, date, article_text, search_query):
-    system_prompt = PROMPTS["EXTRACT_FILTER_PARA"]
+# The search query is shared by every article of a run, so it goes first
+EXTRACT_FILTER_PARA_USER_PROMPT = """SEARCH QUERY:
+{search_query}
 
-    user_prompt = """
-    RAW TITLE:
-    {title}
+RAW TITLE:
+{title}
 
-    RAW DATE:
-    {date}
+RAW DATE:
+{date}
 
-    DOCUMENT INPUT:
-    {article_text}
+DOCUMENT INPUT:
+{article_text}"""
 
-    SEARCH QUERY:
-    {search_query}
-    """
 
-    formatted_user_prompt = user_prompt.format(
-        title=title, date=date, article_text=article_text, search_query=search_query
-    )
+def parse_paragraph_chunk(id, title, result, chunk_number):
+    if result is None:
+        return None
 
-    total_tokens = count_tokens(formatted_user_prompt) + count_tokens(system_prompt)
+    try:
+        result = json.loads(result)
+        result["chunk_number"] = chunk_number
+        return result
+    except Exception as e:
+        LOGGER.error(f"{id} - {title} - JSON parsing failed {e}")
+        console.print(
+            f"[bold red]Error: {id} - {title} - Failed to parse JSON response {e}[/bold red]"
+        )
+        return None
 
-    def process_chunk(text_chunk: str, chunk_number: int):
-        user_prompt_chunk = user_prompt.format(
-            title=title, date=date, article_text=text_chunk, search_query=search_query
+
+def parse_single_pass_paragraphs(id, title, result):
+    try:
+        obj = json.loads(result)
+        console.print(
+            f"[bold green]{id} - {title} - extract_and_filter_paragraphs Processing Completed![/bold green]"
         )
-        result = gpt_helper.ask_gpt_with_response_format(
-            system_prompt, user_prompt_chunk, response_format=Article_v2
+        LOGGER.info(f"{id} - {title} - extract_and_filter_paragraphs Processing Completed")
+        return obj
+    except Exception as e:
+        console.print(
+            f"[bold red]Error: {id} - {title} - Failed to parse JSON response {e}[/bold red]"
         )
+        LOGGER.error(f"{id} - {title} - JSON parsing failed")
+        return None
 
-        if result is None:
-            return None
 
-        try:
-            result = json.loads(result)
-            result["chunk_number"] = chunk_number
-            return result
-        except Exception as e:
-            LOGGER.error(f"{id} - {title} - JSON parsing failed {e}")
-            console.print(
-                f"[bold red]Error: {id} - {title} - Failed to parse JSON response {e}[/bold red]"
-            )
-            return None
+def combine_paragraph_chunks(id, title, chunk_results):
+    all_filtered_paragraphs = []
+    retrieved_title = None
+    retrieved_date = None
+    for result in chunk_results:
+        if result:
+            if result.get("chunk_number") == 0:
+                retrieved_title = result.get("title")
+                retrieved_date = result.get("date")
+            for para in result.get("paragraphs", []):
+                all_filtered_paragraphs.append(para)
 
-    final_result = None
+    console.print(
+        f"[bold green]{id} - {title} - extract_and_filter_paragraphs Processing completed successfully![/bold green]"
+    )
+    return {
+        "title": retrieved_title,
+        "date": retrieved_date,
+        "paragraphs": all_filtered_paragraphs,
+    }
 
-    if total_tokens < MAX_POSSIBLE_OUTPUT_TOKENS:
-        console.print(
-            f"[bold yellow]{id} - {title} - Processing document in optimized single pass...[/bold yellow]"
+
+@log_execution_time
+async def extract_and_filter_paragraphs_async(
+    id, title, date, article_text, search_query
+):
+    system_prompt = PROMPTS["EXTRACT_FILTER_PARA"]
+
+    formatted_user_prompt = EXTRACT_FILTER_PARA_USER_PROMPT.format(
+        title=title,
+        date=date,
+        article_text=to_prompt_text(article_text),
+        search_query=search_query,
+    )
+
+    total_tokens = count_tokens(formatted_user_prompt) + count_prompt_tokens(
+        system_prompt
+    )
+
+    async def process_chunk(text_chunk: str, chunk_number: int):
+        user_prompt_chunk = EXTRACT_FILTER_PARA_USER_PROMPT.format(
+            title=title, date=date, article_text=text_chunk, search_query=search_query
+        )
+        result = await async_gpt_helper.ask_gpt_with_response_format(
+            system_prompt, user_prompt_chunk, response_format=Article_v2
         )
-        LOGGER.info(f"{id} - {title} - extract_and_filter_paragraphs started")
+        return parse_paragraph_chunk(id, title, result, chunk_number)
 
-        result = gpt_helper.ask_gpt_with_response_format(
+    console.print(
+        f"[bold yellow]{id} - {title} - Processing document in optimized single pass...[/bold yellow]"
+    )
+    LOGGER.info(f"{id} - {title} - extract_and_filter_paragraphs started")
+
+    if total_tokens < MAX_POSSIBLE_OUTPUT_TOKENS:
+        result = await async_gpt_helper.ask_gpt_with_response_format(
             system_prompt, formatted_user_prompt, response_format=Article_v2
         )
-        try:
-            obj = json.loads(result)
-            console.print(
-                f"[bold green]{id} - {title} - extract_and_filter_paragraphs Processing Completed![/bold green]"
-            )
-            LOGGER.info(
-                f"{id} - {title} - extract_and_filter_paragraphs Processing Completed"
-            )
-            final_result = obj
-        except Exception as e:
-            console.print(
-                f"[bold red]Error: {id} - {title} - Failed to parse JSON response {e}[/bold red]"
-            )
-            LOGGER.error(f"{id} - {title} - JSON parsing failed")
+        final_result = parse_single_pass_paragraphs(id, title, result)
+        if final_result is None:
             return None
     else:
-        console.print(
-            f"[bold yellow]{id} - {title} - Processing document in optimized single pass...[/bold yellow]"
-        )
-        LOGGER.info(f"{id} - {title} - extract_and_filter_paragraphs started")
-
         chunks = prepare_chunks(article_text)
-        all_filtered_paragraphs = []
-        retrieved_title = None
-        retrieved_date = None
-        try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = []
-                for i, chunk in enumerate(chunks):
-                    futures.append(executor.submit(process_chunk, chunk, i))
-
-                for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    if result:
-                        if result.get("chunk_number") == 0:
-                            retrieved_title = result.get("title")
-                            retrieved_date = result.get("date")
-                        for para in result.get("paragraphs", []):
-                            all_filtered_paragraphs.append(para)
-
-            final_result = {
-                "title": retrieved_title,
-                "date": retrieved_date,
-                "paragraphs": all_filtered_paragraphs,
-            }
-            console.print(
-                f"[bold green]{id} - {title} - extract_and_filter_paragraphs Processing completed successfully![/bold green]"
-            )
-        except Exception as e:
-            console.print(
-                f"[bold red]Error: {id} - {title} - Failed to parse JSON response {e}[/bold red]"
-            )
-            LOGGER.error(f"{id} - {title} - JSON parsing failed")
-            return None
+        chunk_results = await asyncio.gather(
+            *(process_chunk(chunk, i) for i, chunk in enumerate(chunks))
+        )
+        final_result = combine_paragraph_chunks(id, title, chunk_results)
 
     final_result["date"] = select_date(date, final_result["date"])
     return final_result
 
 
-@log_execution_time
-def get_data_facts(id, title, filtered_paragraphs):
-    system_prompt = PROMPTS["EXTRACT_FACTS"]
-
-    user_prompt = f"""
-    ####
-    {filtered_paragraphs["paragraphs"]}
-    ####
-    """
+def build_data_facts_prompt(filtered_paragraphs):
+    return build_user_prompt(("####", filtered_paragraphs["paragraphs"]))
 
-    console.print(
-        f"[bold yellow]{id} - {title} - Extracting Data Facts...[/bold yellow]"
-    )
-    data_facts_with_para = gpt_helper.ask_gpt_with_response_format(
-        system_prompt, user_prompt, response_format=ArticleDataFacts
-    )
 
+def parse_data_facts(id, title, data_facts_with_para):
     if data_facts_with_para is None:
         console.print(
             f"[bold red]{id} - {title} - Fact extraction failed. No relevant fact found.[/bold red]"
@@ -211,65 +224,66 @@ def get_data_facts(id, title, filtered_paragraphs):
         return None
 
 
-def remove_facts_with_empty_vis(data):
-    data["data_facts_with_vis_data"] = [
-        {**item, "facts": [fact for fact in item["facts"] if fact.get("vis_data")]}
-        for item in data.get("data_facts_with_vis_data", [])
-    ]
-
-    data["data_facts_with_vis_data"] = [
-        item for item in data["data_facts_with_vis_data"] if item["facts"]
-    ]
+@log_execution_time
+async def get_data_facts_async(id, title, filtered_paragraphs):
+    user_prompt = build_data_facts_prompt(filtered_paragraphs)
 
-    return data if data["data_facts_with_vis_data"] else None
+    console.print(
+        f"[bold yellow]{id} - {title} - Extracting Data Facts...[/bold yellow]"
+    )
+    data_facts_with_para = await data_facts_packer.submit(user_prompt)
+    return parse_data_facts(id, title, data_facts_with_para)
 
 
 # -------------- Start: Get Data Values - all para ----------
-@log_execution_time
-def get_data_values(id, title, date, data_fact_with_related_sentence, article):
-    system_prompt = PROMPTS["DATA_EXTRACTION"]
+def build_data_values_prompt(date, data_fact_with_related_sentence, article):
+    # The article is larger and more stable than the facts, so it goes first
+    return build_user_prompt(
+        ("****", f"Published date: {date}\n\n{to_prompt_text(article)}"),
+        ("####", data_fact_with_related_sentence),
+    )
 
-    user_prompt = f"""
-        ####
-        {data_fact_with_related_sentence}
-        ####
 
-        ****
-        Published date: {date}
-        
-        {article}
-        ****
-        """
+async def stream_data_values_async(
+    id, title, date, data_fact_with_related_sentence, article
+):
+    """
+    Extract the data values of an article, yielding each data fact with its
+    vis data as soon as the model has written it, so validation can start
+    before the whole response is in
+    """
+    system_prompt = PROMPTS["DATA_EXTRACTION"]
+    user_prompt = build_data_values_prompt(
+        date, data_fact_with_related_sentence, article
+    )
 
     console.print(
-        f"[bold yellow]{id} - {title} - Extracting Data Values...[/bold yellow]"
-    )
-    data_fact_with_vis_data = gpt_helper.ask_gpt_with_response_format(
-        system_prompt, user_prompt, response_format=ArticleDataFactVisData
+        f"[bold yellow]{id} - {title} - Streaming Data Values...[/bold yellow]"
     )
-
-    if data_fact_with_vis_data is None:
+    count = 0
+    async for item in async_gpt_helper.stream_response_format_items(
+        system_prompt,
+        user_prompt,
+        "data_facts_with_vis_data",
+        response_format=ArticleDataFactVisData,
+    ):
+        # Drop facts without vis data, and items left with no facts
+        facts = [fact for fact in item.get("facts", []) if fact.get("vis_data")]
+        if facts:
+            count += 1
+            yield {**item, "facts": facts}
+
+    if count:
+        console.print(
+            f"[bold green]{id} - {title} - Extracting Data Values Completed![/bold green]"
+        )
+    else:
         console.print(
             f"[bold red]{id} - {title} - Data value extraction failed. No relevant data values found.[/bold red]"
         )
         LOGGER.error(
             f"{id} - {title} - Data value extraction failed. No relevant data values found."
         )
-        return None
-
-    try:
-        obj = json.loads(data_fact_with_vis_data)
-        console.print(
-            f"[bold green]{id} - {title} - Extracting Data Values Completed![/bold green]"
-        )
-        removed_empty_vis = remove_facts_with_empty_vis(obj)
-        return removed_empty_vis
-    except Exception as e:
-        console.print(
-            f"[bold red]{id} - {title} - Failed to parse the response into JSON.[/bold red] {e}"
-        )
-        LOGGER.error(f"{id} - {title} - Failed to parse the response into JSON. {e}")
-        return None
 
 
 def update_has_error(data):
@@ -283,25 +297,11 @@ def update_has_error(data):
     return data
 
 
-#  Better with temperature 0.7
-@log_execution_time
-def validate_data_extraction(id, title, extracted_data):
-    system_prompt = PROMPTS["VALIDATE_DATA_EXTRACTION"]
+def build_validation_prompt(extracted_data):
+    return build_user_prompt(("####", extracted_data))
 
-    user_prompt = f"""
-    ####
-    {extracted_data}
-    ####
-
-    """
-
-    console.print(
-        f"[bold yellow]{id} - {title} - Validating Extracted Data...[/bold yellow]"
-    )
-    data_errors = gpt_helper.ask_gpt_with_response_format(
-        system_prompt, user_prompt, temperature=0.7, response_format=ValidationOutput
-    )
 
+def parse_validation(id, title, data_errors):
     if data_errors is None:
         console.print(f"[bold red]{id} - {title} - Data validation failed.[/bold red]")
         LOGGER.error(f"{id} - {title} - Data validation failed.")
@@ -322,22 +322,23 @@ def validate_data_extraction(id, title, extracted_data):
         return None
 
 
+#  Better with temperature 0.7
 @log_execution_time
-def refine_data(id, title, vis_data_erros):
-    system_prompt = PROMPTS["REFINE_DATA_EXTRACTION"]
+async def validate_data_extraction_async(id, title, extracted_data):
+    user_prompt = build_validation_prompt(extracted_data)
 
-    user_prompt = f"""
-    ####
-    {vis_data_erros}
-    ####
-    """
     console.print(
-        f"[bold yellow]{id} - {title} - Refining Extracted Data...[/bold yellow]"
-    )
-    refined_data = gpt_helper.ask_gpt_with_response_format(
-        system_prompt, user_prompt, response_format=ArticleDataFactVisData
+        f"[bold yellow]{id} - {title} - Validating Extracted Data...[/bold yellow]"
     )
+    data_errors = await validation_packer.submit(user_prompt)
+    return parse_validation(id, title, data_errors)
+
+
+def build_refine_prompt(vis_data_erros):
+    return build_user_prompt(("####", vis_data_erros))
+
 
+def parse_refined_data(id, title, refined_data):
     if refined_data is None:
         console.print(f"[bold red]{id} - {title} - Refining failed.[/bold red]")
         LOGGER.error(f"{id} - {title} - Refining failed.")
@@ -355,3 +356,14 @@ def refine_data(id, title, vis_data_erros):
         )
         LOGGER.error(f"{id} - {title} - Failed to parse the response into JSON.")
         return None
+
+
+@log_execution_time
+async def refine_data_async(id, title, vis_data_erros):
+    user_prompt = build_refine_prompt(vis_data_erros)
+
+    console.print(
+        f"[bold yellow]{id} - {title} - Refining Extracted Data...[/bold yellow]"
+    )
+    refined_data = await refine_packer.submit(user_prompt)
+    return parse_refined_data(id, title, refined_data)
@@ -1,4 +1,5 @@
 from .clustering import cluster_facts
+from .dimension_reduction import fit_reference_reducer, warm_up_reducers
 from .fact_organization import (
     calculate_scores,
     clickbait_generation,
@@ -50,4 +51,6 @@ __all__ = [
     "fill_missing_entities",
     "handle_filling_data",
     "correct_merged_facts",
+    "fit_reference_reducer",
+    "warm_up_reducers",
 ]
@@ -1,59 +1,41 @@
 import math
 import re
 from collections import Counter, defaultdict
+from functools import lru_cache
 
 import numpy as np
-import pandas as pd
-import plotly.express as px
-import umap
 from common.config import CLUSTER_CONFIGS
 from common.gpt_helper import GPTHelper
 from common.utils import console
 from common.utils.timing_logger import LOGGER, log_execution_time
 from dotenv import load_dotenv
-from kneed import KneeLocator
-from nltk.corpus import stopwords
-from scipy.stats import entropy
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-from sklearn.metrics import davies_bouldin_score, silhouette_score
-from sklearn.mixture import GaussianMixture
-from sklearn.preprocessing import RobustScaler
+from joblib import Parallel, delayed
+
+from .dimension_reduction import reduce_embeddings
 
 load_dotenv()
 
 gpt_helper = GPTHelper()
 
-STOPWORDS = set(stopwords.words("english"))
+# Plotting, NLTK and scikit-learn are imported where they are used, so that
+# importing the pipeline stays fast; stages/warm_up.py loads them ahead of time
+
+
+@lru_cache(maxsize=None)
+def get_stopwords():
+    from nltk.corpus import stopwords
+
+    return set(stopwords.words("english"))
 
 
 def get_all_embeddings(texts):
-    embeddings = []
-    for text in texts:
-        try:
-            embedding = gpt_helper.get_embeddings(text)
-            embeddings.append(embedding)
-        except Exception as e:
-            console.print(f"Error getting embedding for text: {e}")
-            embeddings.append(np.zeros(1536))
-    return np.array(embeddings)
-
-
-def reduce_dimensions(X, method="pca"):
-    """Use PCA, t-SNE or UMAP for dimensionality reduction."""
-    if method == "pca":
-        pca = PCA(n_components=min(len(X), 10))
-        X = pca.fit_transform(X)
-    elif method == "tsne":
-        tsne = TSNE(n_components=2, random_state=42)
-        X = tsne.fit_transform(X)
-    elif method == "umap":
-        reducer = umap.UMAP(n_components=2, random_state=42)
-        X = reducer.fit_transform(X)
-    return X
+    return gpt_helper.get_embeddings_batch(texts)
 
 
 def plot_umap(embeddings_2d, labels, facts, file_path):
+    import pandas as pd
+    import plotly.express as px
+
     filename = f"{file_path}/umap_visualization.html"
     # Prepare hover text
     hover_texts = [
@@ -106,49 +88,86 @@ def get_k_value(num_facts):
     return assumed_clusters
 
 
-@log_execution_time
-def cluster_facts(facts, file_path, threshold=0.2):
-    texts = [d["fact_content"] for d in facts]
+def score_gaussian_mixture(X, k, covariance_type):
+    """Fit one candidate and return (negative log-likelihood, BIC)"""
+    from sklearn.mixture import GaussianMixture
 
-    console.print("[bold yellow]Getting Embeddings...[/bold yellow]")
-    X = get_all_embeddings(texts)
-    console.print("[bold green]Getting Embeddings Completed![/bold green]")
-
-    # Normalize & Reduce Dimensions using RobustScaler and UMAP
-    X = RobustScaler().fit_transform(X)  # Use RobustScaler instead of StandardScaler
-    X = reduce_dimensions(X, method="umap")  # Change method to 'pca', 'tsne', or 'umap'
-
-    console.print("[bold green]Getting Embeddings Completed![/bold green]")
-
-    # Finding Optimal k
-    # k_values = range(
-    #     2, max(CLUSTER_CONFIGS["MAX_CLUSTER_SIZE"], math.ceil(len(X) / 6) + 1)
-    # )
-
-    k_values = range(2, get_k_value(len(X)))
+    gmm = GaussianMixture(
+        n_components=k, covariance_type=covariance_type, random_state=42
+    )
+    gmm.fit(X)
+    return -gmm.score(X) * X.shape[0], gmm.bic(X)
 
-    neg_log_likelihoods, models = [], {}
 
-    for k in k_values:
-        console.print(f"k = {k}")
-        gmm = GaussianMixture(
-            n_components=k, covariance_type="full", random_state=42
-        )  # Try 'full' covariance type
-        gmm.fit(X)
-        total_log_likelihood = gmm.score(X) * X.shape[0]
-        neg_log_likelihoods.append(-total_log_likelihood)
-        models[k] = gmm
+def select_k(k_values, neg_log_likelihoods, bics, use_bic):
+    """Elbow of the negative log-likelihood curve, or the lowest BIC"""
+    if use_bic:
+        return k_values[int(np.argmin(bics))]
+    if len(k_values) < 3:
+        return None
+    from kneed import KneeLocator
 
     kneedle = KneeLocator(
         k_values, neg_log_likelihoods, curve="convex", direction="increasing"
     )
-    best_k = kneedle.elbow or min(k_values, key=lambda k: models[k].bic(X))
+    return kneedle.elbow
+
+
+def fit_best_gaussian_mixture(X):
+    """
+    Fit every candidate k, in parallel from GMM_PARALLEL_MIN_SIZE facts on,
+    and return the selected model.
+
+    Small and medium fact sets use full covariances and the elbow of the
+    negative log-likelihood curve; large ones use GMM_LARGE_SET_COVARIANCE
+    and the lowest BIC. The whole curve is always scored, so the choice does
+    not depend on how many fits run at once. Workers only return scores, and
+    the selected k is refitted with the same seed.
+    """
+    from sklearn.mixture import GaussianMixture
+
+    k_values = list(range(2, get_k_value(len(X))))
+    use_bic = len(X) >= CLUSTER_CONFIGS["GMM_LARGE_SET_SIZE"]
+    covariance_type = (
+        CLUSTER_CONFIGS["GMM_LARGE_SET_COVARIANCE"] if use_bic else "full"
+    )
+
+    console.print(f"k = {', '.join(str(k) for k in k_values)}")
+    if len(X) < CLUSTER_CONFIGS["GMM_PARALLEL_MIN_SIZE"]:
+        scores = [score_gaussian_mixture(X, k, covariance_type) for k in k_values]
+    else:
+        scores = Parallel(n_jobs=CLUSTER_CONFIGS["GMM_N_JOBS"])(
+            delayed(score_gaussian_mixture)(X, k, covariance_type) for k in k_values
+        )
+    neg_log_likelihoods = [neg_log_likelihood for neg_log_likelihood, _ in scores]
+    bics = [bic for _, bic in scores]
+
+    best_k = select_k(k_values, neg_log_likelihoods, bics, use_bic)
+    if best_k is None:
+        best_k = k_values[int(np.argmin(bics))]
 
     console.print(
         f"[bold green]Best number of clusters (k) selected: {best_k}[/bold green]"
     )
+    return GaussianMixture(
+        n_components=best_k, covariance_type=covariance_type, random_state=42
+    ).fit(X)
+
+
+@log_execution_time
+def cluster_facts(facts, file_path, threshold=0.2):
+    texts = [d["fact_content"] for d in facts]
 
-    final_gmm = models[best_k]
+    console.print("[bold yellow]Getting Embeddings...[/bold yellow]")
+    X = get_all_embeddings(texts)
+    console.print("[bold green]Getting Embeddings Completed![/bold green]")
+
+    # Normalize & Reduce Dimensions using RobustScaler and UMAP (PCA for small sets)
+    X = reduce_embeddings(X)
+
+    console.print("[bold green]Getting Embeddings Completed![/bold green]")
+
+    final_gmm = fit_best_gaussian_mixture(X)
     probabilities = final_gmm.predict_proba(X)
     labels = final_gmm.predict(X)
 
@@ -197,6 +216,9 @@ def cluster_facts(facts, file_path, threshold=0.2):
 
 
 def evaluate_clustering(X, labels, probabilities):
+    from scipy.stats import entropy
+    from sklearn.metrics import davies_bouldin_score, silhouette_score
+
     silhouette = silhouette_score(X, labels)
     db_score = davies_bouldin_score(X, labels)
     cluster_entropy = entropy(probabilities, axis=1).mean()
@@ -245,6 +267,6 @@ def summarize_clusters(X, labels, cluster_dict):
 
 def extract_keywords(facts, top_n=5):
     words = re.findall(r"\w+", " ".join(facts).lower()) if facts else []
-    filtered_words = [word for word in words if word not in STOPWORDS]
+    filtered_words = [word for word in words if word not in get_stopwords()]
     common_words = [word for word, _ in Counter(filtered_words).most_common(top_n)]
     return common_words
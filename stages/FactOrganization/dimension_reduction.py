@@ -0,0 +1,184 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import joblib
+import numpy as np
+from common.config import CLUSTER_CONFIGS, MODEL_CONFIG
+from common.embedding_store import get_embedding_store
+from common.utils.timing_logger import LOGGER
+
+# umap and scikit-learn are imported on first use: importing umap alone loads
+# numba and takes seconds
+
+
+def build_umap(n_components=2):
+    import umap
+
+    random_state = CLUSTER_CONFIGS["UMAP_RANDOM_STATE"]
+    # UMAP runs single-threaded whenever it is seeded
+    return umap.UMAP(
+        n_components=n_components,
+        random_state=random_state,
+        n_jobs=1 if random_state is not None else -1,
+    )
+
+
+def reduce_dimensions(X, method="auto", n_components=None):
+    """
+    Use PCA, t-SNE or UMAP for dimensionality reduction.
+
+    "auto" uses 2-D PCA for sets smaller than UMAP_MIN_SIZE, where UMAP's
+    setup costs far more than the reduction itself, and UMAP otherwise.
+    """
+    if method == "auto":
+        if len(X) < CLUSTER_CONFIGS["UMAP_MIN_SIZE"]:
+            method, n_components = "pca", 2
+        else:
+            method = "umap"
+
+    if method == "pca":
+        from sklearn.decomposition import PCA
+
+        pca = PCA(n_components=min(len(X), n_components or 10))
+        X = pca.fit_transform(X)
+    elif method == "tsne":
+        from sklearn.manifold import TSNE
+
+        tsne = TSNE(n_components=n_components or 2, random_state=42)
+        X = tsne.fit_transform(X)
+    elif method == "umap":
+        X = build_umap(n_components or 2).fit_transform(X)
+    return X
+
+
+def reduce_embeddings(embeddings):
+    """
+    Scale and reduce a story's embeddings to 2-D for clustering, with the
+    reference reducer when there is one
+    """
+    reference = get_reference_reducer()
+    if reference is not None:
+        return reference.transform(np.asarray(embeddings))
+    from sklearn.preprocessing import RobustScaler
+
+    X = RobustScaler().fit_transform(embeddings)
+    return reduce_dimensions(X)
+
+
+def fit_reference_reducer(embeddings, path=CLUSTER_CONFIGS["UMAP_REFERENCE_PATH"]):
+    """
+    Fit the scaler and UMAP once on a reference corpus of embeddings and save
+    them, so later stories are transformed into the same space instead of
+    fitting UMAP each time
+    """
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import RobustScaler
+
+    reducer = make_pipeline(RobustScaler(), build_umap())
+    reducer.fit(np.asarray(embeddings))
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Written aside and swapped in, so readers never load a partial file
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            joblib.dump(
+                {"model": MODEL_CONFIG["EMBEDDING_MODEL"], "reducer": reducer},
+                temp_file,
+            )
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return reducer
+
+
+_reference_lock = threading.Lock()
+_reference_reducers = {}  # path: (modification time, reducer or None if rejected)
+
+
+def get_reference_reducer(path=CLUSTER_CONFIGS["UMAP_REFERENCE_PATH"]):
+    """
+    Return the saved reference reducer, or None if there is no usable one.
+
+    The result is cached by file modification time, a rejected file included,
+    and a file replaced by another process is loaded again, so a reducer
+    fitted while the server runs is picked up.
+    """
+    if not path:
+        return None
+    try:
+        modified_at = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _reference_lock:
+        cached = _reference_reducers.get(path)
+        if cached is not None and cached[0] == modified_at:
+            return cached[1]
+        saved = joblib.load(path)
+        reducer = saved["reducer"]
+        # Embeddings of another model live in a different space
+        if saved["model"] != MODEL_CONFIG["EMBEDDING_MODEL"]:
+            LOGGER.warning(
+                f"Ignoring UMAP reference reducer {path} fitted on {saved['model']}"
+            )
+            reducer = None
+        _reference_reducers[path] = (modified_at, reducer)
+        return reducer
+
+
+def warm_up_reducers():
+    """
+    Compile UMAP's numba kernels and load the reference reducer, so the first
+    story does not pay for them
+    """
+    start_time = time.perf_counter()
+    try:
+        data = np.random.default_rng(0).normal(size=(200, 8))
+        reducer = build_umap().fit(data)
+        reducer.transform(data[:10])
+        get_reference_reducer()
+    except Exception as e:
+        LOGGER.warning(f"UMAP warm-up failed: {e}")
+        return
+    LOGGER.info(f"Warmed up UMAP in {time.perf_counter() - start_time:.1f}s")
+
+
+def main():
+    """Fit the reference reducer on the embeddings collected by earlier stories"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--path", default=CLUSTER_CONFIGS["UMAP_REFERENCE_PATH"])
+    parser.add_argument(
+        "--max-samples",
+        type=int,
+        default=50000,
+        help="Fit on a random sample of at most this many embeddings",
+    )
+    args = parser.parse_args()
+
+    store = get_embedding_store()
+    if store is None:
+        parser.error("the embedding store is disabled or unavailable")
+    embeddings = store.vectors(MODEL_CONFIG["EMBEDDING_MODEL"])
+    if len(embeddings) < CLUSTER_CONFIGS["UMAP_MIN_SIZE"]:
+        parser.error(f"only {len(embeddings)} stored embeddings, too few to fit on")
+    if len(embeddings) > args.max_samples:
+        sample = np.random.default_rng(0).choice(
+            len(embeddings), args.max_samples, replace=False
+        )
+        embeddings = embeddings[np.sort(sample)]
+
+    start_time = time.perf_counter()
+    fit_reference_reducer(embeddings, args.path)
+    LOGGER.info(
+        f"Fitted UMAP reference reducer on {len(embeddings)} embeddings in "
+        f"{time.perf_counter() - start_time:.1f}s, saved to {args.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
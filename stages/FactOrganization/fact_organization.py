@@ -1,11 +1,13 @@
 import json
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from common.config import PROMPTS
+from common.scheduler import get_work_scheduler
 from common.gpt_helper import GPTHelper
-from common.utils import console
+from common.llm_policy import load_json_answer
+from common.prompt_builder import build_user_prompt
+from common.utils import console, cosine_similarities
 from common.utils.timing_logger import LOGGER, log_execution_time
 from fastapi.encoders import jsonable_encoder
 from models.models import (
@@ -27,7 +29,6 @@ from models.models import (
     MergedFacts,
     MergedFactsEntities,
 )
-from scipy import spatial
 
 gpt_helper = GPTHelper()
 
@@ -56,20 +57,11 @@ def structure_paragraphs(refined_data, article, link):
         6. **Review** the output to ensure all guidelines are met.
     """
 
-    user_prompt = f"""
-    ####
-    {article}
-    ####
-    
-    ****
-    {refined_data}
-    **** 
-    
-    $$$$
-    {link}
-    $$$$
-
-    """
+    user_prompt = build_user_prompt(
+        ("####", article),
+        ("****", refined_data),
+        ("$$$$", link),
+    )
     console.print(
         "[bold yellow]Structuring the paragraph with meta data...[/bold yellow]"
     )
@@ -134,62 +126,26 @@ def structure_paragraphs_with_meta_data(id, title, date, url, refined_data):
         return None
 
 
-def calculate_relatedness(query_embedding, paragraph):
-    relatedness_fn = lambda x, y: 1 - spatial.distance.cosine(x, y)
-    para_embedding = gpt_helper.get_embeddings(paragraph)
-    return relatedness_fn(query_embedding, para_embedding)
-
-
-def calc_relatedness(query_embedding, item_embedding):
-    relatedness_fn = lambda x, y: 1 - spatial.distance.cosine(x, y)
-    return relatedness_fn(query_embedding, item_embedding)
-
-
-def process_fact(fact, query_embedding):
-    try:
-        fact_embedding = gpt_helper.get_embeddings(fact["fact_content"])
-        fact["fact_score"] = calc_relatedness(query_embedding, fact_embedding)
-        return fact
-    except Exception as e:
-        console.print("[bold red]Error: Failed to process fact.[/bold red]")
-        LOGGER.error(e)
-        return None
-
-
-def process_item(item, query_embedding):
-    try:
-        paragraph_embedding = gpt_helper.get_embeddings(item["paragraph"])
-        item["paragraph_score"] = calc_relatedness(query_embedding, paragraph_embedding)
-
-        # Process facts in parallel
-        with ThreadPoolExecutor() as executor:
-            item["facts"] = list(
-                executor.map(
-                    lambda fact: process_fact(fact, query_embedding), item["facts"]
-                )
-            )
-
-        return item
-    except Exception as e:
-        console.print("[bold red]Error: Failed to process item.[/bold red]")
-        LOGGER.error(e)
-        return None
-
-
 @log_execution_time
 def calculate_scores(query, data):
     try:
-        query_embedding = gpt_helper.get_embeddings(query)
-
-        with ThreadPoolExecutor() as executor:
-            results = list(
-                executor.map(
-                    lambda item: process_item(item, query_embedding),
-                    data,
-                )
-            )
+        texts = [query]
+        for item in data:
+            texts.append(item["paragraph"])
+            texts.extend(fact["fact_content"] for fact in item["facts"])
+
+        embeddings = gpt_helper.get_embeddings_batch(texts)
+        scores = cosine_similarities(embeddings[0], embeddings[1:])
+
+        score_index = 0
+        for item in data:
+            item["paragraph_score"] = float(scores[score_index])
+            score_index += 1
+            for fact in item["facts"]:
+                fact["fact_score"] = float(scores[score_index])
+                score_index += 1
 
-        return results
+        return data
     except Exception as e:
         console.print("[bold red]Error: Failed to calculate scores.[/bold red]")
         LOGGER.error(e)
@@ -198,23 +154,15 @@ def calculate_scores(query, data):
 
 @log_execution_time
 def relatedness(query, paragraphs: List[DataFactWithMetaData]):
-    query_embedding = gpt_helper.get_embeddings(query)
-
-    def process_paragraph(para):
-        relatedness_score = calculate_relatedness(query_embedding, para["paragraph"])
-        if relatedness_score > 0.3:
-            return DataFactWithRelatedness(
-                **para,
-                relatedness_score=relatedness_score,
-            )
-        return None
-
-    with ThreadPoolExecutor() as executor:
-        # Process paragraphs in parallel and collect results
-        results = list(executor.map(process_paragraph, paragraphs))
-
-    # Filter out None values and sort
-    para_with_relatedness = [result for result in results if result is not None]
+    texts = [query] + [para["paragraph"] for para in paragraphs]
+    embeddings = gpt_helper.get_embeddings_batch(texts)
+    scores = cosine_similarities(embeddings[0], embeddings[1:])
+
+    para_with_relatedness = [
+        DataFactWithRelatedness(**para, relatedness_score=float(relatedness_score))
+        for para, relatedness_score in zip(paragraphs, scores)
+        if relatedness_score > 0.3
+    ]
     sorted_data_facts = sorted(
         para_with_relatedness, key=lambda x: x.relatedness_score, reverse=True
     )
@@ -379,17 +327,13 @@ def vis_recommender(paragraphs):
         }
     """
 
-    user_prompt = f"""
-    ####
-    {paragraphs}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", paragraphs))
     console.print("[bold yellow]Recommending Visualization...[/bold yellow]")
     story = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=ArticleVisRecommendation
     )
     console.print("[bold green]Recommending Visualization Completed![/bold green]")
-    return json.loads(story)
+    return load_json_answer(story, "Vis recommender")
 
 
 @log_execution_time
@@ -430,17 +374,13 @@ def vis_criticizer(paragraphs):
 
         """
 
-    user_prompt = f"""
-        ####
-        {paragraphs}
-        ####
-        """
+    user_prompt = build_user_prompt(("####", paragraphs))
     console.print("[bold yellow]Criticizing Recommendation...[/bold yellow]")
     feedback = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=ArticleVisRecommendationFeedback
     )
     console.print("[bold green]Criticizing Recommendation Completed![/bold green]")
-    return json.loads(feedback)
+    return load_json_answer(feedback, "Vis criticizer")
 
 
 @log_execution_time
@@ -473,17 +413,13 @@ def vis_refiner(paragraphs):
 
     """
 
-    user_prompt = f"""
-    ####
-    {paragraphs}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", paragraphs))
     console.print("[bold yellow]Refining Recommendation...[/bold yellow]")
     vis_refined = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=ArticleVisRecommendation
     )
     console.print("[bold green]Refining Recommendation Completed![/bold green]")
-    return json.loads(vis_refined)
+    return load_json_answer(vis_refined, "Vis refiner")
 
 
 @log_execution_time
@@ -516,38 +452,28 @@ def create_narrtive(paragraphs):
         ****
     """
 
-    user_prompt = f"""
-        #### 
-        {paragraphs}
-        ####
-
-    """
+    user_prompt = build_user_prompt(("####", paragraphs))
 
     console.print("[bold yellow]Creating Narrative...[/bold yellow]")
     vis_refined = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=ArticleVisRecommendation
     )
     console.print("[bold green]Creating Narrative Completed![/bold green]")
-    return json.loads(vis_refined)
+    return load_json_answer(vis_refined, "Create narrative")
 
 
 @log_execution_time
 def organize_cluster_story(cluster_wise_facts):
     system_prompt = PROMPTS["ORGANIZE_CLUSTER_FACTS"]
 
-    user_prompt = f"""
-        #### 
-        {cluster_wise_facts}
-        ####
-
-    """
+    user_prompt = build_user_prompt(("####", cluster_wise_facts))
 
     console.print("[bold yellow]Organizing Facts...[/bold yellow]")
     vis_refined = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=ClusterNarrative
     )
     console.print("[bold green]Organizing Facts Completed![/bold green]")
-    return json.loads(vis_refined)
+    return load_json_answer(vis_refined, "Organize cluster story")
 
 
 @log_execution_time
@@ -561,91 +487,65 @@ def cluster_topics(paragraphs):
        Make sure number of topics is less than 10.
     """
 
-    user_prompt = f"""
-    
-    **** 
-    {paragraphs}
-    **** 
-    
-    """
+    user_prompt = build_user_prompt(("****", paragraphs))
     console.print("[bold yellow]Clustering...[/bold yellow]")
     topics = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=Clusters
     )
     console.print("[bold green]Clustering completed![/bold green]")
 
-    return json.loads(topics)
+    return load_json_answer(topics, "Cluster topics")
 
 
 @log_execution_time
 def cluster_detail_generation(cluster, search_query):
     system_prompt = PROMPTS["CLUSTER_DETAIL_GENERATION"]
 
-    user_prompt = f"""
-    
-    ####
-    {cluster}
-    ####
-    
-    **** 
-    {search_query}
-    **** 
-    """
+    user_prompt = build_user_prompt(
+        ("****", search_query),
+        ("####", cluster),
+    )
     console.print("[bold yellow]Creating Detail Cluster...[/bold yellow]")
     topics = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=DetailCluster
     )
     console.print("[bold green]Creating Detail Cluster Completed![/bold green]")
 
-    return json.loads(topics)
+    return load_json_answer(topics, "Cluster detail generation")
 
 
 @log_execution_time
 def refine_cluster_detail(cluster, search_query):
     system_prompt = PROMPTS["REFINE_CLUSTER_DETAIL"]
 
-    user_prompt = f"""
-    
-    ####
-    {cluster}
-    ####
-    
-    ****
-    {search_query}
-    ****
-    
-    """
+    user_prompt = build_user_prompt(
+        ("****", search_query),
+        ("####", cluster),
+    )
     console.print("[bold yellow]Refining Detail Cluster...[/bold yellow]")
     topics = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=DetailClusters
     )
     console.print("[bold green]Refining Detail Cluster Completed![/bold green]")
 
-    return json.loads(topics)
+    return load_json_answer(topics, "Refine cluster detail")
 
 
 @log_execution_time
 def clickbait_generation(cluster, search_query):
     system_prompt = PROMPTS["CLICKBAIT_GENERATION"]
 
-    user_prompt = f"""
-    
-    #### 
-    {cluster}
-    #### 
-    
-    ****
-    {search_query}
-    ****
-    
-    """
+    user_prompt = build_user_prompt(
+        ("****", search_query),
+        ("####", cluster),
+    )
     console.print("[bold yellow]Creating Clickbait...[/bold yellow]")
     topics = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=ClusterClickbait
     )
     console.print("[bold green]Creating Clickbait Completed![/bold green]")
 
-    return json.loads(topics)
+    return load_json_answer(topics, "Clickbait generation")
 
 
 def organize_data_by_topic(input_data):
@@ -699,7 +599,10 @@ def remove_same_facts(cluster):
             "fact_count": len(group),
             "article_count": len(set(fact["fact_id"].split("_")[0] for fact in group)),
             "fact_ids": [fact["fact_id"] for fact in group],
-            "article_ids": list(set(fact["fact_id"].split("_")[0] for fact in group)),
+            # Sorted, as set order changes from process to process
+            "article_ids": sorted(
+                set(fact["fact_id"].split("_")[0] for fact in group), key=int
+            ),
         }
         for index, group in enumerate(fact_groups)
     ]
@@ -742,11 +645,7 @@ def structure_fact_groups(fact_groups, results):
 def identify_similar_facts(facts):
     system_prompt = PROMPTS["IDENTIFY_SIMILAR_FACTS"]
 
-    user_prompt = f"""
-    ####
-    {facts}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", facts))
 
     console.print("[bold yellow]Identifying Similar Facts...[/bold yellow]")
     similar_facts = gpt_helper.ask_gpt_with_response_format(
@@ -774,11 +673,7 @@ def assign_id(merged_facts):
 def merge_facts(facts):
     system_prompt = PROMPTS["MERGE_FACTS"]
 
-    user_prompt = f"""
-    ####
-    {facts}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", facts))
 
     console.print("[bold yellow]Merging Facts...[/bold yellow]")
     merged_facts = gpt_helper.ask_gpt_with_response_format(
@@ -788,7 +683,7 @@ def merge_facts(facts):
         temperature=0.2,
         top_p=0.1,
     )
-    merged_facts = assign_id(json.loads(merged_facts))
+    merged_facts = assign_id(load_json_answer(merged_facts, "Merge facts"))
 
     console.print("[bold green]Merging Facts Completed![/bold green]")
     return merged_facts
@@ -798,35 +693,27 @@ def merge_facts(facts):
 def validate_merged_facts(facts):
     system_prompt = PROMPTS["VALIDATE_MERGED_FACTS"]
 
-    user_prompt = f"""
-    ####
-    {facts}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", facts))
 
     console.print("[bold yellow]Checking Merged Facts...[/bold yellow]")
     errors = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=Errors
     )
     console.print("[bold green]Checking Merged Facts Completed![/bold green]")
-    return json.loads(errors)
+    return load_json_answer(errors, "Validate merged facts")
 
 
 @log_execution_time
 def correct_merged_facts(facts):
     system_prompt = PROMPTS["CORRECT_MERGED_FACTS"]
 
-    user_prompt = f"""
-    ####
-    {facts}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", facts))
 
     console.print("[bold yellow]Correcting merged facts...[/bold yellow]")
     merged_facts = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=MergedFacts
     )
-    merged_facts = assign_id(json.loads(merged_facts))
+    merged_facts = assign_id(load_json_answer(merged_facts, "Correct merged facts"))
     console.print("[bold green]Correcting merged facts Completed![/bold green]")
     return merged_facts
 
@@ -835,17 +722,13 @@ def correct_merged_facts(facts):
 def refine_merged_facts(facts):
     system_prompt = PROMPTS["REFINE_MERGED_FACTS"]
 
-    user_prompt = f"""
-    ####
-    {facts}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", facts))
 
     console.print("[bold yellow]Correcting Merged Facts...[/bold yellow]")
     merged_facts = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=MergedFacts
     )
-    merged_facts = assign_id(json.loads(merged_facts))
+    merged_facts = assign_id(load_json_answer(merged_facts, "Refine merged facts"))
     console.print("[bold green]Correcting Merged Facts Completed![/bold green]")
     return merged_facts
 
@@ -854,11 +737,7 @@ def refine_merged_facts(facts):
 def get_entities_in_merged_facts(merged_fact):
     system_prompt = PROMPTS["IDENTIFY_ENTITIES_IN__MERGED_FACTS"]
 
-    user_prompt = f"""
-    ####
-    {merged_fact}
-    ####
-    """
+    user_prompt = build_user_prompt(("####", merged_fact))
 
     console.print("[bold yellow]Identify Subjects In Merged Facts...[/bold yellow]")
     fact_entities = gpt_helper.ask_gpt_with_response_format(
@@ -867,29 +746,24 @@ def get_entities_in_merged_facts(merged_fact):
     console.print(
         "[bold green]Identify Subjects In Merged Facts Completed![/bold green]"
     )
-    return json.loads(fact_entities)
+    return load_json_answer(fact_entities, "Get entities in merged facts")
 
 
 @log_execution_time
 def fill_missing_entities(fact, article):
     system_prompt = PROMPTS["FILL_MISSING_ENTITIES"]
 
-    user_prompt = f"""
-    ####
-    {fact}
-    ####
-    
-    ****
-    {article}
-    **** 
-    """
+    user_prompt = build_user_prompt(
+        ("****", article),
+        ("####", fact),
+    )
 
     console.print("[bold yellow]Fill Missing Entities...[/bold yellow]")
     fact_entities = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=FactGroupWithMissingEntity
     )
     console.print("[bold green]Fill Missing Entities Completed![/bold green]")
-    return json.loads(fact_entities)
+    return load_json_answer(fact_entities, "Fill missing entities")
 
 
 @log_execution_time
@@ -898,23 +772,17 @@ def handle_filling_data(cluster_missing_entities, articles):
         article_id = fact_group["article_ids"][0]
         return fill_missing_entities(fact_group, articles[int(article_id)])
 
-    def process_merged_fact(merged_fact):
-        with ThreadPoolExecutor() as executor:
-            merged_fact["facts"] = list(
-                executor.map(process_fact_group, merged_fact["facts"])
-            )
-        return merged_fact
-
-    def process_cluster(cluster):
-        with ThreadPoolExecutor() as executor:
-            cluster["merged_facts"] = list(
-                executor.map(process_merged_fact, cluster["merged_facts"])
-            )
-        return cluster
-
-    with ThreadPoolExecutor() as executor:
-        cluster_missing_entities = list(
-            executor.map(process_cluster, cluster_missing_entities)
-        )
+    # One flat batch of fact groups across every cluster and merged fact
+    merged_facts = [
+        merged_fact
+        for cluster in cluster_missing_entities
+        for merged_fact in cluster["merged_facts"]
+    ]
+    fact_groups = [
+        fact_group for merged_fact in merged_facts for fact_group in merged_fact["facts"]
+    ]
+    filled = iter(get_work_scheduler().map(process_fact_group, fact_groups))
+    for merged_fact in merged_facts:
+        merged_fact["facts"] = [next(filled) for _ in merged_fact["facts"]]
 
     return cluster_missing_entities
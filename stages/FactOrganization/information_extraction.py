@@ -1,19 +1,33 @@
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from functools import lru_cache
 
-import spacy
+from common.config import MODEL_CONFIG
+from common.scheduler import get_work_scheduler
 
-nlp = spacy.load("en_core_web_trf")
+_nlp_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _load_nlp():
+    import spacy
+
+    return spacy.load(MODEL_CONFIG["SPACY_MODEL"])
+
+
+def get_nlp():
+    """Load the spaCy pipeline on first use; it takes seconds and gigabytes"""
+    # lru_cache alone lets warm-up and a resumed job load it at the same time
+    with _nlp_lock:
+        return _load_nlp()
 
 
 def extract_entity_labels(text):
-    doc = nlp(text)
+    doc = get_nlp()(text)
     return {ent.label_ for ent in doc.ents}
 
 
 def preprocess_sentences(sentences):
-    with ThreadPoolExecutor() as executor:
-        results = list(executor.map(extract_entity_labels, sentences))
-    return results
+    return get_work_scheduler().map(extract_entity_labels, sentences, kind="cpu")
 
 
 def find_missing_labels(all_entity_labels):
@@ -21,23 +35,26 @@ def find_missing_labels(all_entity_labels):
     return [list(unique_labels - labels) for labels in all_entity_labels]
 
 
-def process_merged_fact(merged_fact):
-    try:
-        sentences = [fact["fact_group_content"] for fact in merged_fact["facts"]]
-        all_entity_labels = preprocess_sentences(sentences)
+def get_missing_entities(merged_fact_clusters):
+    # Every sentence of every cluster goes through the NER model in one batch
+    merged_facts = []
+    sentences = []
+    for cluster in merged_fact_clusters:
+        for merged_fact in cluster["merged_facts"]:
+            try:
+                merged_sentences = [
+                    fact["fact_group_content"] for fact in merged_fact["facts"]
+                ]
+            except Exception as e:
+                print(e)
+                continue
+            merged_facts.append(merged_fact)
+            sentences.extend(merged_sentences)
+
+    entity_labels = iter(preprocess_sentences(sentences))
+    for merged_fact in merged_facts:
+        all_entity_labels = [next(entity_labels) for _ in merged_fact["facts"]]
         missing_entities = find_missing_labels(all_entity_labels)
-
         for fact, missing in zip(merged_fact["facts"], missing_entities):
             fact["missing_entities"] = missing
-    except Exception as e:
-        print(e)
-    return merged_fact
-
-
-def get_missing_entities(merged_fact_clusters):
-    with ThreadPoolExecutor() as executor:
-        for cluster in merged_fact_clusters:
-            cluster["merged_facts"] = list(
-                executor.map(process_merged_fact, cluster["merged_facts"])
-            )
     return merged_fact_clusters
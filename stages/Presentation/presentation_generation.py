@@ -4,16 +4,16 @@ import os
 import re
 import webbrowser
 from collections import Counter, defaultdict
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from bs4 import BeautifulSoup
 from common.config import DATE_CONFIGS, PROMPTS, TEMPLATE_CONFIGS, THEME_CONFIGS
 from common.gpt_helper import GPTHelper
-from common.utils import console, convert_date
+from common.llm_policy import load_json_answer
+from common.prompt_builder import build_user_prompt
+from common.utils import console, convert_date, cosine_similarities
 from common.utils.timing_logger import LOGGER, log_execution_time
 from models.models import Overview, StoryLine, StyledNarrative
-from scipy import spatial
 
 gpt_helper = GPTHelper()
 
@@ -22,11 +22,7 @@ gpt_helper = GPTHelper()
 def style_narrative(fact):
     system_prompt = PROMPTS["STYLE_NARRATIVE"]
 
-    user_prompt = f"""
-        #### 
-        {fact}
-        ####
-    """
+    user_prompt = build_user_prompt(("####", fact))
 
     console.print("[bold yellow]Styling Narrative...[/bold yellow]")
     styled_narrative = gpt_helper.ask_gpt_with_response_format(
@@ -46,11 +42,7 @@ def style_narrative(fact):
 def refine_narrative(fact):
     system_prompt = PROMPTS["REFINE_NARRATIVE"]
 
-    user_prompt = f"""
-        #### 
-        {fact}
-        ####
-    """
+    user_prompt = build_user_prompt(("####", fact))
 
     console.print("[bold yellow]Styling Narrative...[/bold yellow]")
     styled_narrative = gpt_helper.ask_gpt_with_response_format(
@@ -80,19 +72,14 @@ def format_overview(summary):
                 </p>"
     """
 
-    user_prompt = f"""
-        #### 
-        {summary}
-        ####
-
-    """
+    user_prompt = build_user_prompt(("####", summary))
 
     console.print("[bold yellow]Formatting Overview...[/bold yellow]")
     vis_refined = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=Overview
     )
     console.print("[bold green]Formating Overview Completed![/bold green]")
-    return json.loads(vis_refined)
+    return load_json_answer(vis_refined, "Format overview")
 
 
 @log_execution_time
@@ -123,23 +110,17 @@ def create_storyline(paragraphs, search_query):
      
     """
 
-    user_prompt = f"""
-        #### 
-        {paragraphs}
-        ####
-        
-        ****
-        {search_query}
-        ****
-
-    """
+    user_prompt = build_user_prompt(
+        ("****", search_query),
+        ("####", paragraphs),
+    )
 
     console.print("[bold yellow]Creating Storyline...[/bold yellow]")
     vis_refined = gpt_helper.ask_gpt_with_response_format(
         system_prompt, user_prompt, response_format=StoryLine
     )
     console.print("[bold green]Creating Storyline Completed![/bold green]")
-    return json.loads(vis_refined)
+    return load_json_answer(vis_refined, "Create storyline")
 
 
 def find_shared_facts(clusters):
@@ -343,29 +324,18 @@ def get_article_frequencies_object(article_years):
     ]
 
 
-def calc_relatedness(query_embedding, item_embedding):
-    relatedness_fn = lambda x, y: 1 - spatial.distance.cosine(x, y)
-    return round(relatedness_fn(query_embedding, item_embedding), 2)
-
-
-def get_score(fact, query_embedding):
-    fact_embedding = gpt_helper.get_embeddings(fact["fact_content"])
-    fact["relatedness_score"] = calc_relatedness(query_embedding, fact_embedding)
-    return fact
-
-
 def get_relatedness_scores(all_original_facts, query):
+    if not all_original_facts:
+        return []
 
-    query_embedding = gpt_helper.get_embeddings(query)
+    texts = [query] + [fact["fact_content"] for fact in all_original_facts]
+    embeddings = gpt_helper.get_embeddings_batch(texts)
+    scores = cosine_similarities(embeddings[0], embeddings[1:])
 
-    with ThreadPoolExecutor() as executor:
-        facts = list(
-            executor.map(
-                lambda fact: get_score(fact, query_embedding), all_original_facts
-            )
-        )
+    for fact, score in zip(all_original_facts, scores):
+        fact["relatedness_score"] = round(float(score), 2)
 
-    return facts
+    return all_original_facts
 
 
 def new_analyze_data(
@@ -3,11 +3,11 @@ from collections import defaultdict
 from xml.dom import minidom  # For more reliable XML handling
 
 import numpy as np
-from scipy.interpolate import interp1d
-from wordcloud import STOPWORDS, WordCloud
 
 
 def get_radius(max_original_facts, value):
+    from scipy.interpolate import interp1d
+
     radius_scale = interp1d([1, max_original_facts], [40, 60], fill_value="extrapolate")
     return int(radius_scale(value))
 
@@ -135,6 +135,8 @@ def get_most_talked_facts(cluster):
 
 
 def generate_outer_wordcloud(cluster, max_riginal_facts, cluster_wise_fact):
+    from wordcloud import STOPWORDS, WordCloud
+
     text = ""
     for item in cluster_wise_fact["facts"]:
         text += item["fact_content"] + " "
@@ -204,6 +206,8 @@ def generate_outer_wordcloud(cluster, max_riginal_facts, cluster_wise_fact):
 
 
 def generate_inner_wordcloud(cluster, max_riginal_facts, cluster_wise_fact):
+    from wordcloud import STOPWORDS, WordCloud
+
     text = ""
     for item in cluster_wise_fact["facts"]:
         text += item["fact_content"] + " "
@@ -1,17 +1,21 @@
+import asyncio
 import itertools
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar
 
-import pandas as pd
+from common.config import PIPELINE_CONFIGS
+from common.pipeline import PipelineRunner, Stage
+from common.scheduler import get_work_scheduler
 from common.utils import chunk_array, console, merge_arrays, write_to_json
 from common.utils.timing_logger import LOGGER, log_execution_time
-from stages.ArticleCrawler import collect_search_results
+from crawler.article_store import ArticleStore
+from stages.ArticleCrawler import collect_search_results_async
 from stages.FactExtraction import (
-    extract_and_filter_paragraphs,
-    get_data_facts,
-    get_data_values,
-    refine_data,
-    validate_data_extraction,
+    extract_and_filter_paragraphs_async,
+    get_data_facts_async,
+    refine_data_async,
+    stream_data_values_async,
+    validate_data_extraction_async,
 )
 from stages.FactOrganization import (
     calculate_scores,
@@ -50,7 +54,8 @@ from stages.Presentation import (
     style_narrative,
 )
 
-threads = []
+# Set by callers that want stage progress, e.g. the job queue's event stream
+status_listener = ContextVar("status_listener", default=None)
 
 
 def check_fact_errors(data):
@@ -61,30 +66,30 @@ def check_fact_errors(data):
     return False
 
 
-def process_data_validation(id, title, extracted_data):
-    error_values = validate_data_extraction(id, title, extracted_data)
+async def process_data_validation_async(id, title, extracted_data):
+    error_values = await validate_data_extraction_async(id, title, extracted_data)
     return error_values["vis_data_error"]
 
 
-def process_refine_data(id, title, validation_errors):
-    refined_data = refine_data(id, title, validation_errors)
+async def process_refine_data_async(id, title, validation_errors):
+    refined_data = await refine_data_async(id, title, validation_errors)
     return refined_data["data_facts_with_vis_data"]
 
 
 # -------------- Start: Process Article  ----------
 @log_execution_time
-def process_article(
+async def process_article_async(
     id, title, date, link, article, search_query, file_path, iterations=1
 ):
-
+    """
+    Extract, validate and refine the data facts of one article, streaming the
+    data values into validation; all LLM calls share the process-wide limits
+    """
     folder_path = f"{file_path}/{id}"
-
-    title = title
-    date = date
     url = link
 
     print_status(f"{id}: Started paragraph extraction")
-    extracted_paragraphs = extract_and_filter_paragraphs(
+    extracted_paragraphs = await extract_and_filter_paragraphs_async(
         id, title, date, article, search_query
     )
     if not extracted_paragraphs or not extracted_paragraphs["paragraphs"]:
@@ -98,61 +103,39 @@ def process_article(
     write_to_json(extracted_paragraphs, folder_path, "1_extracted_paragraphs.json")
     print_status(f"{id}: Finished paragraph extraction")
 
-    # try:
-    #     with open(f"{folder_path}/1_extracted_paragraphs.json", "r") as file:
-    #         extracted_paragraphs = json.load(file)
-    # except Exception as e:
-    #     console.print(e)
-    #     return None
-
     print_status(f"{id}: Started fact data extraction")
-    data_facts_with_para = get_data_facts(id, title, extracted_paragraphs)
+    data_facts_with_para = await get_data_facts_async(id, title, extracted_paragraphs)
     if not data_facts_with_para or not data_facts_with_para["data_facts_with_para"]:
         return None
     write_to_json(data_facts_with_para, folder_path, "3_data_facts_with_para.json")
     print_status(f"{id}: Finished fact data extraction")
 
-    # try:
-    #     with open(f"{folder_path}/3_data_facts_with_para.json", "r") as file:
-    #         data_facts_with_para = json.load(file)
-    # except Exception as e:
-    #     console.print(
-    #         f"{folder_path}/3_data_facts_with_para.json file opening error", e
-    #     )
-    #     return None
-
+    # Each data fact is validated as soon as it has been streamed
     print_status(f"{id}: Started data value extraction")
-    data_fact_with_vis_data = get_data_values(
-        id, title, date, data_facts_with_para, article
-    )
-    if (
-        not data_fact_with_vis_data
-        or not data_fact_with_vis_data["data_facts_with_vis_data"]
-    ):
-        return None
-    write_to_json(
-        data_fact_with_vis_data, folder_path, "4_data_fact_with_vis_data.json"
-    )
-    print_status(f"{id}: Finished data value extraction")
-
-    # try:
-    #     with open(f"{folder_path}/4_data_fact_with_vis_data.json", "r") as file:
-    #         data_fact_with_vis_data = json.load(file)
-    # except Exception as e:
-    #     console.print(e)
-    #     return None
-
-    print_status(f"{id}: Started first data validation")
-    # validation_errors = validate_data_extraction(id, title, data_fact_with_vis_data)
-    with ThreadPoolExecutor() as executor:
-        validation_errors_nested = list(
-            executor.map(
-                process_data_validation,
-                itertools.repeat(id),
-                itertools.repeat(title),
-                data_fact_with_vis_data["data_facts_with_vis_data"],
+    items = []
+    validations = []
+    try:
+        async for item in stream_data_values_async(
+            id, title, date, data_facts_with_para, article
+        ):
+            items.append(item)
+            validations.append(
+                asyncio.create_task(process_data_validation_async(id, title, item))
             )
+        if not items:
+            return None
+        data_fact_with_vis_data = {"data_facts_with_vis_data": items}
+        write_to_json(
+            data_fact_with_vis_data, folder_path, "4_data_fact_with_vis_data.json"
         )
+        print_status(f"{id}: Finished data value extraction")
+
+        print_status(f"{id}: Started first data validation")
+        validation_errors_nested = await asyncio.gather(*validations)
+    finally:
+        # Validations left behind when the stream or a validation fails
+        for validation in validations:
+            validation.cancel()
 
     if not validation_errors_nested:
         return None
@@ -166,26 +149,15 @@ def process_article(
     write_to_json(validation_errors, folder_path, "5_validation_errors.json")
     print_status(f"{id}: Finished first data validation")
 
-    # try:
-    #     with open(f"{folder_path}/5_validation_errors.json", "r") as file:
-    #         validation_errors = json.load(file)
-    # except Exception as e:
-    #     console.print(e)
-    #     return None
-
     i = 0
     print_status(f"{id}: Started iterative validation")
     while i < iterations and validation_errors["has_error"]:
-        # refined_data = refine_data(id, title, validation_errors)
-        with ThreadPoolExecutor() as executor:
-            refined_data_nested = list(
-                executor.map(
-                    process_refine_data,
-                    itertools.repeat(id),
-                    itertools.repeat(title),
-                    validation_errors["vis_data_error"],
-                )
+        refined_data_nested = await asyncio.gather(
+            *(
+                process_refine_data_async(id, title, item)
+                for item in validation_errors["vis_data_error"]
             )
+        )
 
         all_refined_data = list(itertools.chain.from_iterable(refined_data_nested))
         refined_data = {
@@ -201,18 +173,12 @@ def process_article(
         )
 
         if iterations - i > 1:
-            # validation_errors = validate_data_extraction(
-            #     id, title, data_fact_with_vis_data
-            # )
-            with ThreadPoolExecutor() as executor:
-                validation_errors_nested = list(
-                    executor.map(
-                        process_data_validation,
-                        itertools.repeat(id),
-                        itertools.repeat(title),
-                        data_fact_with_vis_data["data_facts_with_vis_data"],
-                    )
+            validation_errors_nested = await asyncio.gather(
+                *(
+                    process_data_validation_async(id, title, item)
+                    for item in data_fact_with_vis_data["data_facts_with_vis_data"]
                 )
+            )
 
             if not validation_errors_nested:
                 return None
@@ -237,13 +203,6 @@ def process_article(
     )
     print_status(f"{id}: Finished iterative validation")
 
-    # try:
-    #     with open(f"{folder_path}/8_data_fact_with_vis_data_final.json", "r") as file:
-    #         data_fact_with_vis_data = json.load(file)
-    # except Exception as e:
-    #     console.print(e)
-    #     return None
-
     print_status(f"{id}: Started structuring data")
     structured_data = structure_paragraphs_with_meta_data(
         id, title, date, link, data_fact_with_vis_data
@@ -259,13 +218,13 @@ def process_article(
 # -------------- End: Process Article  ----------
 
 
-# Function to process each article in a thread
 @log_execution_time
-def process_article_thread(
-    id, title, date, link, article, search_query, results, file_path, iterations=1
+async def process_article_task(
+    id, title, date, link, article, search_query, file_path, iterations=1
 ):
+    """Process one article, logging and swallowing any error as a skipped article"""
     try:
-        data_with_meta = process_article(
+        data_with_meta = await process_article_async(
             id,
             title,
             date,
@@ -278,7 +237,35 @@ def process_article_thread(
 
         if not data_with_meta or not data_with_meta["data_facts_with_vis_data_meta"]:
             return None
+        return data_with_meta
+    except Exception as e:
+        LOGGER.error(f"Error processing article:{id}, {title}, {e}")
+        console.print(f"Error processing article:{id}, {title}, {e}")
+
 
+def merge_article_results(article_results, article_ids):
+    """
+    Combine per-article results into the lists used by the later stages.
+
+    Articles finish in whatever order their LLM calls do, so they are merged
+    in article id order, which is search rank order, to give the same facts
+    the same order on every run.
+
+    Args:
+        article_results (dict): Article id -> process_article_task result
+        article_ids (set): Ids still in the article store; results of
+            articles replaced by a better ranked near-duplicate are skipped
+    """
+    results = {
+        "facts_with_meta": [],
+        "all_paragraphs": [],
+        "all_facts": [],
+        "all_facts_with_vis_data": [],
+    }
+    for article_id in sorted(article_results):
+        data_with_meta = article_results[article_id]
+        if data_with_meta is None or article_id not in article_ids:
+            continue
         results["facts_with_meta"].extend(
             data_with_meta["data_facts_with_vis_data_meta"]
         )
@@ -287,22 +274,86 @@ def process_article_thread(
         results["all_facts_with_vis_data"].extend(
             data_with_meta["all_facts_with_vis_data"]
         )
+    return results
 
-        return results
-    except Exception as e:
-        LOGGER.error(f"Error processing article:{id}, {title}, {e}")
-        console.print(f"Error processing article:{id}, {title}, {e}")
+
+async def stream_article_processing(
+    search_query,
+    web,
+    page_count,
+    country_code,
+    article_store_path,
+    file_path,
+    iterations,
+):
+    """
+    Crawl and process articles concurrently.
+
+    Every new article is handed to the extraction workers through a bounded
+    queue as soon as it is crawled, so a slow page only delays itself. Page
+    fetches and articles in extraction draw from one shared budget, and a full
+    queue pauses crawling until the workers catch up.
+
+    Returns:
+        tuple: (ArticleStore, queries, {article id: process_article_task result})
+    """
+    budget = asyncio.Semaphore(PIPELINE_CONFIGS["MAX_ACTIVE_TASKS"])
+    queue = asyncio.Queue(maxsize=PIPELINE_CONFIGS["ARTICLE_QUEUE_SIZE"])
+    article_results = {}
+
+    async def enqueue_article(article_id, article):
+        await queue.put((article_id, article))
+
+    async def extraction_worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            article_id, article = item
+            async with budget:
+                article_results[article_id] = await process_article_task(
+                    article_id,
+                    article["title"],
+                    article["date"],
+                    article["link"],
+                    article["page_content"],
+                    search_query,
+                    file_path,
+                    iterations,
+                )
+
+    workers = [
+        asyncio.create_task(extraction_worker())
+        for _ in range(PIPELINE_CONFIGS["MAX_ACTIVE_TASKS"])
+    ]
+    try:
+        store, queries = await collect_search_results_async(
+            search_query,
+            web,
+            num_results=page_count,
+            store_path=article_store_path,
+            country_code=country_code,
+            on_article=enqueue_article,
+            request_limit=budget,
+        )
+    finally:
+        # Let the workers drain the queue, then stop them
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    return store, queries, article_results
 
 
 def run_clickbait_and_detail_generation(clusters, search_query):
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            (
-                executor.submit(clickbait_generation, cluster, search_query),
-                executor.submit(cluster_detail_generation, cluster, search_query),
-            )
-            for cluster in clusters
-        ]
+    scheduler = get_work_scheduler()
+    futures = [
+        (
+            scheduler.submit(clickbait_generation, cluster, search_query),
+            scheduler.submit(cluster_detail_generation, cluster, search_query),
+        )
+        for cluster in clusters
+    ]
+    scheduler.wait([future for pair in futures for future in pair])
 
     cluster_clickbait_list = []
     detail_cluster_list = []
@@ -316,6 +367,9 @@ def print_status(status):
     status_log = f"STATE:[bold yellow] {status} [/bold yellow]"
     LOGGER.info(status_log)
     console.print(status_log)
+    listener = status_listener.get()
+    if listener is not None:
+        listener(status)
 
 
 def process_similar_facts(cluster):
@@ -323,6 +377,8 @@ def process_similar_facts(cluster):
 
 
 def process_fact_narrative(fact):
+    # Copy so earlier stage outputs that share this dict are left untouched
+    fact = dict(fact)
     fact_narrative = {
         "narrative": fact["narrative"],
         "vis_recommendation": fact["merged_recommendation"],
@@ -336,6 +392,8 @@ def process_fact_narrative(fact):
 
 
 def process_refine_narrative(fact):
+    # Copy so earlier stage outputs that share this dict are left untouched
+    fact = dict(fact)
     fact_narrative = {
         "narrative": fact["narrative"],
         "vis_recommendation": fact["merged_recommendation"],
@@ -410,27 +468,17 @@ def process_organizing_story(cluster):
 def run_refine_detail_and_organize_story(
     detail_cluster_list, filtered_merged_clusters, search_query
 ):
-    with ThreadPoolExecutor() as executor:
-        refine_future = executor.submit(
-            refine_cluster_detail, detail_cluster_list, search_query
-        )
-        narrative_future = executor.submit(
-            lambda: list(
-                executor.map(process_organizing_story, filtered_merged_clusters)
-            )
-        )
-
-        refine_result = None
-        narrative_result = None
-
-        for future in as_completed([refine_future, narrative_future]):
-            if future == refine_future:
-                refine_result = future.result()
-                refine_result = refine_result["clusters"]
-            elif future == narrative_future:
-                narrative_result = future.result()
+    scheduler = get_work_scheduler()
+    refine_future = scheduler.submit(
+        refine_cluster_detail, detail_cluster_list, search_query
+    )
+    narrative_result = scheduler.map(
+        process_organizing_story, filtered_merged_clusters
+    )
+    scheduler.wait([refine_future])
+    refine_result = refine_future.result()["clusters"]
 
-        return refine_result, narrative_result
+    return refine_result, narrative_result
 
 
 def process_merged_fact_entity_recognition(merged_fact):
@@ -448,8 +496,9 @@ def process_wordcloud_generation(analysis, cluster_results):
     def get_wordcloud(cluster, cluster_wise_fact):
         return generate_wordcloud(cluster, max_riginal_facts, cluster_wise_fact)
 
-    with ThreadPoolExecutor() as executor:
-        new_clusters = list(executor.map(get_wordcloud, clusters, cluster_wise_facts))
+    new_clusters = get_work_scheduler().map(
+        get_wordcloud, clusters, cluster_wise_facts, kind="cpu"
+    )
 
     for new_cluster in new_clusters:
         cluster_id = new_cluster["cluster_id"]
@@ -460,23 +509,23 @@ def process_wordcloud_generation(analysis, cluster_results):
 
 
 def process_cluster_entity_recognition(merged_facts_data):
-    def process_cluster_merged_facts(cluster):
-        with ThreadPoolExecutor() as executor:
-            # Process merged facts within each cluster in parallel
-            processed_facts = list(
-                executor.map(
-                    process_merged_fact_entity_recognition, cluster["merged_facts"]
-                )
-            )
+    # Merged facts of all clusters are processed as one flat batch
+    processed_facts = iter(
+        get_work_scheduler().map(
+            process_merged_fact_entity_recognition,
+            [
+                merged_fact
+                for cluster in merged_facts_data
+                for merged_fact in cluster["merged_facts"]
+            ],
+        )
+    )
+    for cluster in merged_facts_data:
         # Replace the original merged facts with processed facts
-        cluster["merged_facts"] = processed_facts
-        return cluster
-
-    # Process each cluster's merged facts in parallel
-    with ThreadPoolExecutor() as executor:
-        results = list(executor.map(process_cluster_merged_facts, merged_facts_data))
-
-    return results
+        cluster["merged_facts"] = [
+            next(processed_facts) for _ in cluster["merged_facts"]
+        ]
+    return merged_facts_data
 
 
 def find_missing_fact_groups(fact_groups, merged_facts):
@@ -532,346 +581,395 @@ def combine_merged_results(original_clusters, missing_clusters):
 
 
 def process_fact_grouping(clusters):
-    with ThreadPoolExecutor() as executor:
-        fact_groups = list(
-            executor.map(process_similar_facts, clusters["cluster_wise_facts"])
-        )
-    return fact_groups
+    return get_work_scheduler().map(
+        process_similar_facts, clusters["cluster_wise_facts"]
+    )
 
 
 def process_merging_facts(cluster_data):
-    with ThreadPoolExecutor() as executor:
-        merged_facts = list(executor.map(process_merge_facts, cluster_data["clusters"]))
-    return merged_facts
+    return get_work_scheduler().map(process_merge_facts, cluster_data["clusters"])
 
 
 def refine_missing_entities(missing_entities_evaluated):
-    with ThreadPoolExecutor() as executor:
-        return list(
-            executor.map(process_refine_merged_facts, missing_entities_evaluated)
-        )
+    return get_work_scheduler().map(
+        process_refine_merged_facts, missing_entities_evaluated
+    )
 
 
 def run_merged_facts_validation(merged_facts):
-    with ThreadPoolExecutor() as executor:
-        return list(executor.map(process_validate_merged_facts, merged_facts))
+    return get_work_scheduler().map(process_validate_merged_facts, merged_facts)
 
 
 def run_correcting_merged_facts(validated_facts):
-    with ThreadPoolExecutor() as executor:
-        corrected_merged_facts = list(
-            executor.map(process_correct_merged_facts, validated_facts)
-        )
-    return corrected_merged_facts
+    return get_work_scheduler().map(process_correct_merged_facts, validated_facts)
 
 
 def run_refine_all_facts_in_order(all_facts_in_order):
-    with ThreadPoolExecutor() as executor:
-        return list(executor.map(process_refine_narrative, all_facts_in_order))
+    return get_work_scheduler().map(process_refine_narrative, all_facts_in_order)
 
 
-def add_meta_data(articles, data):
+# Article store column -> key added to each mapped article
+ARTICLE_META_COLUMNS = {
+    "title": "result_title",
+    "meta_description": "meta_description",
+    "favicon": "favicon",
+    "source": "source",
+    "domain": "domain",
+    "displayed_link": "displayed_link",
+    "snippet_highlighted_words": "snippet_highlighted_words",
+}
 
-    titles = data["Title"].values
-    meta_descriptions = data["Meta_Description"].values
-    favicons = data["Favicon"].values
-    sources = data["Source"].values
-    domains = data["Domain"].values
-    displayed_links = data["Displayed_Link"].values
-    snippet_highlighted_words = data["Snippet_Highlighted_Words"].values
 
+def add_meta_data(articles, columns):
     for article in articles:
-        article["result_title"] = titles[article["id"]]
-        article["meta_description"] = meta_descriptions[article["id"]]
-        article["favicon"] = favicons[article["id"]]
-        article["source"] = sources[article["id"]]
-        article["domain"] = domains[article["id"]]
-        article["displayed_link"] = displayed_links[article["id"]]
-        article["snippet_highlighted_words"] = snippet_highlighted_words[article["id"]]
+        for column, key in ARTICLE_META_COLUMNS.items():
+            article[key] = columns[column][int(article["id"])]
     return articles
 
 
-@log_execution_time
-def generate_story(
+def run_article_collection_stage(
     search_query,
-    web="pewresearch.org",
-    page_count=1,
-    iterations=1,
-    search_result_file="google_search_pew.csv",
-    output_path="story.html",
-    results_path="JsonOutputs",
-    country_code="sg",
+    web,
+    page_count,
+    country_code,
+    article_store_path,
+    results_path,
+    iterations,
 ):
-    try:
-        file_path = results_path
-
-        print_status("Started collecting search results")
-        collect_search_results(
-            search_query, web, num_results=page_count, csv_filename=search_result_file, country_code=country_code
+    store, queries, article_results = asyncio.run(
+        stream_article_processing(
+            search_query,
+            web,
+            page_count,
+            country_code,
+            article_store_path,
+            results_path,
+            iterations,
         )
-        print_status("Finished collecting search results")
-
-        df = pd.read_csv(search_result_file)
-        articles = df["Page_Content"].values
-        meta_descriptions = df["Meta_Description"].values
-        links = df["Link"].values
-        dates = df["Date"].values
-        titles = df["Title"].values
-        ids = df["id"].values
-        headings = df["Headings"].values
-
-        results = {
-            "facts_with_meta": [],
-            "all_paragraphs": [],
-            "all_facts": [],
-            "all_facts_with_vis_data": [],
+    )
+    with store:
+        return {
+            # The pages themselves stay in the article store
+            "articles": store.summary(),
+            "search_queries": queries["search_queries"],
+            "results": merge_article_results(article_results, store.ids()),
         }
 
-        print_status("Started running article processing threads")
-
-        @log_execution_time
-        def process_articles(id):
-            process_article_thread(
-                id,
-                titles[id],
-                dates[id],
-                links[id],
-                articles[id],
-                search_query,
-                results,
-                file_path,
-                iterations,
-            )
 
-        with ThreadPoolExecutor() as executor:
-            executor.map(process_articles, range(len(articles)))
-        write_to_json(results, file_path, "1_extracted_data.json")
-        print_status("Finished article processing threads")
-
-        with open(f"{file_path}/1_extracted_data.json", "r") as file:
-            results = json.load(file)
-
-        # # TODO: Remove calculation of relatedness scores
-        # # print_status("Started calculating relatedness scores")
-        # # relatedness_results = calculate_scores(search_query, results["all_facts_with_vis_data"])
-        # # write_to_json(relatedness_results, file_path, "1_2_relatedness_results.json")
-        # # results["all_facts_with_vis_data"] = relatedness_results
-        # # write_to_json(results, file_path, "1_3_results.json")
-        # # print_status("Finished calculating relatedness scores")
-        # # with open(f"{file_path}/1_3_results.json", "r") as file:
-        # #     results = json.load(file)
-
-        print_status("Started clustering facts")
-        clusters = cluster_facts(results["all_facts"], file_path)
-        write_to_json(clusters, file_path, "2_clusters.json")
-        print_status("Finished clustering facts")
-
-        with open(f"{file_path}/2_clusters.json", "r") as file:
-            clusters = json.load(file)
-
-        print_status("Started fact similarity check")
-        fact_groups = process_fact_grouping(clusters)
-        write_to_json(fact_groups, file_path, "3_fact_groups.json")
-        print_status("Finished fact similarity check")
-
-        with open(f"{file_path}/3_fact_groups.json", "r") as file:
-            fact_groups = json.load(file)
-
-        print_status("Started structuring fact groups")
-        cluster_data = structure_fact_groups(fact_groups, results)
-        write_to_json(cluster_data, file_path, "4_cluster_wise_fact_groups.json")
-        print_status("Finished structuring fact groups")
-
-        with open(f"{file_path}/4_cluster_wise_fact_groups.json", "r") as file:
-            cluster_data = json.load(file)
-
-        print_status("Started merging facts")
-        merged_facts = process_merging_facts(cluster_data)
-        write_to_json(merged_facts, file_path, "5_merged_facts.json")
-        print_status("Finished merging facts")
-
-        with open(f"{file_path}/5_merged_facts.json", "r") as file:
-            merged_facts = json.load(file)
-
-        # # # # # Finding missing facts make more errors
-        # # # # print_status("Started finding missing fact groups in merge")
-        # # # # missing_fact_groups_in_merge = find_missing_fact_groups(
-        # # # #     fact_groups, merged_facts
-        # # # # )
-        # # # # write_to_json(
-        # # # #     missing_fact_groups_in_merge, file_path, "missing_fact_groups_in_merge.json"
-        # # # # )
-        # # # # print_status("Finished finding missing fact groups in merge")
-
-        # # # # print_status("Started merging missing facts")
-        # # # # structured_missing_groups = structure_fact_groups(
-        # # # #     missing_fact_groups_in_merge, results
-        # # # # )
-        # # # # with ThreadPoolExecutor() as executor:
-        # # # #     missing_merged_facts = list(
-        # # # #         executor.map(process_merge_facts, structured_missing_groups["clusters"])
-        # # # #     )
-        # # # # write_to_json(missing_merged_facts, file_path, "missing_merged_facts.json")
-        # # # # print_status("Finished merging missing facts")
-
-        # # # # # with open(f"{file_path}/missing_merged_facts.json", "r") as file:
-        # # # # #     missing_merged_facts = json.load(file)
-
-        # # # # merge_facts = combine_merged_results(merged_facts, missing_merged_facts)
-        # # # # write_to_json(merge_facts, file_path, "merge_facts.json")
-
-        # # # # with open(f"{file_path}/merged_facts.json", "r") as file:
-        # # # #     merged_facts = json.load(file)
-
-        print_status("Started identifying missing entities")
-        missing_entities = get_missing_entities(merged_facts)
-        write_to_json(missing_entities, file_path, "6_missing_entities.json")
-        print_status("Finished identifying missing entities")
-
-        with open(f"{file_path}/6_missing_entities.json", "r") as file:
-            missing_entities = json.load(file)
-
-        print_status("Started filling missing entities")
-        filled_entities = handle_filling_data(missing_entities, articles)
-        write_to_json(filled_entities, file_path, "7_filled_entities.json")
-        print_status("Finished filling missing entities")
-
-        with open(f"{file_path}/7_filled_entities.json", "r") as file:
-            filled_entities = json.load(file)
-
-        print_status("Started identifying missing entities for filled data")
-        missing_entities_evaluated = get_missing_entities(filled_entities)
-        write_to_json(
-            missing_entities_evaluated, file_path, "8_missing_entities_after_fill.json"
-        )
-        print_status("Finished identifying missing entities for filled data")
+def run_clustering_stage(results, results_path):
+    return {"clusters": cluster_facts(results["all_facts"], results_path)}
 
-        with open(f"{file_path}/8_missing_entities_after_fill.json", "r") as file:
-            missing_entities_evaluated = json.load(file)
 
-        print_status("Started refining merged facts")
-        merged_facts = refine_missing_entities(missing_entities_evaluated)
-        write_to_json(merged_facts, file_path, "9_refined_merged_facts.json")
-        print_status("Finished refining merged facts")
+def run_fact_grouping_stage(clusters):
+    return {"fact_groups": process_fact_grouping(clusters)}
 
-        with open(f"{file_path}/9_refined_merged_facts.json", "r") as file:
-            merged_facts = json.load(file)
 
-        print_status("Started validating merged facts")
-        validated_facts = run_merged_facts_validation(merged_facts)
-        write_to_json(validated_facts, file_path, "10_validated_facts.json")
-        print_status("Finished validating merged facts")
+def run_fact_group_structuring_stage(fact_groups, results):
+    return {"cluster_data": structure_fact_groups(fact_groups, results)}
 
-        with open(f"{file_path}/10_validated_facts.json", "r") as file:
-            validated_facts = json.load(file)
 
-        print_status("Started correcting merged facts")
-        merged_facts = run_correcting_merged_facts(validated_facts)
-        write_to_json(merged_facts, file_path, "11_corrected_merged_facts.json")
-        print_status("Finished correcting merged facts")
+def run_merging_stage(cluster_data):
+    return {"merged_facts": process_merging_facts(cluster_data)}
 
-        with open(f"{file_path}/11_corrected_merged_facts.json", "r") as file:
-            merged_facts = json.load(file)
 
-        ###  For narrative generation
-        print_status("Started filtering merged clusters")
-        filtered_merged_clusters = get_merged_clusters(merged_facts)
-        write_to_json(
-            filtered_merged_clusters, file_path, "12_filtered_merged_clusters.json"
-        )
-        print_status("Finished filtering merged clusters")
+def run_missing_entities_stage(merged_facts):
+    return {"missing_entities": get_missing_entities(merged_facts)}
 
-        with open(f"{file_path}/12_filtered_merged_clusters.json", "r") as file:
-            filtered_merged_clusters = json.load(file)
 
-        print_status("Started detailing clusters and clickbait generation")
-        cluster_clickbait_list, detail_cluster_list = (
-            run_clickbait_and_detail_generation(
-                cluster_data["cluster_wise_facts"], search_query
-            )
-        )
-        write_to_json(
-            cluster_clickbait_list, file_path, "13_cluster_clickbait_list.json"
-        )
-        write_to_json(detail_cluster_list, file_path, "14_detail_cluster_list.json")
-        print_status("Finished detailing clusters")
+def run_filling_stage(missing_entities, articles):
+    with ArticleStore(articles["path"]) as store:
+        page_contents = store.column("page_content")
+    return {"filled_entities": handle_filling_data(missing_entities, page_contents)}
 
-        with open(f"{file_path}/14_detail_cluster_list.json", "r") as file:
-            detail_cluster_list = json.load(file)
 
-        print_status("Started refining detailed clusters and organizing story")
-        detail_cluster_list, cluster_narrative_list = (
-            run_refine_detail_and_organize_story(
-                detail_cluster_list, filtered_merged_clusters, search_query
-            )
-        )
-        write_to_json(
-            detail_cluster_list, file_path, "15_refined_detail_cluster_list.json"
-        )
-        write_to_json(
-            cluster_narrative_list, file_path, "16_cluster_narrative_list.json"
-        )
-        print_status("Finished refining detailed clusters and organizing story")
+def run_filled_missing_entities_stage(filled_entities):
+    return {"missing_entities_evaluated": get_missing_entities(filled_entities)}
 
-        with open(f"{file_path}/13_cluster_clickbait_list.json", "r") as file:
-            cluster_clickbait_list = json.load(file)
 
-        with open(f"{file_path}/15_refined_detail_cluster_list.json", "r") as file:
-            detail_cluster_list = json.load(file)
+def run_refining_stage(missing_entities_evaluated):
+    return {"refined_merged_facts": refine_missing_entities(missing_entities_evaluated)}
 
-        with open(f"{file_path}/16_cluster_narrative_list.json", "r") as file:
-            cluster_narrative_list = json.load(file)
 
-        print_status("Started analysing data")
-        analysis = new_analyze_data(
-            cluster_clickbait_list,
-            detail_cluster_list,
-            cluster_narrative_list,
-            cluster_data,
-            merged_facts,
-            results,
-            search_query,
-        )
-        with open(f"{file_path.rsplit("/", 1)[0]}/queries.json", "r") as file:
-            queries = json.load(file)
-        analysis["search_queries"] = queries["search_queries"]
-        write_to_json(analysis, file_path, "17_analysis.json")
-        print_status("Finished detailing clusters")
-
-        with open(f"{file_path}/17_analysis.json", "r") as file:
-            analysis = json.load(file)
-
-        print_status("Started narrative styling")
-        all_facts_in_order = analysis["all_merged_facts_in_order"]
-        with ThreadPoolExecutor() as executor:
-            all_facts_in_order = list(
-                executor.map(process_fact_narrative, all_facts_in_order)
-            )
-        analysis["all_merged_facts_in_order"] = all_facts_in_order
-        write_to_json(analysis, file_path, "18_styled_analysis.json")
+def run_validation_stage(refined_merged_facts):
+    return {"validated_facts": run_merged_facts_validation(refined_merged_facts)}
 
-        with open(f"{file_path}/18_styled_analysis.json", "r") as file:
-            analysis = json.load(file)
 
-        print_status("Started narrative styling")
-        all_facts_in_order = analysis["all_merged_facts_in_order"]
-        all_facts_in_order = run_refine_all_facts_in_order(all_facts_in_order)
-        analysis["all_merged_facts_in_order"] = all_facts_in_order
-        write_to_json(analysis, file_path, "19_refined_styled_analysis.json")
-        print_status("Finished narrative styling")
+def run_correction_stage(validated_facts):
+    return {"corrected_merged_facts": run_correcting_merged_facts(validated_facts)}
 
-        with open(f"{file_path}/19_refined_styled_analysis.json", "r") as file:
-            analysis = json.load(file)
 
-        print_status("Started adding article meta data")
-        analysis["all_mapped_articles"] = add_meta_data(
-            analysis["all_mapped_articles"], df
+def run_cluster_filtering_stage(corrected_merged_facts):
+    return {"filtered_merged_clusters": get_merged_clusters(corrected_merged_facts)}
+
+
+def run_clickbait_and_detail_stage(cluster_data, search_query):
+    cluster_clickbait_list, detail_cluster_list = run_clickbait_and_detail_generation(
+        cluster_data["cluster_wise_facts"], search_query
+    )
+    return {
+        "cluster_clickbait_list": cluster_clickbait_list,
+        "detail_cluster_list": detail_cluster_list,
+    }
+
+
+def run_story_organization_stage(
+    detail_cluster_list, filtered_merged_clusters, search_query
+):
+    refined_detail_cluster_list, cluster_narrative_list = (
+        run_refine_detail_and_organize_story(
+            detail_cluster_list, filtered_merged_clusters, search_query
         )
-        # analysis = process_wordcloud_generation(analysis, clusters)
-        write_to_json(analysis, file_path, "20_final_styled_analysis.json")
-        print_status("Finished adding article meta data")
+    )
+    return {
+        "refined_detail_cluster_list": refined_detail_cluster_list,
+        "cluster_narrative_list": cluster_narrative_list,
+    }
+
+
+def run_analysis_stage(
+    cluster_clickbait_list,
+    refined_detail_cluster_list,
+    cluster_narrative_list,
+    cluster_data,
+    corrected_merged_facts,
+    results,
+    search_query,
+    search_queries,
+):
+    analysis = new_analyze_data(
+        cluster_clickbait_list,
+        refined_detail_cluster_list,
+        cluster_narrative_list,
+        cluster_data,
+        corrected_merged_facts,
+        results,
+        search_query,
+    )
+    analysis["search_queries"] = search_queries
+    return {"analysis": analysis}
+
+
+def run_styling_stage(analysis):
+    all_facts_in_order = get_work_scheduler().map(
+        process_fact_narrative, analysis["all_merged_facts_in_order"]
+    )
+    return {
+        "styled_analysis": {**analysis, "all_merged_facts_in_order": all_facts_in_order}
+    }
+
+
+def run_narrative_refining_stage(styled_analysis):
+    all_facts_in_order = run_refine_all_facts_in_order(
+        styled_analysis["all_merged_facts_in_order"]
+    )
+    return {
+        "refined_styled_analysis": {
+            **styled_analysis,
+            "all_merged_facts_in_order": all_facts_in_order,
+        }
+    }
+
 
-        return analysis
+def run_meta_data_stage(refined_styled_analysis, articles):
+    analysis = dict(refined_styled_analysis)
+    with ArticleStore(articles["path"]) as store:
+        columns = store.columns(list(ARTICLE_META_COLUMNS))
+    analysis["all_mapped_articles"] = add_meta_data(
+        analysis["all_mapped_articles"], columns
+    )
+    # analysis = process_wordcloud_generation(analysis, clusters)
+    return {"final_analysis": analysis}
+
+
+STORY_STAGES = [
+    Stage(
+        "article_collection",
+        run_article_collection_stage,
+        [
+            "search_query",
+            "web",
+            "page_count",
+            "country_code",
+            "article_store_path",
+            "results_path",
+            "iterations",
+        ],
+        {
+            "articles": "0_articles.json",
+            "search_queries": "0_search_queries.json",
+            "results": "1_extracted_data.json",
+        },
+        label="collecting and processing articles",
+    ),
+    Stage(
+        "clustering",
+        run_clustering_stage,
+        ["results", "results_path"],
+        {"clusters": "2_clusters.json"},
+        label="clustering facts",
+    ),
+    Stage(
+        "fact_grouping",
+        run_fact_grouping_stage,
+        ["clusters"],
+        {"fact_groups": "3_fact_groups.json"},
+        label="fact similarity check",
+    ),
+    Stage(
+        "fact_group_structuring",
+        run_fact_group_structuring_stage,
+        ["fact_groups", "results"],
+        {"cluster_data": "4_cluster_wise_fact_groups.json"},
+        label="structuring fact groups",
+    ),
+    Stage(
+        "merging",
+        run_merging_stage,
+        ["cluster_data"],
+        {"merged_facts": "5_merged_facts.json"},
+        label="merging facts",
+    ),
+    Stage(
+        "missing_entities",
+        run_missing_entities_stage,
+        ["merged_facts"],
+        {"missing_entities": "6_missing_entities.json"},
+        label="identifying missing entities",
+    ),
+    Stage(
+        "filling",
+        run_filling_stage,
+        ["missing_entities", "articles"],
+        {"filled_entities": "7_filled_entities.json"},
+        label="filling missing entities",
+    ),
+    Stage(
+        "filled_missing_entities",
+        run_filled_missing_entities_stage,
+        ["filled_entities"],
+        {"missing_entities_evaluated": "8_missing_entities_after_fill.json"},
+        label="identifying missing entities for filled data",
+    ),
+    Stage(
+        "refining",
+        run_refining_stage,
+        ["missing_entities_evaluated"],
+        {"refined_merged_facts": "9_refined_merged_facts.json"},
+        label="refining merged facts",
+    ),
+    Stage(
+        "validation",
+        run_validation_stage,
+        ["refined_merged_facts"],
+        {"validated_facts": "10_validated_facts.json"},
+        label="validating merged facts",
+    ),
+    Stage(
+        "correction",
+        run_correction_stage,
+        ["validated_facts"],
+        {"corrected_merged_facts": "11_corrected_merged_facts.json"},
+        label="correcting merged facts",
+    ),
+    Stage(
+        "cluster_filtering",
+        run_cluster_filtering_stage,
+        ["corrected_merged_facts"],
+        {"filtered_merged_clusters": "12_filtered_merged_clusters.json"},
+        label="filtering merged clusters",
+    ),
+    Stage(
+        "clickbait_and_detail",
+        run_clickbait_and_detail_stage,
+        ["cluster_data", "search_query"],
+        {
+            "cluster_clickbait_list": "13_cluster_clickbait_list.json",
+            "detail_cluster_list": "14_detail_cluster_list.json",
+        },
+        label="detailing clusters and clickbait generation",
+    ),
+    Stage(
+        "story_organization",
+        run_story_organization_stage,
+        ["detail_cluster_list", "filtered_merged_clusters", "search_query"],
+        {
+            "refined_detail_cluster_list": "15_refined_detail_cluster_list.json",
+            "cluster_narrative_list": "16_cluster_narrative_list.json",
+        },
+        label="refining detailed clusters and organizing story",
+    ),
+    Stage(
+        "analysis",
+        run_analysis_stage,
+        [
+            "cluster_clickbait_list",
+            "refined_detail_cluster_list",
+            "cluster_narrative_list",
+            "cluster_data",
+            "corrected_merged_facts",
+            "results",
+            "search_query",
+            "search_queries",
+        ],
+        {"analysis": "17_analysis.json"},
+        label="analysing data",
+    ),
+    Stage(
+        "styling",
+        run_styling_stage,
+        ["analysis"],
+        {"styled_analysis": "18_styled_analysis.json"},
+        label="narrative styling",
+    ),
+    Stage(
+        "narrative_refining",
+        run_narrative_refining_stage,
+        ["styled_analysis"],
+        {"refined_styled_analysis": "19_refined_styled_analysis.json"},
+        label="narrative refining",
+    ),
+    Stage(
+        "meta_data",
+        run_meta_data_stage,
+        ["refined_styled_analysis", "articles"],
+        {"final_analysis": "20_final_styled_analysis.json"},
+        label="adding article meta data",
+    ),
+]
+
+
+@log_execution_time
+def generate_story(
+    search_query,
+    web="pewresearch.org",
+    page_count=1,
+    iterations=1,
+    article_store_path="articles.sqlite3",
+    output_path="story.html",
+    results_path="JsonOutputs",
+    country_code="sg",
+):
+    """
+    Run the story pipeline, resuming from checkpoints already in results_path.
+
+    Stages whose inputs are unchanged since their last successful run are
+    skipped, so calling this again for the same run only executes the stages
+    that never finished.
+    """
+    try:
+        runner = PipelineRunner(STORY_STAGES, results_path, status=print_status)
+        context = runner.run(
+            {
+                "search_query": search_query,
+                "web": web,
+                "page_count": page_count,
+                "iterations": iterations,
+                "article_store_path": article_store_path,
+                "results_path": results_path,
+                "country_code": country_code,
+            }
+        )
+        return context["final_analysis"]
 
     except Exception as e:
         LOGGER.error(f"Error: {e}")
@@ -0,0 +1,63 @@
+import importlib
+import threading
+import time
+
+from common.utils.timing_logger import LOGGER
+from stages.FactOrganization.clustering import get_stopwords
+from stages.FactOrganization.dimension_reduction import warm_up_reducers
+from stages.FactOrganization.information_extraction import (
+    extract_entity_labels,
+    get_nlp,
+)
+
+# Imported lazily by the stages that use them
+HEAVY_MODULES = (
+    "kneed",
+    "pandas",
+    "plotly.express",
+    "scipy.interpolate",
+    "scipy.stats",
+    "sklearn.decomposition",
+    "sklearn.manifold",
+    "sklearn.metrics",
+    "sklearn.mixture",
+    "sklearn.pipeline",
+    "sklearn.preprocessing",
+    "umap",
+    "wordcloud",
+)
+
+_warm = threading.Event()
+
+
+def preload_models():
+    """
+    Import the heavy libraries and load the spaCy pipeline and NLTK stopwords
+    without running them
+    """
+    start_time = time.perf_counter()
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
+    get_nlp()
+    get_stopwords()
+    LOGGER.info(f"Preloaded models in {time.perf_counter() - start_time:.1f}s")
+
+
+def warm_up():
+    """
+    Load the models if needed and run each once, so the first story does not
+    pay for loading or JIT compilation. Runs in every worker process.
+    """
+    start_time = time.perf_counter()
+    try:
+        preload_models()
+        extract_entity_labels("Warm-up sentence from London on Monday.")
+    except Exception as e:
+        LOGGER.warning(f"Model warm-up failed: {e}")
+    warm_up_reducers()
+    _warm.set()
+    LOGGER.info(f"Warm-up finished in {time.perf_counter() - start_time:.1f}s")
+
+
+def is_warm():
+    return _warm.is_set()